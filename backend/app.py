@@ -2,17 +2,30 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_login import LoginManager
 from config import Config
-from models import db, User
+from database import init_db
 from auth import auth as auth_bp
 from routes import api as api_bp
+from worker import ValidationPool
+from probe_executor import ProbeExecutor
+from commands import register_commands
+from blob_gc import start_gc_thread
+from metrics import Metrics
+from profiler import RequestProfiler
+from derivatives import Derivatives
+import form_cache
+import user_cache
+import probe_cache
 import os
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if app.config['DOWNLOAD_ACCEL_MODE'] == 'x-sendfile':
+        # Flask's send_file emits X-Sendfile instead of the body
+        app.config['USE_X_SENDFILE'] = True
 
-    # Initialize extensions
-    db.init_app(app)
+    # Initialize extensions; the schema is migrated to the latest revision
+    init_db(app)
     login = LoginManager(app)
     # login.login_view = 'auth.signin' # Removed to prevent redirect
     
@@ -26,10 +39,17 @@ def create_app(config_class=Config):
     # Register Blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(api_bp)
+    register_commands(app)
+    Metrics(app)
+    RequestProfiler(app)
+    # In-process caches, sized from the config
+    form_cache.init_app(app)
+    user_cache.init_app(app)
+    probe_cache.init_app(app)
 
     @login.user_loader
     def load_user(id):
-        user = User.query.get(id)
+        user = user_cache.load(id)
         if user and user.is_deleted:
             return None
         return user
@@ -38,13 +58,17 @@ def create_app(config_class=Config):
     def unauthorized():
         return jsonify({'error': 'Unauthorized'}), 401
 
-    # Create DB tables if they don't exist
     with app.app_context():
-        db.create_all()
         # Ensure upload folder exists
         if not os.path.exists(app.config['UPLOAD_FOLDER']):
             os.makedirs(app.config['UPLOAD_FOLDER'])
 
+    # Validate uploads in the background; pick up anything a previous run left unfinished
+    ProbeExecutor(app)
+    Derivatives(app)
+    ValidationPool(app).recover()
+    start_gc_thread(app)
+
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+import io
+import os
+import zipfile
+from storage import DEFAULT_BUFFER_SIZE
+
+# Formats that are already compressed; deflating them wastes CPU for ~0% gain
+_STORED_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+_STORED_MIME_TYPES = {
+    'application/zip', 'application/gzip', 'application/x-7z-compressed',
+    'application/x-rar-compressed', 'application/pdf',
+}
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only sink for ZipFile. It can tell() but not seek(), so zipfile
+    writes each entry's sizes in a trailing data descriptor instead of going
+    back to patch the header. Written bytes are collected until drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(filename, used):
+    """
+    Returns filename, or 'name (n).ext' if it is already in `used` (compared
+    case-insensitively, since archives are often extracted on Windows/macOS).
+    Adds the result to `used`.
+    """
+    base, ext = os.path.splitext(filename or 'file')
+    candidate = base + ext
+    n = 1
+    while candidate.lower() in used:
+        candidate = f'{base} ({n}){ext}'
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def compression_for(mime_type):
+    mime_type = mime_type or ''
+    if mime_type.startswith(_STORED_MIME_PREFIXES) or mime_type in _STORED_MIME_TYPES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Generates a ZIP archive as a stream of byte chunks.
+
+    `entries` yields (arcname, path, mime_type, date_time) tuples and is
+    consumed lazily. Files are read in `buffer_size` blocks, so memory use does
+    not depend on the archive size. ZIP64 records are written automatically for
+    entries or archives over 4GB. Entries whose file is missing are skipped and
+    listed in MISSING_FILES.txt at the end of the archive.
+    """
+    sink = _StreamBuffer()
+    missing = []
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as zf:
+        for arcname, path, mime_type, date_time in entries:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                missing.append(arcname)
+                continue
+
+            info = zipfile.ZipInfo(arcname, date_time=date_time.timetuple()[:6])
+            info.compress_type = compression_for(mime_type)
+            # Known up front so zipfile decides on ZIP64 before writing the header
+            info.file_size = size
+            with open(path, 'rb') as src, zf.open(info, mode='w') as dest:
+                while True:
+                    block = src.read(buffer_size)
+                    if not block:
+                        break
+                    dest.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # Data descriptor written when the entry closes
+            yield sink.drain()
+
+        if missing:
+            zf.writestr('MISSING_FILES.txt', 'These files were not found on the server:\n' + '\n'.join(missing) + '\n')
+    # Central directory
+    yield sink.drain()
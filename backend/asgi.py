@@ -0,0 +1,370 @@
+"""
+ASGI entry point. Serve with an ASGI server, for example:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+Direct uploads (POST /submit/<code>) are received on the event loop: body
+data is read without blocking and handed to a thread pool only to be parsed,
+hashed and written, so a slow client costs a socket and a buffer rather
+than a worker thread. Files sent with send_file (submission downloads) are
+read in the thread pool and written from the event loop. Every other
+request runs the Flask app in the thread pool as usual.
+"""
+import io
+import sys
+import asyncio
+import time
+import tempfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_content_range_header, parse_options_header
+from app import create_app
+from config import Config
+from routes import begin_direct_upload, upload_check, finish_direct_upload
+from upload_stream import MultipartUpload, UploadRefused
+import metrics
+
+# Request bodies for the Flask routes are buffered in memory up to this
+# size, then spilled to a temporary file
+_SPOOL_SIZE = 1024 * 1024
+
+# Response chunks waiting to be sent, per streamed response
+_QUEUE_DEPTH = 4
+
+
+class _File:
+    """
+    wsgi.file_wrapper that lets the server send the file from the event
+    loop instead of iterating it in a worker thread.
+    """
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def seekable(self):
+        return hasattr(self.filelike, 'seekable') and self.filelike.seekable()
+
+    def seek(self, *args):
+        self.filelike.seek(*args)
+
+    def tell(self):
+        return self.filelike.tell()
+
+    def __iter__(self):
+        return iter(lambda: self.filelike.read(self.block_size), b'')
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class AsyncPortal:
+    """
+    ASGI application wrapping the Flask app. See the module docstring.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.buffer_size = flask_app.config['UPLOAD_BUFFER_SIZE']
+        self.executor = ThreadPoolExecutor(flask_app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            rule, args = self._match(scope)
+            if rule is not None and rule.endpoint == 'api.submit_file' and scope['method'] == 'POST':
+                await self._direct_upload(scope, receive, send, rule.rule, args['code'])
+            else:
+                await self._flask_request(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _match(self, scope):
+        adapter = self.flask_app.url_map.bind('localhost')
+        try:
+            return adapter.match(self._path_info(scope), scope['method'], return_rule=True)
+        except HTTPException:
+            # 404s, 405s and redirects are left to Flask
+            return None, {}
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- Direct uploads ---
+
+    async def _direct_upload(self, scope, receive, send, route, code):
+        # Flask's before_request hooks don't run here, so the request is
+        # recorded for /metrics explicitly
+        start = time.perf_counter()
+        environ = self._environ(scope, io.BytesIO())
+        form, response = await self._run(self._call, environ, lambda: begin_direct_upload(code))
+        if response is not None:
+            await self._send_response(send, response)
+            metrics.record_request('POST', route, response.status_code, time.perf_counter() - start)
+            return
+
+        config = self.flask_app.config
+        upload = MultipartUpload(
+            parse_options_header(environ['CONTENT_TYPE'])[1]['boundary'], config['UPLOAD_FOLDER'],
+            check=upload_check(form),
+            max_size=(form.constraints or {}).get('maxSizeBytes'),
+            shard_depth=config['STORAGE_SHARD_DEPTH'])
+        result = error = None
+        body_start = time.perf_counter()
+        try:
+            pending = []
+            pending_size = 0
+            total = 0
+            more = True
+            while more:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body = message.get('body', b'')
+                more = message.get('more_body', False)
+                total += len(body)
+                if config['MAX_CONTENT_LENGTH'] and total > config['MAX_CONTENT_LENGTH']:
+                    raise UploadRefused(413, 'Request body too large')
+                pending.append(body)
+                pending_size += len(body)
+                # Parsing, hashing and writing happen off the event loop, a
+                # buffer at a time; the next read waits until it is done
+                if pending_size >= self.buffer_size or not more:
+                    await self._run(upload.feed, b''.join(pending))
+                    pending.clear()
+                    pending_size = 0
+                    if upload.complete:
+                        break
+            if not upload.complete:
+                await self._run(upload.feed, b'')
+            result = await self._run(upload.commit)
+        except UploadRefused as e:
+            error = (e.status, e.message)
+        finally:
+            await self._run(upload.abort)
+        metrics.STAGE_DURATION.observe(time.perf_counter() - body_start, stage='upload_body')
+
+        _, response = await self._run(self._call, environ, lambda: (None, finish_direct_upload(form, result, error)))
+        await self._send_response(send, response)
+        metrics.record_request('POST', route, response.status_code, time.perf_counter() - start)
+
+    def _call(self, environ, fn):
+        """
+        Runs fn() in a Flask request context for the request. fn returns
+        (value, response value); a response value, or an HTTP error raised by
+        fn, becomes a Response with the app's after_request handling (CORS,
+        session cookie) applied. Returns (value, Response or None).
+        """
+        app = self.flask_app
+        with app.request_context(environ):
+            try:
+                try:
+                    value, rv = fn()
+                except Exception as e:
+                    value, rv = None, app.handle_user_exception(e)
+                return value, (app.finalize_request(rv) if rv is not None else None)
+            except Exception as e:
+                return None, app.handle_exception(e)
+
+    async def _send_response(self, send, response):
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': _encode_headers(response.headers.to_wsgi_list())})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    # --- Everything else ---
+
+    async def _flask_request(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        limit = self.flask_app.config['MAX_CONTENT_LENGTH']
+        size = 0
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit and size > limit:
+                body.close()
+                await self._send_simple(send, 413, b'Request body too large')
+                return
+            if size > _SPOOL_SIZE:
+                await self._run(body.write, chunk)
+            elif chunk:
+                body.write(chunk)
+            more = message.get('more_body', False)
+        body.seek(0)
+
+        environ = self._environ(scope, body)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(_QUEUE_DEPTH)
+        cancelled = False
+
+        def put(item):
+            if cancelled:
+                raise _Cancelled()
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def produce():
+            files = []
+            environ['wsgi.file_wrapper'] = lambda filelike, block_size=8192: files.append(_File(filelike, block_size)) or files[-1]
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started['status'] = int(status.split(' ', 1)[0])
+                started['headers'] = headers
+
+            app_iter = ()
+            handed_off = False
+            try:
+                app_iter = self.flask_app(environ, start_response)
+                headers = dict((k.lower(), v) for k, v in started['headers'])
+                if (files and environ['REQUEST_METHOD'] != 'HEAD' and started['status'] in (200, 206)
+                        and 'content-length' in headers):
+                    # send_file: the event loop sends the file (or byte range)
+                    content_range = parse_content_range_header(headers.get('content-range'))
+                    start = content_range.start if started['status'] == 206 and content_range else 0
+                    put(('file', started, files[-1], start, int(headers['content-length']), app_iter))
+                    handed_off = True
+                    return
+                put(('start', started))
+                for chunk in app_iter:
+                    if chunk:
+                        put(('body', chunk))
+                put(('end',))
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                put(('error', e))
+            finally:
+                if not handed_off and hasattr(app_iter, 'close'):
+                    app_iter.close()
+                body.close()
+
+        # One Context for the whole response, so generators that rely on
+        # context variables (stream_with_context) resume where they started
+        producer = loop.run_in_executor(self.executor, contextvars.copy_context().run, produce)
+        try:
+            while True:
+                item = await queue.get()
+                kind = item[0]
+                if kind == 'file':
+                    _, started, file, start, length, app_iter = item
+                    await send({'type': 'http.response.start', 'status': started['status'],
+                                'headers': _encode_headers(started['headers'])})
+                    try:
+                        await self._send_file(send, file.filelike, start, length, file.block_size)
+                    finally:
+                        await self._run(getattr(app_iter, 'close', file.close))
+                    break
+                if kind == 'start':
+                    await send({'type': 'http.response.start', 'status': item[1]['status'],
+                                'headers': _encode_headers(item[1]['headers'])})
+                elif kind == 'body':
+                    await send({'type': 'http.response.body', 'body': item[1], 'more_body': True})
+                elif kind == 'error':
+                    raise item[1]
+                else:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+        finally:
+            cancelled = True
+            while not producer.done():
+                # Unblock a producer waiting on a full queue
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({producer}, timeout=0.05)
+            await producer
+
+    async def _send_file(self, send, filelike, start, length, block_size):
+        block_size = max(block_size, self.buffer_size)
+        await self._run(filelike.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await self._run(filelike.read, min(block_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        if remaining > 0:
+            # The file shrank; end the response rather than hang the client
+            await send({'type': 'http.response.body', 'body': b''})
+
+    async def _send_simple(self, send, status, body):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # --- WSGI environ ---
+
+    @staticmethod
+    def _path_info(scope):
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        return path
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': self._path_info(scope).encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+            if key in environ:
+                # Cookies are joined with '; ', as browsers send them; other
+                # repeated headers with ','
+                value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+            environ[key] = value
+
+        return environ
+
+
+def _encode_headers(headers):
+    # The ASGI server adds its own Date header; the one werkzeug sets on
+    # conditional responses (send_file) would make two
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers if name.lower() != 'date']
+
+
+def create_asgi_app(config_class=Config):
+    return AsyncPortal(create_app(config_class))
+
+
+app = create_asgi_app()
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
+import user_cache
 import uuid
 
 auth = Blueprint('auth', __name__)
@@ -39,6 +40,7 @@ def signin():
 @auth.route('/auth/signout', methods=['POST'])
 @login_required
 def signout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     return '', 204
 
@@ -0,0 +1,474 @@
+"""
+Load and benchmark suite for the backend API.
+
+Boots the app with create_app against a temporary SQLite database (or the
+scratch database given with --database-uri) and a temporary upload folder,
+then drives it through the Flask test client from --concurrency threads:
+
+  submit_storm     unique uploads of the images, audio and video in testfiles/
+  dedup_resubmit   the same files submitted again and again, by upload and by preflight
+  download         full and ranged downloads of the stored submissions
+  list_pagination  first pages, filtered pages and a cursor walk over a form of --rows submissions
+  bulk_delete      deleting whole forms of --delete-rows submissions, and single submissions
+
+Rows for the listing and delete scenarios are inserted straight into the
+database, outside the measurements. Every operation reports p50/p95/p99
+latency, throughput and status codes, and every scenario its peak RSS,
+as JSON on stdout or in --output. Given --baseline (an earlier result
+file), the run exits with status 1 if any p95 latency or throughput is
+worse than the baseline by more than --tolerance.
+
+Validation runs inline, so without ffprobe on the PATH audio and video
+submissions are measured as rejected.
+
+Run from the backend folder:
+    python -m benchmarks.api_suite [--output results.json] [--baseline previous.json]
+    python -m benchmarks.api_suite --scenarios list_pagination --rows 200000
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from models import db, User, Submission, Blob, SubmissionQuota
+
+from .harness import (create_form, dispose, make_app, make_parser, percentile, run_threads, signin, signup,
+                      sqlite_uri, workdir)
+from .harness import submit as submit_file
+
+SCENARIOS = ('submit_storm', 'dedup_resubmit', 'download', 'list_pagination', 'bulk_delete')
+
+TESTFILES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'testfiles')
+
+# Rows per INSERT when seeding
+_SEED_BATCH = 5000
+
+
+# --- Measurement ---
+
+def reset_peak_rss():
+    """Linux lets a process reset its high-water mark; elsewhere the peak covers the whole run."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+class Recorder:
+    """
+    Latencies, status codes and bytes transferred per operation label.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.transferred = Counter()
+        self.lock = threading.Lock()
+
+    def time(self, label, client, call):
+        """
+        Runs call(client), which returns (response, bytes sent or received),
+        and records how long it took. Returns the response.
+        """
+        start = time.perf_counter()
+        response, size = call(client)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            self.statuses[label][response.status_code] += 1
+            self.transferred[label] += size
+        return response
+
+    def summary(self, wall):
+        operations = {}
+        for label, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            statuses = self.statuses[label]
+            operations[label] = {
+                'requests': len(ordered),
+                'errors': sum(count for status, count in statuses.items() if status >= 500),
+                'statusCodes': {str(status): count for status, count in sorted(statuses.items())},
+                'throughputPerSecond': round(len(ordered) / wall, 2) if wall else 0.0,
+                'bytesPerSecond': round(self.transferred[label] / wall) if wall else 0,
+                'latencyMs': {
+                    'p50': milliseconds(percentile(ordered, 0.50)),
+                    'p95': milliseconds(percentile(ordered, 0.95)),
+                    'p99': milliseconds(percentile(ordered, 0.99)),
+                    'mean': milliseconds(sum(ordered) / len(ordered)),
+                    'max': milliseconds(ordered[-1]),
+                },
+            }
+        return operations
+
+
+def run_load(recorder, clients, calls):
+    """
+    Runs the (label, call) pairs in `calls` on one thread per client, each
+    taking the next pair as soon as its previous request finishes.
+    Returns the wall time.
+    """
+    calls = iter(calls)
+    lock = threading.Lock()
+
+    def work(index):
+        while True:
+            with lock:
+                item = next(calls, None)
+            if item is None:
+                return
+            label, call = item
+            recorder.time(label, clients[index], call)
+
+    return run_threads(work, len(clients))
+
+
+# --- Requests ---
+
+def _keep(response, stored):
+    # Rejected submissions don't keep their file, so there's nothing to download
+    submission = (response.get_json(silent=True) or {}).get('submission')
+    if submission and submission.get('filePath'):
+        stored.append(submission['id'])
+
+
+def submit(code, filename, mime_type, payload, stored):
+    def call(client):
+        response = submit_file(client, code, payload, filename, mime_type)
+        _keep(response, stored)
+        return response, len(payload)
+    return call
+
+
+def preflight(code, filename, mime_type, payload, stored):
+    body = {'sha256': hashlib.sha256(payload).hexdigest(), 'sizeBytes': len(payload),
+            'filename': filename, 'mimeType': mime_type}
+
+    def call(client):
+        response = client.post(f'/submit/{code}/preflight', json=body)
+        _keep(response, stored)
+        return response, 0
+    return call
+
+
+def get(url, headers=None):
+    def call(client):
+        response = client.get(url, headers=headers)
+        size = len(response.get_data())
+        response.close()
+        return response, size
+    return call
+
+
+def delete(url):
+    def call(client):
+        return client.delete(url), 0
+    return call
+
+
+# --- Fixtures ---
+
+def load_testfiles(folder):
+    """
+    Returns [(kind, filename, mime_type, data)] for the files under
+    `folder`/images, audio and video.
+    """
+    files = []
+    for kind in ('images', 'audio', 'video'):
+        directory = os.path.join(folder, kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                data = f.read()
+            files.append((kind, name, mimetypes.guess_type(name)[0] or 'application/octet-stream', data))
+    if not files:
+        raise SystemExit(f'No test files found in {folder}')
+    return files
+
+
+def seed_form(app, form_id, rows, rng):
+    """
+    Inserts `rows` submissions into a form, with the blob and quota rows
+    that go with them. Returns the time taken.
+    """
+    start = time.perf_counter()
+    mime_types = ('image/jpeg', 'image/png', 'audio/wav', 'audio/ogg', 'video/mp4')
+    statuses = ('accepted', 'accepted', 'accepted', 'rejected', 'pending')
+    users = [str(uuid.uuid4()) for _ in range(max(1, rows // 50))]
+    blobs = [hashlib.sha256(uuid.uuid4().bytes).hexdigest() for _ in range(max(1, rows // 100))]
+    refcounts = Counter()
+    used = Counter()
+    submissions = []
+    created = datetime.utcnow() - timedelta(days=30)
+    for i in range(rows):
+        file_hash = blobs[i % len(blobs)]
+        user_id = users[i % len(users)]
+        status = rng.choice(statuses)
+        refcounts[file_hash] += 1
+        if status != 'rejected':
+            used[user_id] += 1
+        submissions.append({
+            'id': str(uuid.uuid4()), 'form_id': form_id, 'submitted_by': user_id, 'status': status,
+            'filename': f'seed-{i}.bin', 'file_path': file_hash, 'size_bytes': rng.randrange(1024, 50 * 1024 * 1024),
+            'mime_type': rng.choice(mime_types), 'created_at': created + timedelta(seconds=i * 30),
+        })
+
+    with app.app_context():
+        db.session.execute(db.insert(User), [{'id': u, 'username': u} for u in users])
+        db.session.execute(db.insert(Blob), [
+            {'hash': h, 'size_bytes': 0, 'mime_type': 'application/octet-stream', 'refcount': n}
+            for h, n in refcounts.items()])
+        for batch in range(0, rows, _SEED_BATCH):
+            db.session.execute(db.insert(Submission), submissions[batch:batch + _SEED_BATCH])
+        db.session.execute(db.insert(SubmissionQuota), [
+            {'form_id': form_id, 'user_id': u, 'used': n} for u, n in used.items()])
+        db.session.commit()
+    return time.perf_counter() - start
+
+
+class Suite:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.files = load_testfiles(args.testfiles)
+        self.owner = f'bench-owner-{self.run_id}'
+        owner = self.client(self.owner)
+        self.owner_clients = [owner] + [self.client(self.owner, new=False) for _ in range(args.concurrency - 1)]
+        self.submitters = [self.client(f'bench-{self.run_id}-{i}') for i in range(args.concurrency)]
+        self.form = self.create_form('Benchmark uploads')
+        self.stored = []
+        self.extra = {}
+
+    def client(self, username, new=True):
+        client = self.app.test_client()
+        if new:
+            signup(client, username)
+        else:
+            signin(client, username)
+        return client
+
+    def create_form(self, title):
+        return create_form(self.owner_clients[0], title)
+
+    # --- Scenarios ---
+
+    def submit_storm(self, recorder):
+        code = self.form['code']
+        calls = []
+        for i in range(self.args.submits):
+            kind, name, mime_type, data = self.rng.choice(self.files)
+            # Trailing bytes make every upload a new blob without breaking the formats
+            payload = data + f'\0bench-{self.run_id}-{i}'.encode()
+            calls.append((kind, submit(code, name, mime_type, payload, self.stored)))
+        return run_load(recorder, self.submitters, calls)
+
+    def dedup_resubmit(self, recorder):
+        code = self.form['code']
+        calls = []
+        for i in range(self.args.submits):
+            _, name, mime_type, data = self.files[i % len(self.files)]
+            # The first upload of each file stores it; everything after is a hit
+            if i < len(self.files) or i % 2:
+                calls.append(('upload', submit(code, name, mime_type, data, self.stored)))
+            else:
+                calls.append(('preflight', preflight(code, name, mime_type, data, self.stored)))
+        return run_load(recorder, self.submitters, calls)
+
+    def download(self, recorder):
+        if not self.stored:
+            self.submit_storm(Recorder())
+        calls = []
+        for _ in range(self.args.downloads):
+            url = f'/submissions/{self.rng.choice(self.stored)}/download'
+            calls.append(('full', get(url)))
+            calls.append(('range', get(url, {'Range': 'bytes=0-65535'})))
+        return run_load(recorder, self.submitters, calls)
+
+    def list_pagination(self, recorder):
+        form = self.create_form('Benchmark listing')
+        self.extra['seedSeconds'] = round(seed_form(self.app, form['id'], self.args.rows, self.rng), 3)
+        self.extra['rows'] = self.args.rows
+        reset_peak_rss()
+        url = f"/forms/{form['id']}/submissions"
+        start = time.perf_counter()
+
+        # One client walking every page, as an export would
+        client = self.owner_clients[0]
+        cursors = []
+        cursor = None
+        while True:
+            response = recorder.time('cursor_walk', client,
+                                     get(f'{url}?limit=500' + (f'&cursor={cursor}' if cursor else '')))
+            cursor = response.get_json()['nextCursor']
+            if not cursor:
+                break
+            cursors.append(cursor)
+
+        filters = ('status=accepted', 'mimeType=video/*', 'sort=-sizeBytes', 'sort=filename&status=rejected',
+                   'createdFrom=' + (datetime.utcnow() - timedelta(days=20)).isoformat())
+        calls = []
+        for i in range(self.args.pages):
+            calls.append(('first_page', get(f'{url}?limit=50')))
+            calls.append(('deep_page', get(f'{url}?limit=50&cursor={self.rng.choice(cursors)}' if cursors else url)))
+            calls.append(('filtered', get(f'{url}?limit=50&{filters[i % len(filters)]}')))
+        run_load(recorder, self.owner_clients, calls)
+        return time.perf_counter() - start
+
+    def bulk_delete(self, recorder):
+        forms = []
+        seeding = 0.0
+        for i in range(self.args.delete_forms):
+            form = self.create_form(f'Benchmark delete {i}')
+            seeding += seed_form(self.app, form['id'], self.args.delete_rows, self.rng)
+            forms.append(form)
+        self.extra['seedSeconds'] = round(seeding, 3)
+        self.extra['rowsPerForm'] = self.args.delete_rows
+        if not self.stored:
+            self.submit_storm(Recorder())
+        reset_peak_rss()
+        start = time.perf_counter()
+        for form in forms:
+            recorder.time('form', self.owner_clients[0], delete(f"/forms/{form['id']}"))
+        run_load(recorder, self.owner_clients, [
+            ('submission', delete(f'/submissions/{submission_id}'))
+            for submission_id in self.stored[:self.args.deletes]])
+        del self.stored[:self.args.deletes]
+        return time.perf_counter() - start
+
+    def run(self, name):
+        recorder = Recorder()
+        self.extra = {}
+        reset_peak_rss()
+        wall = getattr(self, name)(recorder)
+        result = {'durationSeconds': round(wall, 3), 'peakRssKb': peak_rss_kb(), **self.extra,
+                  'operations': recorder.summary(wall)}
+        return result
+
+
+# --- Reporting ---
+
+def metadata(args, database_uri):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'startedAt': datetime.utcnow().isoformat() + 'Z',
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': database_uri.split(':', 1)[0],
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'baseline', 'database_uri', 'testfiles')},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a line for each operation whose p95 latency or throughput is
+    worse than in `baseline` by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, scenario in results['scenarios'].items():
+        previous_ops = baseline.get('scenarios', {}).get(name, {}).get('operations', {})
+        for label, current in scenario['operations'].items():
+            previous = previous_ops.get(label)
+            if not previous:
+                continue
+            before, after = previous['latencyMs']['p95'], current['latencyMs']['p95']
+            # Sub-millisecond differences are noise
+            if after > before * (1 + tolerance) and after - before > 1.0:
+                regressions.append(f'{name}.{label}: p95 {before:.1f} -> {after:.1f} ms')
+            before, after = previous['throughputPerSecond'], current['throughputPerSecond']
+            if after < before / (1 + tolerance):
+                regressions.append(f'{name}.{label}: throughput {before:.1f} -> {after:.1f} req/s')
+    return regressions
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated, from: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--submits', type=int, default=200, help='Uploads per submit scenario')
+    parser.add_argument('--downloads', type=int, default=200, help='Full and ranged downloads each')
+    parser.add_argument('--rows', type=int, default=50000, help='Submissions in the listed form')
+    parser.add_argument('--pages', type=int, default=200, help='Requests per listing operation')
+    parser.add_argument('--delete-forms', type=int, default=5)
+    parser.add_argument('--delete-rows', type=int, default=10000, help='Submissions per deleted form')
+    parser.add_argument('--deletes', type=int, default=100, help='Single submissions deleted')
+    parser.add_argument('--seed', type=int, default=1, help='Seeds file choice and generated rows')
+    parser.add_argument('--testfiles', default=TESTFILES)
+    parser.add_argument('--database-uri', help='Scratch database; defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression, as a fraction')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with workdir('api') as folder:
+        database_uri = args.database_uri or sqlite_uri(folder)
+        app = make_app(database_uri, os.path.join(folder, 'uploads'))
+        suite = Suite(app, args)
+        results = {'meta': metadata(args, database_uri), 'scenarios': {}}
+        for name in names:
+            print(f'Running {name}...', file=sys.stderr)
+            results['scenarios'][name] = suite.run(name)
+        dispose(app)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('settings') != results['meta']['settings']:
+            print('Warning: the baseline was run with different settings', file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
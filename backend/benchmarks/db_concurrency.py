@@ -0,0 +1,116 @@
+"""
+Concurrency benchmark for the database profiles.
+
+Worker processes submit files and list a form's submissions at the same
+time for --duration seconds, against:
+  sqlite-legacy  rollback journal, synchronous=FULL (SQLite's defaults)
+  sqlite-wal     WAL, synchronous=NORMAL (the default profile)
+  postgres       pooled connections, if --postgres-uri is given
+
+Each mode reports throughput, latency percentiles and server errors (such
+as "database is locked") for both endpoints. For PostgreSQL, point it at a
+scratch database, e.g. one started with
+    docker run --rm -e POSTGRES_PASSWORD=pw -p 5432:5432 postgres:16
+and pip install "psycopg[binary]".
+
+Run from the backend folder:
+    python -m benchmarks.db_concurrency [--processes 4] [--threads 4] [--duration 10]
+    python -m benchmarks.db_concurrency --postgres-uri postgresql+psycopg://postgres:pw@localhost/postgres
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+from .harness import (create_form, dispose, make_app, make_parser, percentile, run_threads, signin, signup,
+                      sqlite_uri, submit, workdir)
+
+
+def load_worker(database_uri, upload_folder, overrides, code, form_id, owner, threads, duration, results):
+    app = make_app(database_uri, upload_folder, DB_AUTO_MIGRATE=False, **overrides)
+    samples = {'submit': [], 'list': []}
+    errors = {'submit': 0, 'list': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def run(index):
+        client = app.test_client()
+        # Even threads submit as their own user, odd ones list as the form owner
+        endpoint = 'submit' if index % 2 == 0 else 'list'
+        if endpoint == 'submit':
+            signup(client)
+        else:
+            signin(client, owner)
+        n = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            if endpoint == 'submit':
+                payload = f'{os.getpid()}-{index}-{n}'.encode()
+                response = submit(client, code, payload)
+            else:
+                response = client.get(f'/forms/{form_id}/submissions?limit=50')
+            elapsed = time.perf_counter() - start
+            n += 1
+            with lock:
+                samples[endpoint].append(elapsed)
+                if response.status_code >= 500:
+                    errors[endpoint] += 1
+
+    run_threads(run, threads)
+    dispose(app)
+    results.put((samples, errors))
+
+
+def run_mode(name, database_uri, upload_folder, overrides, args):
+    app = make_app(database_uri, upload_folder, **overrides)
+    client = app.test_client()
+    owner = signup(client)
+    form = create_form(client, 'db bench')
+    dispose(app)
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load_worker, args=(
+        database_uri, upload_folder, overrides, form['code'], form['id'], owner, args.threads, args.duration, results))
+        for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    samples = {'submit': [], 'list': []}
+    errors = {'submit': 0, 'list': 0}
+    for _ in processes:
+        worker_samples, worker_errors = results.get()
+        for endpoint in samples:
+            samples[endpoint].extend(worker_samples[endpoint])
+            errors[endpoint] += worker_errors[endpoint]
+    for process in processes:
+        process.join()
+
+    for endpoint in ('submit', 'list'):
+        values = sorted(samples[endpoint])
+        print(f"{name:<16}{endpoint:<8}{len(values) / args.duration:>9.1f}{percentile(values, 0.5) * 1000:>9.1f}"
+              f"{percentile(values, 0.95) * 1000:>9.1f}{percentile(values, 0.99) * 1000:>9.1f}{errors[endpoint]:>8}")
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='Per process; half submit, half list')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode')
+    parser.add_argument('--postgres-uri', help='Scratch PostgreSQL database to include')
+    args = parser.parse_args()
+
+    with workdir('db') as folder:
+        modes = [
+            ('sqlite-legacy', sqlite_uri(folder, 'legacy.db'),
+             {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full'}),
+            ('sqlite-wal', sqlite_uri(folder, 'wal.db'), {}),
+        ]
+        if args.postgres_uri:
+            modes.append(('postgres', args.postgres_uri, {}))
+        print(f"{args.processes} processes x {args.threads} threads, {args.duration:g}s per mode")
+        print(f"{'mode':<16}{'endpoint':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, database_uri, overrides in modes:
+            run_mode(name, database_uri, os.path.join(folder, 'uploads'), overrides, args)
+
+
+if __name__ == '__main__':
+    main()
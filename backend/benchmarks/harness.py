@@ -0,0 +1,107 @@
+"""
+Setup and timing helpers shared by the benchmark scripts.
+
+Each script in this folder keeps only its own scenario; booting the app
+against a scratch database, signing users in, submitting payloads and
+summarising latencies all live here.
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from config import Config
+from app import create_app
+from models import db
+
+
+def make_parser(doc):
+    """An argument parser that prints the script's docstring as its help."""
+    return argparse.ArgumentParser(description=doc, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+
+@contextlib.contextmanager
+def workdir(name):
+    """A temporary folder for databases, uploads and inputs, removed afterwards."""
+    path = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def sqlite_uri(folder, name='bench.db'):
+    return 'sqlite:///' + os.path.join(folder, name)
+
+
+def make_app(database_uri, upload_folder, **overrides):
+    """
+    The app on its own database and upload folder, with validation inline
+    and no background collector, so only the requests being timed run.
+    """
+    attributes = dict(SQLALCHEMY_DATABASE_URI=database_uri, UPLOAD_FOLDER=upload_folder,
+                      VALIDATION_WORKERS=0, GC_INTERVAL_SECONDS=0, **overrides)
+    return create_app(type('BenchConfig', (Config,), attributes))
+
+
+def dispose(app):
+    """Closes the app's connections, before forking or at the end of a run."""
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+# --- Requests ---
+
+def signup(client, username=None):
+    """Signs the client up as a new user (password 'pw'). Returns the username."""
+    username = username or f'bench-{uuid.uuid4().hex[:12]}'
+    response = client.post('/auth/signup', json={'username': username, 'password': 'pw',
+                                                 'email': f'{username}@example.com'})
+    assert response.status_code == 200, response.data
+    return username
+
+
+def signin(client, username):
+    response = client.post('/auth/signin', json={'username': username, 'password': 'pw'})
+    assert response.status_code == 200, response.data
+
+
+def create_form(client, title, max_per_user=0):
+    """A form without file constraints that takes any number of submissions per user, up to `max_per_user`."""
+    response = client.post('/forms', json={'title': title, 'constraints': {},
+                                           'allowMultipleSubmissionsPerUser': True,
+                                           'maxSubmissionsPerUser': max_per_user})
+    assert response.status_code in (200, 201), response.data
+    return response.get_json()
+
+
+def submit(client, code, payload, filename='bench.bin', mime_type='application/octet-stream'):
+    return client.post(f'/submit/{code}', data={'file': (io.BytesIO(payload), filename, mime_type)},
+                       content_type='multipart/form-data')
+
+
+# --- Timing ---
+
+def run_threads(target, count):
+    """Runs target(index) on `count` threads and waits for them all. Returns the wall time."""
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list of samples (0.0 when empty)."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(len(ordered) * p) - 1)]
@@ -0,0 +1,84 @@
+"""
+Latency benchmark for media probing: bounded (header-only) vs a baseline.
+
+Probes every file under testfiles/ (or --path) in bounded mode and reports
+the median time per probe against a baseline. For images the baseline is a
+plain Image.open(path).size, as the probe did before bounded reads, so EXIF
+handling doesn't count towards the speedup. For video and audio it is a full
+ffprobe run; these need ffprobe on PATH and are skipped without it.
+
+Run from the backend folder:
+    python -m benchmarks.probe_latency [--path ../testfiles] [--repeat 20]
+"""
+import mimetypes
+import os
+import shutil
+import statistics
+import time
+
+from PIL import Image
+
+from validation import DEFAULT_PROBE_LIMITS, get_image_metadata, get_video_metadata, probe_tool
+
+from .harness import make_parser
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'testfiles')
+
+
+def open_size(path, limits):
+    """Baseline image probe: Pillow's lazy open and its size, nothing else."""
+    try:
+        with Image.open(path) as img:
+            return img.size, None
+    except Exception as e:
+        return None, str(e)
+
+
+def time_probe(fn, path, limits, repeat):
+    samples = []
+    data = error = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data, error = fn(path, limits)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), error
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    bounded = dict(DEFAULT_PROBE_LIMITS, PROBE_MODE='bounded')
+    full = dict(DEFAULT_PROBE_LIMITS, PROBE_MODE='full')  # ffprobe baseline
+    has_ffprobe = shutil.which('ffprobe') is not None
+
+    print(f"{'file':<48}{'size KB':>10}{'baseline ms':>13}{'bounded ms':>12}{'speedup':>9}")
+    for root, _, files in os.walk(args.path):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            mime_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            tool = probe_tool(mime_type)
+            if tool is None:
+                continue
+            label = name if len(name) <= 46 else name[:43] + '...'
+            if tool == 'ffprobe' and not has_ffprobe:
+                print(f"{label:<48}{'skipped: ffprobe not found':>44}")
+                continue
+
+            if tool == 'ffprobe':
+                base_time, base_error = time_probe(get_video_metadata, path, full, args.repeat)
+                bounded_time, bounded_error = time_probe(get_video_metadata, path, bounded, args.repeat)
+            else:
+                base_time, base_error = time_probe(open_size, path, None, args.repeat)
+                bounded_time, bounded_error = time_probe(get_image_metadata, path, bounded, args.repeat)
+            if base_error or bounded_error:
+                print(f"{label:<48}{'error: ' + (base_error or bounded_error)[:60]}")
+                continue
+            print(f"{label:<48}{os.path.getsize(path) / 1024:>10.0f}{base_time * 1000:>13.2f}"
+                  f"{bounded_time * 1000:>12.2f}{base_time / bounded_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Load test for per-user submission quotas.
+
+Several worker processes, each with a few threads, submit to one form as
+the same user at the same time. The form allows --limit submissions per
+user; the run fails unless exactly that many were admitted and the quota
+counter matches the submission rows. Also times a quota claim on an
+empty table and after --filler submissions by other users, to show the
+cost doesn't grow with the table.
+
+Run from the backend folder:
+    python -m benchmarks.quota_contention [--processes 4] [--threads 4] [--attempts 25] [--limit 10]
+    python -m benchmarks.quota_contention --database-uri postgresql://user:pw@host/db
+"""
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+import uuid
+
+from models import db, Form, Submission, SubmissionQuota, User
+from quotas import claim_quota
+
+from .harness import (create_form, dispose, make_app, make_parser, run_threads, signin, signup, sqlite_uri,
+                      submit, workdir)
+
+
+def submit_worker(database_uri, upload_folder, code, username, threads, attempts, results):
+    app = make_app(database_uri, upload_folder)
+    statuses = []
+    lock = threading.Lock()
+
+    def run(thread_index):
+        client = app.test_client()
+        signin(client, username)
+        for i in range(attempts):
+            payload = f'{os.getpid()}-{thread_index}-{i}'.encode()
+            response = submit(client, code, payload)
+            with lock:
+                statuses.append(response.status_code)
+
+    run_threads(run, threads)
+    dispose(app)
+    results.put(statuses)
+
+
+def time_claims(app, form_id, n):
+    samples = []
+    with app.app_context():
+        form = db.session.get(Form, form_id)
+        for _ in range(n):
+            user = User(id=str(uuid.uuid4()), username=uuid.uuid4().hex)
+            db.session.add(user)
+            db.session.flush()
+            start = time.perf_counter()
+            claim_quota(form, user.id)
+            samples.append(time.perf_counter() - start)
+            db.session.rollback()
+    return statistics.median(samples)
+
+
+def add_filler(app, form_id, n):
+    with app.app_context():
+        user_ids = [str(uuid.uuid4()) for _ in range(max(1, n // 10))]
+        db.session.execute(db.insert(User), [{'id': u, 'username': u} for u in user_ids])
+        db.session.execute(db.insert(Submission), [
+            {'id': str(uuid.uuid4()), 'form_id': form_id, 'submitted_by': user_ids[i % len(user_ids)],
+             'status': 'accepted', 'filename': 'filler.bin'} for i in range(n)])
+        db.session.execute(db.insert(SubmissionQuota), [
+            {'form_id': form_id, 'user_id': u, 'used': 10} for u in user_ids])
+        db.session.commit()
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=25, help='Submits per thread')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--filler', type=int, default=100000)
+    parser.add_argument('--database-uri', help='Defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    with workdir('quota') as folder:
+        database_uri = args.database_uri or sqlite_uri(folder)
+        upload_folder = os.path.join(folder, 'uploads')
+        app = make_app(database_uri, upload_folder)
+        client = app.test_client()
+        username = signup(client)
+        form = create_form(client, 'quota bench', max_per_user=args.limit)
+        dispose(app)
+
+        total = args.processes * args.threads * args.attempts
+        print(f"database: {database_uri.split('://')[0]}, {args.processes} processes x {args.threads} threads, "
+              f"{total} submits, limit {args.limit}")
+        results = multiprocessing.Queue()
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=submit_worker, args=(
+            database_uri, upload_folder, form['code'], username, args.threads, args.attempts, results))
+            for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        statuses = [s for _ in processes for s in results.get()]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            rows = Submission.query.filter_by(form_id=form['id']).count()
+            used = db.session.query(SubmissionQuota.used).filter_by(form_id=form['id']).scalar()
+        admitted = statuses.count(200) + statuses.count(202)
+        refused = statuses.count(409)
+        print(f"admitted {admitted}, refused {refused}, other {len(statuses) - admitted - refused}, "
+              f"{len(statuses) / elapsed:.0f} submits/s")
+        print(f"submission rows {rows}, quota counter {used}")
+        ok = admitted == rows == used == args.limit
+        print('PASS: no over-admission' if ok else 'FAIL')
+
+        empty = time_claims(app, form['id'], 200)
+        add_filler(app, form['id'], args.filler)
+        full = time_claims(app, form['id'], 200)
+        print(f"claim median: {empty * 1e6:.0f} us empty, {full * 1e6:.0f} us with {args.filler} submissions")
+        dispose(app)
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
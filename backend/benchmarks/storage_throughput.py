@@ -0,0 +1,91 @@
+"""
+Throughput benchmark for storage.save_file.
+
+Compares the single-pass hash-and-write path against the previous
+implementation (hash in 4KB reads, seek back, then FileStorage.save()).
+
+Run from the backend folder:
+    python -m benchmarks.storage_throughput [--sizes 1,100,500] [--repeat 3]
+"""
+import hashlib
+import os
+import shutil
+import time
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from storage import save_file, DEFAULT_BUFFER_SIZE
+
+from .harness import make_parser, workdir
+
+
+def legacy_save_file(file, upload_folder):
+    """The two-pass implementation save_file replaced."""
+    if not os.path.exists(upload_folder):
+        os.makedirs(upload_folder)
+    sha256_hash = hashlib.sha256()
+    chunk_size = 4096
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        sha256_hash.update(chunk)
+    file.seek(0)
+    file_hash = sha256_hash.hexdigest()
+    original_filename = secure_filename(file.filename)
+    file_path = os.path.join(upload_folder, file_hash)
+    is_new = False
+    if not os.path.exists(file_path):
+        file.save(file_path)
+        is_new = True
+    return file_hash, original_filename, is_new
+
+
+def make_input(path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def run_once(fn, source_path, upload_folder):
+    # Fresh store each run so every save is a new blob
+    shutil.rmtree(upload_folder, ignore_errors=True)
+    with open(source_path, 'rb') as src:
+        # Werkzeug spools large uploads to a temp file, so a file object is
+        # the realistic input
+        file = FileStorage(stream=src, filename='input.bin', content_type='application/octet-stream')
+        start = time.perf_counter()
+        fn(file, upload_folder)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--sizes', default='1,100,500', help='Input sizes in MB (comma separated)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE)
+    args = parser.parse_args()
+
+    implementations = [
+        ('legacy (2-pass, 4KB)', legacy_save_file),
+        (f'single-pass ({args.buffer_size // 1024}KB)',
+         lambda f, folder: save_file(f, folder, args.buffer_size)),
+    ]
+
+    with workdir('storage') as folder:
+        upload_folder = os.path.join(folder, 'uploads')
+        print(f"{'size':>8}  {'implementation':<28}{'best MB/s':>12}{'mean MB/s':>12}")
+        for size_mb in [int(s) for s in args.sizes.split(',')]:
+            source_path = os.path.join(folder, f'input-{size_mb}.bin')
+            make_input(source_path, size_mb)
+            for name, fn in implementations:
+                timings = [run_once(fn, source_path, upload_folder) for _ in range(args.repeat)]
+                best = size_mb / min(timings)
+                mean = size_mb / (sum(timings) / len(timings))
+                print(f"{size_mb:>6}MB  {name:<28}{best:>12.1f}{mean:>12.1f}")
+            os.remove(source_path)
+
+if __name__ == '__main__':
+    main()
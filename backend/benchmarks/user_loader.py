@@ -0,0 +1,60 @@
+"""
+Latency benchmark for the Flask-Login user loader.
+
+Times GET /me (an authenticated request that only needs current_user) with
+the identity cache disabled (USER_CACHE_SIZE=0, one query per request) and
+enabled. Run it once against SQLite and once against a server database to
+see the round-trip saved there:
+
+Run from the backend folder:
+    python -m benchmarks.user_loader [--requests 5000]
+    python -m benchmarks.user_loader --database-uri postgresql://user:pw@host/db
+"""
+import os
+import statistics
+import time
+
+from config import Config
+
+from .harness import dispose, make_app, make_parser, percentile, signup, sqlite_uri, workdir
+
+
+def time_requests(app, n):
+    client = app.test_client()
+    signup(client)
+    for _ in range(min(n, 100)):
+        client.get('/me')  # warm up
+
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.get('/me')
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return samples
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--database-uri', help='Defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    with workdir('users') as folder:
+        database_uri = args.database_uri or sqlite_uri(folder)
+        upload_folder = os.path.join(folder, 'uploads')
+        print(f"database: {database_uri.split('://')[0]}, {args.requests} requests")
+        print(f"{'loader':<14}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+        results = {}
+        for name, cache_size in (('uncached', 0), ('cached', Config.USER_CACHE_SIZE)):
+            app = make_app(database_uri, upload_folder, USER_CACHE_SIZE=cache_size)
+            samples = sorted(time_requests(app, args.requests))
+            results[name] = statistics.mean(samples)
+            print(f"{name:<14}{results[name] * 1e6:>10.1f}{percentile(samples, 0.5) * 1e6:>10.1f}"
+                  f"{percentile(samples, 0.95) * 1e6:>10.1f}")
+            dispose(app)
+        print(f"saved per request: {(results['uncached'] - results['cached']) * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
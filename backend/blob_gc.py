@@ -0,0 +1,319 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, union, delete, exists
+from models import db, Blob, Submission, UploadSession, ProbeResult
+from blobs import lock_blob
+from storage import BLOB_NAME, STAGING_DIRNAME, shard_path, delete_file
+import probe_cache
+
+logger = logging.getLogger(__name__)
+
+# Dangling references are counted in full but only this many are listed
+_DANGLING_SAMPLE = 100
+
+# Referenced hashes read per query during the scan
+_REFERENCE_PAGE = 1000
+
+# Orphans noted during the scan before they are deleted
+_ORPHAN_BATCH = 500
+
+
+class RateLimiter:
+    """
+    Paces filesystem operations. The allowed rate depends on the time of day,
+    so the collector stays gentle during business hours.
+    """
+
+    def __init__(self, business_rate, off_hours_rate, business_hours):
+        self.business_rate = business_rate
+        self.off_hours_rate = off_hours_rate
+        self.business_hours = business_hours
+        self._next = time.monotonic()
+
+    def current_rate(self):
+        start, end = self.business_hours
+        return self.business_rate if start <= datetime.now().hour < end else self.off_hours_rate
+
+    def wait(self):
+        rate = self.current_rate()
+        if not rate:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + 1.0 / rate
+
+
+def _sorted_tree(path, depth, limiter):
+    """
+    Yields (hash, path) for blobs under a sharded directory in hash order.
+    Each shard directory is small, so sorting one listing at a time keeps
+    memory bounded.
+    """
+    limiter.wait()
+    with os.scandir(path) as it:
+        entries = sorted((e for e in it if not e.name.startswith('.')), key=lambda e: e.name)
+    for entry in entries:
+        if depth and entry.is_dir(follow_symlinks=False):
+            yield from _sorted_tree(entry.path, depth - 1, limiter)
+        elif not depth and BLOB_NAME.match(entry.name):
+            yield entry.name, entry.path
+
+
+def _sorted_flat(upload_folder, limiter):
+    """
+    Yields (hash, path) for blobs still in the legacy flat layout, in hash order.
+    This listing is only small once `migrate-store` has run.
+    """
+    limiter.wait()
+    with os.scandir(upload_folder) as it:
+        names = sorted(e.name for e in it if BLOB_NAME.match(e.name) and e.is_file(follow_symlinks=False))
+    for name in names:
+        yield name, os.path.join(upload_folder, name)
+
+
+def _referenced_hashes():
+    """
+    Streams every hash the database refers to, in sorted order. Hashes are
+    read in keyset pages, each a short query of its own, so the collector
+    can write between pages without holding a cursor open.
+    """
+    after = ''
+    while True:
+        blob_refs = (select(Blob.hash.label('hash'))
+                     .where(Blob.refcount > 0, Blob.hash > after)
+                     .order_by(Blob.hash).limit(_REFERENCE_PAGE).subquery())
+        # Submissions stored before refcounts were backfilled have no Blob row
+        submission_refs = (select(Submission.file_path.label('hash')).distinct()
+                           .where(Submission.file_path > after)
+                           .order_by(Submission.file_path).limit(_REFERENCE_PAGE).subquery())
+        query = union(select(blob_refs.c.hash), select(submission_refs.c.hash)).order_by('hash').limit(_REFERENCE_PAGE)
+        page = db.session.execute(query).scalars().all()
+        db.session.commit()
+        yield from page
+        if len(page) < _REFERENCE_PAGE:
+            return
+        after = page[-1]
+
+
+def _is_referenced(file_hash):
+    return db.session.execute(select(
+        exists().where(Blob.hash == file_hash, Blob.refcount > 0) |
+        exists().where(Submission.file_path == file_hash)
+    )).scalar()
+
+
+def _delete_orphan(file_hash, path, cutoff):
+    """
+    Deletes an orphaned blob, its probe results and its derivatives unless
+    a submission picked it up since the scan. Returns the bytes freed, or None if it was kept.
+
+    The checks and the unlink happen under the blob's row lock. acquire_blob
+    takes the same lock, so a concurrent upload of the same bytes either
+    commits its reference first and the blob is kept, or gets the lock after
+    the file is gone and refuses the submission (see _create_submission).
+    """
+    lock_blob(file_hash)
+    try:
+        if _is_referenced(file_hash):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        # A dedup hit refreshes the mtime before it takes the lock
+        if stat.st_mtime >= cutoff:
+            return None
+        delete_file(path)
+        probe_cache.discard(file_hash)
+    finally:
+        db.session.commit()
+    current_app.extensions['derivatives'].discard(file_hash)
+    return stat.st_size
+
+
+def _clean_staging(upload_folder, cutoff, session_cutoff, dry_run, limiter, report):
+    """
+    Removes temp files left by crashed uploads, and resumable uploads that
+    have not received a chunk since session_cutoff.
+    """
+    staging = os.path.join(upload_folder, STAGING_DIRNAME)
+    if not os.path.isdir(staging):
+        return
+    with os.scandir(staging) as it:
+        for entry in it:
+            limiter.wait()
+            if entry.name.endswith('.part'):
+                upload_id = entry.name[:-len('.part')]
+                upload = db.session.get(UploadSession, upload_id)
+                if upload and upload.updated_at >= session_cutoff:
+                    continue
+                if not dry_run and upload:
+                    db.session.delete(upload)
+                    db.session.commit()
+            elif entry.stat().st_mtime >= cutoff:
+                continue
+            report['stagingRemoved'] += 1
+            if not dry_run:
+                delete_file(entry.path)
+
+    if not dry_run:
+        # Sessions whose staging file never got written
+        db.session.execute(delete(UploadSession).where(UploadSession.updated_at < session_cutoff))
+        db.session.commit()
+
+
+def collect_garbage(upload_folder, shard_depth, grace_seconds=3600, session_ttl_seconds=86400,
+                    limiter=None, dry_run=False):
+    """
+    Reconciles the blob store with the database. Must run inside an app context.
+
+    Blobs on disk and hashes referenced in the database are both streamed in
+    sorted order and merge-joined, so neither side is loaded into memory.
+    Orphans (on disk, unreferenced) older than the grace period are deleted;
+    dangling references (in the database, missing on disk) are reported.
+    This is the only place blob files are deleted: releasing the last
+    reference to a blob leaves its file for the next run.
+    Orphans are deleted in batches of _ORPHAN_BATCH as the scan goes, each
+    rechecked under its row lock.
+    Returns a report dict.
+    """
+    limiter = limiter or RateLimiter(0, 0, (0, 0))
+    now = time.time()
+    cutoff = now - grace_seconds
+    report = {
+        'startedAt': datetime.utcnow().isoformat(),
+        'dryRun': dry_run,
+        'scanned': 0,
+        'orphans': 0,
+        'orphansDeleted': 0,
+        'orphanBytesDeleted': 0,
+        'orphansInGracePeriod': 0,
+        'duplicatesRemoved': 0,
+        'dangling': 0,
+        'danglingSample': [],
+        'stagingRemoved': 0
+    }
+
+    on_disk = heapq.merge(
+        _sorted_tree(upload_folder, shard_depth, limiter),
+        _sorted_flat(upload_folder, limiter) if shard_depth else iter(()))
+    referenced = _referenced_hashes()
+
+    ref = next(referenced, None)
+    previous = None
+    orphans = []
+
+    def delete_orphans():
+        for file_hash, path, size in orphans:
+            if dry_run:
+                freed = None if _is_referenced(file_hash) else size
+            else:
+                limiter.wait()
+                freed = _delete_orphan(file_hash, path, cutoff)
+            if freed is not None:
+                report['orphansDeleted'] += 1
+                report['orphanBytesDeleted'] += freed
+        orphans.clear()
+
+    for file_hash, path in on_disk:
+        report['scanned'] += 1
+
+        if file_hash == previous:
+            # Same blob in the flat and sharded layouts; keep the sharded copy
+            if path != shard_path(upload_folder, file_hash, shard_depth):
+                limiter.wait()
+                report['duplicatesRemoved'] += 1
+                if not dry_run:
+                    delete_file(path)
+            continue
+        previous = file_hash
+
+        while ref is not None and ref < file_hash:
+            report['dangling'] += 1
+            if len(report['danglingSample']) < _DANGLING_SAMPLE:
+                report['danglingSample'].append(ref)
+            ref = next(referenced, None)
+
+        if ref == file_hash:
+            ref = next(referenced, None)
+            continue
+
+        # Orphan: on disk but not referenced
+        limiter.wait()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue  # Gone since the listing, e.g. removed by another collector run
+        report['orphans'] += 1
+        if stat.st_mtime >= cutoff:
+            # Recently released, or belongs to an upload whose Submission isn't committed yet
+            report['orphansInGracePeriod'] += 1
+            continue
+        orphans.append((file_hash, path, stat.st_size))
+        if len(orphans) >= _ORPHAN_BATCH:
+            delete_orphans()
+
+    while ref is not None:
+        report['dangling'] += 1
+        if len(report['danglingSample']) < _DANGLING_SAMPLE:
+            report['danglingSample'].append(ref)
+        ref = next(referenced, None)
+    delete_orphans()
+
+    if not dry_run:
+        # Rows for blobs nobody references, and their probe results. acquire_blob
+        # recreates a row atomically if one is needed again; the probe reruns.
+        unreferenced = select(Blob.hash).where(Blob.refcount <= 0)
+        db.session.execute(delete(ProbeResult).where(ProbeResult.content_hash.in_(unreferenced)))
+        db.session.execute(delete(Blob).where(Blob.refcount <= 0))
+        db.session.commit()
+
+    session_cutoff = datetime.utcnow() - timedelta(seconds=session_ttl_seconds)
+    _clean_staging(upload_folder, cutoff, session_cutoff, dry_run, limiter, report)
+
+    report['finishedAt'] = datetime.utcnow().isoformat()
+    return report
+
+
+def gc_from_config(app, dry_run=False):
+    """
+    Runs collect_garbage with the app's GC_* settings.
+    """
+    config = app.config
+    limiter = RateLimiter(config['GC_BUSINESS_HOURS_OPS_PER_SEC'], config['GC_OFF_HOURS_OPS_PER_SEC'],
+                          config['GC_BUSINESS_HOURS'])
+    with app.app_context():
+        return collect_garbage(config['UPLOAD_FOLDER'], config['STORAGE_SHARD_DEPTH'],
+                               config['GC_GRACE_SECONDS'], config['UPLOAD_SESSION_TTL'],
+                               limiter=limiter, dry_run=dry_run)
+
+
+def start_gc_thread(app):
+    """
+    Runs the collector every GC_INTERVAL_SECONDS in a daemon thread.
+    """
+    interval = app.config['GC_INTERVAL_SECONDS']
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                report = gc_from_config(app)
+                logger.info('Blob GC: %s', report)
+                if report['dangling']:
+                    logger.warning('Blob GC found %d dangling references, e.g. %s',
+                                   report['dangling'], report['danglingSample'][:5])
+            except Exception:
+                logger.exception('Blob GC failed')
+
+    thread = threading.Thread(target=loop, name='blob-gc', daemon=True)
+    thread.start()
+    return thread
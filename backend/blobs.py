@@ -0,0 +1,96 @@
+from collections import Counter
+from sqlalchemy import update, delete, select, bindparam, func
+from models import db, Blob, Submission, SubmissionValidationResult, insert_or_ignore, upsert_increment
+from quotas import release_quotas, count_slots
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+_BATCH = 500
+
+
+def acquire_blob(file_hash, size_bytes, mime_type):
+    """
+    Adds a reference to a blob, creating its row on first use.
+    Runs in the caller's transaction, alongside the Submission insert.
+    """
+    upsert_increment(Blob, 'refcount', hash=file_hash, size_bytes=size_bytes, mime_type=mime_type, refcount=1)
+
+
+def lock_blob(file_hash):
+    """
+    Takes the write lock on a blob's row, creating the row if needed, until
+    the caller's transaction ends. acquire_blob waits on the same lock.
+    """
+    upsert_increment(Blob, 'refcount', amount=0, hash=file_hash, refcount=0)
+
+
+def release_blobs(counts):
+    """
+    Drops references to blobs with one batched UPDATE. `counts` maps hash to
+    the number of references released.
+
+    Files left unreferenced aren't deleted here: the collector (blob_gc.py)
+    removes them once they are older than its grace period, so an upload of
+    the same bytes racing with this release can still reuse the file.
+    """
+    counts = {h: n for h, n in counts.items() if h and n}
+    if not counts:
+        return
+
+    blob = Blob.__table__
+    db.session.execute(
+        update(blob).where(blob.c.hash == bindparam('b_hash'))
+        .values(refcount=blob.c.refcount - bindparam('b_count')),
+        [{'b_hash': h, 'b_count': n} for h, n in counts.items()])
+
+
+def delete_submissions(*criteria):
+    """
+    Bulk-deletes the submissions matching `criteria` together with their
+    validation results, and releases their blobs and submission quota slots.
+    The number of statements depends on the number of distinct blobs and
+    submitters, not submissions.
+    """
+    ids = select(Submission.id).where(*criteria)
+    db.session.execute(
+        delete(SubmissionValidationResult).where(SubmissionValidationResult.submission_id.in_(ids))
+        .execution_options(synchronize_session=False))
+
+    stmt = delete(Submission).where(*criteria).execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.delete_returning:
+        # The file_path of each row as it is deleted, so a concurrent
+        # rejection (which clears file_path) can't be released twice
+        rows = [(*row, 1) for row in db.session.execute(stmt.returning(
+            Submission.file_path, Submission.form_id, Submission.submitted_by))]
+    else:
+        columns = (Submission.file_path, Submission.form_id, Submission.submitted_by)
+        rows = db.session.execute(select(*columns, func.count()).where(*criteria).group_by(*columns)).all()
+        db.session.execute(stmt)
+
+    counts = Counter()
+    for file_path, _, _, n in rows:
+        counts[file_path] += n
+    release_quotas(count_slots(rows))
+    release_blobs(counts)
+
+
+def rebuild_refcounts():
+    """
+    Recomputes every blob's refcount from the submission table, creating rows
+    for submissions stored before blobs were tracked. Returns the number of
+    blobs referenced.
+    """
+    db.session.execute(update(Blob).values(refcount=0).execution_options(synchronize_session=False))
+    rows = db.session.execute(
+        select(Submission.file_path, func.count(), func.max(Submission.size_bytes), func.max(Submission.mime_type))
+        .where(Submission.file_path.isnot(None))
+        .group_by(Submission.file_path)
+    ).yield_per(_BATCH)
+
+    referenced = 0
+    for file_hash, count, size_bytes, mime_type in rows:
+        insert_or_ignore(Blob, hash=file_hash, size_bytes=size_bytes, mime_type=mime_type, refcount=0)
+        db.session.execute(
+            update(Blob).where(Blob.hash == file_hash).values(refcount=count)
+            .execution_options(synchronize_session=False))
+        referenced += 1
+    return referenced
@@ -0,0 +1,68 @@
+import json
+import click
+from storage import migrate_layout
+from blobs import rebuild_refcounts
+from quotas import rebuild_quotas
+from blob_gc import gc_from_config
+from models import db, Submission, ProbeResult, insert_or_ignore
+from validation import probe_tool
+
+
+def register_commands(app):
+    """
+    Maintenance commands, run with `flask --app app <command>` from the backend folder.
+    """
+
+    @app.cli.command('migrate-store')
+    @click.option('--batch-size', default=500, show_default=True, help='Blobs moved between pauses.')
+    @click.option('--pause', default=0.05, show_default=True, help='Seconds to sleep after each batch.')
+    def migrate_store(batch_size, pause):
+        """Move stored blobs into the sharded layout (safe while serving)."""
+        depth = app.config['STORAGE_SHARD_DEPTH']
+        moved = migrate_layout(app.config['UPLOAD_FOLDER'], depth, batch_size, pause, log=click.echo)
+        click.echo(f'Done: moved {moved} blobs into depth-{depth} layout')
+
+    @app.cli.command('rebuild-refcounts')
+    def rebuild_blob_refcounts():
+        """Recompute blob reference counts from the submission table."""
+        referenced = rebuild_refcounts()
+        db.session.commit()
+        click.echo(f'Done: {referenced} blobs referenced')
+
+    @app.cli.command('rebuild-quotas')
+    def rebuild_submission_quotas():
+        """Recompute per-user submission counters from the submission table."""
+        written = rebuild_quotas()
+        db.session.commit()
+        click.echo(f'Done: {written} counters written')
+
+    @app.cli.command('gc-blobs')
+    @click.option('--dry-run', is_flag=True, help='Report without deleting anything.')
+    def gc_blobs(dry_run):
+        """Delete orphaned blobs and report dangling references."""
+        click.echo(json.dumps(gc_from_config(app, dry_run=dry_run), indent=2))
+
+    @app.cli.command('strip-raw-metadata')
+    @click.option('--batch-size', default=500, show_default=True, help='Rows rewritten per transaction.')
+    def strip_raw_metadata(batch_size):
+        """Move raw probe output out of submission metadata into the probe cache."""
+        stripped = 0
+        last_id = ''
+        while True:
+            batch = Submission.query.filter(Submission.id > last_id, Submission.metadata_json.isnot(None)) \
+                .order_by(Submission.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for submission in batch:
+                raw = (submission.metadata_json or {}).get('raw')
+                if raw is None:
+                    continue
+                tool = probe_tool(submission.mime_type)
+                if submission.file_path and tool:
+                    insert_or_ignore(ProbeResult, content_hash=submission.file_path, tool=tool, data=raw)
+                submission.metadata_json = {k: v for k, v in submission.metadata_json.items() if k != 'raw'}
+                stripped += 1
+            db.session.commit()
+            db.session.expunge_all()
+        click.echo(f'Done: stripped raw probe data from {stripped} submissions')
@@ -6,5 +6,80 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Apply pending migrations when the app starts. With several server
+    # processes, turn this off and run `flask --app app db upgrade` on deploy.
+    DB_AUTO_MIGRATE = (os.environ.get('DB_AUTO_MIGRATE') or '1') != '0'
+    # Connection pool for server databases (PostgreSQL); ignored for SQLite
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)  # Extra connections beyond the pool under load
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)  # Seconds before a connection is replaced
+    # Applied to every SQLite connection. WAL lets reads proceed during a write;
+    # use 'delete' and 'full' for SQLite's own defaults.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'wal'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'normal'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)  # Wait this long for the write lock
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(basedir, 'uploads')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB max upload size
+    UPLOAD_BUFFER_SIZE = int(os.environ.get('UPLOAD_BUFFER_SIZE') or 1024 * 1024)  # Read/hash/write block size
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS') or 32)  # asgi.py: threads for Flask views, hashing and disk I/O
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE') or 8 * 1024 * 1024)  # Resumable upload chunk size
+    VALIDATION_WORKERS = int(os.environ.get('VALIDATION_WORKERS') or 4)  # 0 validates inline in the request
+    VALIDATION_QUEUE_SIZE = int(os.environ.get('VALIDATION_QUEUE_SIZE') or 100)
+    PROBE_CACHE_SIZE = int(os.environ.get('PROBE_CACHE_SIZE') or 1024)  # In-process probe results (DB keeps all)
+    # 'bounded' reads only headers (falling back to a full probe when they are
+    # inconclusive); 'full' always probes the whole file
+    PROBE_MODE = os.environ.get('PROBE_MODE') or 'bounded'
+    PROBE_MAX_BYTES = int(os.environ.get('PROBE_MAX_BYTES') or 1024 * 1024)  # ffprobe -probesize
+    PROBE_MAX_ANALYZE_MS = int(os.environ.get('PROBE_MAX_ANALYZE_MS') or 1000)  # ffprobe -analyzeduration
+    PROBE_IMAGE_HEADER_BYTES = int(os.environ.get('PROBE_IMAGE_HEADER_BYTES') or 256 * 1024)
+    PROBE_TIMEOUT_SECONDS = int(os.environ.get('PROBE_TIMEOUT_SECONDS') or 30)  # ffprobe is killed after this
+    PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS') or 4)  # Max ffprobe processes at once
+    FORM_CACHE_SIZE = int(os.environ.get('FORM_CACHE_SIZE') or 1024)  # Forms cached per process, by id and by code
+    FORM_CACHE_TTL = int(os.environ.get('FORM_CACHE_TTL') or 60)  # Seconds before a cached form is reloaded
+    # Seconds a cached form is used before its Form.version is rechecked, i.e. how
+    # long another process may serve a form edited elsewhere. 0 checks every hit.
+    FORM_CACHE_REVALIDATE_SECONDS = int(os.environ.get('FORM_CACHE_REVALIDATE_SECONDS') or 5)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 4096)  # Logged-in users cached per process
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 5)  # Seconds before other processes see account changes and deletions
+    # Blobs are stored as ab/cd/<hash> for depth 2. After changing the depth,
+    # run `flask --app app migrate-store` to move existing blobs.
+    STORAGE_SHARD_DEPTH = int(os.environ.get('STORAGE_SHARD_DEPTH') or 2)
+    # Blob garbage collection (see blob_gc.py). 0 disables the background thread;
+    # `flask --app app gc-blobs` runs it on demand.
+    GC_INTERVAL_SECONDS = int(os.environ.get('GC_INTERVAL_SECONDS') or 6 * 3600)
+    GC_GRACE_SECONDS = int(os.environ.get('GC_GRACE_SECONDS') or 3600)  # Never delete orphans younger than this
+    GC_BUSINESS_HOURS = (8, 18)  # Local hours during which the slower rate applies
+    GC_BUSINESS_HOURS_OPS_PER_SEC = int(os.environ.get('GC_BUSINESS_HOURS_OPS_PER_SEC') or 200)
+    GC_OFF_HOURS_OPS_PER_SEC = int(os.environ.get('GC_OFF_HOURS_OPS_PER_SEC') or 0)  # 0 = unthrottled
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL') or 24 * 3600)  # Idle resumable uploads expire
+    # How submission downloads are sent: '' streams from Python; 'x-sendfile' sets
+    # X-Sendfile (Apache mod_xsendfile, lighttpd); 'x-accel' sets X-Accel-Redirect
+    # to DOWNLOAD_ACCEL_PREFIX + the blob's path under UPLOAD_FOLDER, which nginx
+    # must map to UPLOAD_FOLDER with an `internal` location.
+    DOWNLOAD_ACCEL_MODE = os.environ.get('DOWNLOAD_ACCEL_MODE') or ''
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX') or '/protected-uploads/'
+    # Thumbnails and previews (see derivatives.py). The cache defaults to
+    # <UPLOAD_FOLDER>/.derivatives and evicts least recently used files.
+    DERIVATIVE_FOLDER = os.environ.get('DERIVATIVE_FOLDER') or ''
+    DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get('DERIVATIVE_CACHE_MAX_BYTES') or 2 * 1024 * 1024 * 1024)
+    DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS') or 2)  # Preview clips transcoded at once
+    DERIVATIVE_TIMEOUT_SECONDS = int(os.environ.get('DERIVATIVE_TIMEOUT_SECONDS') or 300)  # ffmpeg is killed after this
+    THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE') or 320)  # Longest side, px
+    POSTER_SIZE = int(os.environ.get('POSTER_SIZE') or 1280)
+    PREVIEW_MAX_SECONDS = int(os.environ.get('PREVIEW_MAX_SECONDS') or 30)  # Length of video and audio previews
+    PREVIEW_HEIGHT = int(os.environ.get('PREVIEW_HEIGHT') or 480)
+    PREVIEW_VIDEO_BITRATE = os.environ.get('PREVIEW_VIDEO_BITRATE') or '600k'
+    PREVIEW_AUDIO_BITRATE = os.environ.get('PREVIEW_AUDIO_BITRATE') or '64k'
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or '1') != '0'  # Serve Prometheus metrics at GET /metrics
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or ''  # If set, scrapes must send 'Authorization: Bearer <token>'
+    # Request profiling (see profiler.py). Off unless a token or a sample rate
+    # is set: requests sending 'X-Profile: <token>' are profiled, and so is
+    # this fraction of requests to PROFILE_ENDPOINTS.
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or ''
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+    PROFILE_ENDPOINTS = os.environ.get('PROFILE_ENDPOINTS') or (
+        'api.submit_file,api.preflight_submission,api.upload_chunk,api.complete_upload_session,'
+        'api.get_form_submissions,api.list_my_submissions,api.delete_form,api.delete_submission,api.delete_my_account')
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 100)  # Newest profiles kept on disk
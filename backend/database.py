@@ -0,0 +1,89 @@
+import os
+from flask_migrate import Migrate, upgrade, stamp
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'migrations')
+
+# The schema the project shipped with before migrations existed. Databases
+# that create_all() made without an alembic_version table start from here.
+BASELINE_REVISION = '0001'
+
+
+def engine_options(config):
+    """
+    Engine options for the configured database, beneath any explicit
+    SQLALCHEMY_ENGINE_OPTIONS. Server databases get a sized, pre-pinged pool.
+    SQLite's file locking makes a pool size meaningless; it is tuned per
+    connection instead (see _configure_sqlite).
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+    if url.get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=True
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def _configure_sqlite(config):
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    synchronous = config['SQLITE_SYNCHRONOUS']
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT_MS'])
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside the single writer; NORMAL sync is
+        # crash-safe in WAL mode and skips an fsync per commit
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        # Writers wait for the lock instead of failing with "database is locked"
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.close()
+    return on_connect
+
+
+def init_db(app):
+    """
+    Sets up Flask-SQLAlchemy and Flask-Migrate for the app, and brings the
+    schema up to date at startup when DB_AUTO_MIGRATE is on.
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _configure_sqlite(app.config))
+            db.engine.dispose()  # connections opened before the listener
+        if app.config['DB_AUTO_MIGRATE']:
+            upgrade_schema()
+
+
+def upgrade_schema():
+    """
+    Applies pending migrations. A database created by create_all() before
+    migrations existed is stamped with the baseline revision first, so its
+    tables aren't created twice. Must run inside an app context.
+    """
+    tables = inspect(db.engine).get_table_names()
+    if 'alembic_version' not in tables and 'submission' in tables:
+        stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+    upgrade(directory=MIGRATIONS_DIR)
+
+
+def reset_schema():
+    """
+    Drops every table, including the migration history, and migrates an
+    empty database back to the latest schema.
+    """
+    db.drop_all()
+    with db.engine.begin() as connection:
+        connection.execute(text('DROP TABLE IF EXISTS alembic_version'))
+    upgrade(directory=MIGRATIONS_DIR)
@@ -0,0 +1,302 @@
+"""
+Small derivatives of stored blobs for reviewing submissions without
+downloading the original: image and video thumbnails ('thumb'), video poster
+frames ('poster') and low-bitrate preview clips of video and audio
+('preview').
+
+Derivatives are made on first request and cached on disk by (content hash,
+variant) as <DERIVATIVE_FOLDER>/ab/<hash>/<variant>-<settings>.<ext>, so
+identical uploads share them whichever form they were submitted to. The
+settings tag changes whenever the settings that shape a variant do, so a
+cached file never goes stale behind an immutable URL. Thumbnails and posters
+are made inline; preview clips are transcoded in the background while the
+client retries. Once the cache outgrows DERIVATIVE_CACHE_MAX_BYTES, the least
+recently used files are evicted.
+"""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image, ImageOps
+from cache import LRUCache
+from probe_executor import ProbeExecutor
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Variant = namedtuple('Variant', 'extension mime_type background')
+
+# variant -> MIME family -> how it is stored and made
+VARIANTS = {
+    'thumb': {'image': Variant('jpg', 'image/jpeg', False), 'video': Variant('jpg', 'image/jpeg', False)},
+    'poster': {'video': Variant('jpg', 'image/jpeg', False)},
+    'preview': {'video': Variant('mp4', 'video/mp4', True), 'audio': Variant('m4a', 'audio/mp4', True)},
+}
+
+# Failed derivatives (corrupt media, timeouts) aren't retried for this long
+_FAILURE_TTL = 300
+
+# A cache hit refreshes the file's mtime, which orders eviction, at most this often
+_TOUCH_INTERVAL = 3600
+
+# Eviction deletes down to this fraction of the limit, so it doesn't run on every miss
+_EVICT_TO = 0.9
+
+# Video frames are taken this far in, past fade-ins and black first frames
+_FRAME_SECONDS = 1.0
+
+
+class DerivativeError(Exception):
+    pass
+
+
+def variant_for(variant, mime_type):
+    """
+    Returns how `variant` is made for a file of `mime_type`, or None if it
+    doesn't apply (a poster of an image, a preview of a PDF).
+    """
+    return VARIANTS.get(variant, {}).get(metrics.mime_family(mime_type))
+
+
+class Derivatives:
+    """
+    The derivative cache for an app. See the module docstring.
+
+    ffmpeg runs through a ProbeExecutor of its own, with room for
+    DERIVATIVE_WORKERS background transcodes plus as many inline frame grabs,
+    so previews never hold up validation probes or thumbnails.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.folder = config['DERIVATIVE_FOLDER'] or os.path.join(config['UPLOAD_FOLDER'], '.derivatives')
+        self.max_bytes = config['DERIVATIVE_CACHE_MAX_BYTES']
+        self.timeout = config['DERIVATIVE_TIMEOUT_SECONDS'] or None
+        self.settings = {
+            'thumb': (config['THUMBNAIL_SIZE'],),
+            'poster': (config['POSTER_SIZE'],),
+            'preview': (config['PREVIEW_MAX_SECONDS'], config['PREVIEW_HEIGHT'],
+                        config['PREVIEW_VIDEO_BITRATE'], config['PREVIEW_AUDIO_BITRATE']),
+        }
+        workers = config['DERIVATIVE_WORKERS']
+        self.executor = ProbeExecutor(max_workers=workers * 2)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives')
+        self._pending = {}
+        self._failures = LRUCache(maxsize=1024, ttl=_FAILURE_TTL)
+        self._lock = threading.Lock()
+        self._evicting = threading.Lock()
+        # Bytes cached, as this process knows it; corrected by every eviction scan
+        self._usage = None
+        app.extensions['derivatives'] = self
+
+    def tag(self, variant):
+        """Short digest of the settings that shape `variant`."""
+        return hashlib.sha1(repr(self.settings[variant]).encode()).hexdigest()[:8]
+
+    def etag(self, file_hash, variant):
+        return f'{file_hash}-{variant}-{self.tag(variant)}'
+
+    def path(self, file_hash, variant, spec):
+        return os.path.join(self.folder, file_hash[:2], file_hash, f'{variant}-{self.tag(variant)}.{spec.extension}')
+
+    def get(self, file_hash, source_path, mime_type, variant):
+        """
+        Returns ('ready', path) once the derivative is cached, ('pending', None)
+        while a background transcode makes it, or ('failed', message).
+        The variant must apply to the MIME type (see variant_for).
+        """
+        spec = variant_for(variant, mime_type)
+        path = self.path(file_hash, variant, spec)
+        try:
+            if time.time() - os.stat(path).st_mtime > _TOUCH_INTERVAL:
+                os.utime(path)
+            metrics.DERIVATIVES.inc(variant=variant, result='hit')
+            return 'ready', path
+        except FileNotFoundError:
+            pass
+
+        key = (file_hash, variant)
+        failure = self._failures.get(key)
+        if failure is not None:
+            return 'failed', failure
+
+        future = self._run(key, lambda: self._make(source_path, mime_type, variant, path), spec.background)
+        if spec.background and not future.done():
+            return 'pending', None
+        error = future.exception()
+        if error is not None:
+            return 'failed', str(error)
+        return 'ready', path
+
+    def discard(self, file_hash):
+        """
+        Deletes every derivative of a blob, once the blob itself is deleted.
+        """
+        shutil.rmtree(os.path.join(self.folder, file_hash[:2], file_hash), ignore_errors=True)
+
+    # --- Generation ---
+
+    def _run(self, key, job, background):
+        """
+        Runs job() once for `key` at a time, inline or in the background pool.
+        Concurrent callers get the same Future.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            leader = future is None
+            if leader:
+                future = self._pending[key] = Future()
+        if leader:
+            if background:
+                self._pool.submit(self._complete, key, future, job)
+            else:
+                self._complete(key, future, job)
+        return future
+
+    def _complete(self, key, future, job):
+        variant = key[1]
+        start = time.perf_counter()
+        try:
+            job()
+        except Exception as e:
+            if not isinstance(e, DerivativeError):
+                logger.exception('Making the %s of %s failed', variant, key[0])
+            self._failures.set(key, str(e))
+            metrics.DERIVATIVES.inc(variant=variant, result='failed')
+            future.set_exception(e)
+        else:
+            metrics.DERIVATIVES.inc(variant=variant, result='generated')
+            metrics.DERIVATIVE_DURATION.observe(time.perf_counter() - start, variant=variant)
+            future.set_result(None)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _make(self, source_path, mime_type, variant, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stem, extension = os.path.splitext(path)
+        # The real extension stays last so ffmpeg picks the right muxer
+        temp_path = f'{stem}.{os.getpid()}-{threading.get_ident()}.tmp{extension}'
+        try:
+            family = metrics.mime_family(mime_type)
+            if family == 'image':
+                self._thumbnail(source_path, temp_path)
+            elif variant == 'preview':
+                self._ffmpeg(self._preview_args(source_path, family, temp_path))
+            else:
+                self._frame(source_path, variant, temp_path)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._account(size)
+
+    def _thumbnail(self, source_path, temp_path):
+        size = self.settings['thumb'][0]
+        try:
+            with Image.open(source_path) as img:
+                # JPEGs are decoded at the smallest scale that still covers `size`
+                img.draft('RGB', (size, size))
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((size, size))
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    img = img.convert('RGBA')
+                    background = Image.new('RGB', img.size, 'white')
+                    background.paste(img, mask=img.getchannel('A'))
+                    img = background
+                elif img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img.save(temp_path, 'JPEG', quality=80, optimize=True)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise DerivativeError(f'Cannot read image: {e}')
+
+    def _frame(self, source_path, variant, temp_path):
+        size = self.settings[variant][0]
+        scale = f"scale='min(iw,{size})':'min(ih,{size})':force_original_aspect_ratio=decrease"
+        for seek in (_FRAME_SECONDS, 0):
+            self._ffmpeg(['-ss', str(seek), '-i', source_path, '-frames:v', '1', '-vf', scale, '-q:v', '4', temp_path])
+            if os.path.exists(temp_path) and os.path.getsize(temp_path):
+                return
+            # Shorter than _FRAME_SECONDS; take the first frame instead
+        raise DerivativeError('No video frame found')
+
+    def _preview_args(self, source_path, family, temp_path):
+        seconds, height, video_bitrate, audio_bitrate = self.settings['preview']
+        args = ['-i', source_path, '-t', str(seconds)]
+        if family == 'video':
+            args += ['-map', '0:v:0', '-map', '0:a:0?',
+                     '-vf', f"scale=-2:'2*trunc(min(ih,{height})/2)'", '-pix_fmt', 'yuv420p',
+                     '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', video_bitrate,
+                     '-maxrate', video_bitrate, '-bufsize', video_bitrate]
+        else:
+            args += ['-map', '0:a:0', '-vn']
+        return args + ['-c:a', 'aac', '-b:a', audio_bitrate, '-ac', '2', '-movflags', '+faststart', temp_path]
+
+    def _ffmpeg(self, args):
+        try:
+            returncode, _, stderr = self.executor.run(['ffmpeg', '-v', 'error', '-nostdin', '-y'] + args, self.timeout)
+        except FileNotFoundError:
+            raise DerivativeError('ffmpeg is not installed')
+        except subprocess.TimeoutExpired:
+            raise DerivativeError(f'ffmpeg timed out after {self.timeout}s')
+        if returncode != 0:
+            raise DerivativeError(f'ffmpeg error: {stderr.strip()[-500:]}')
+
+    # --- Size bound ---
+
+    def _account(self, size):
+        with self._lock:
+            if self._usage is not None:
+                self._usage += size
+            over = self._usage is None or self._usage > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """
+        Deletes the least recently used derivatives until the cache is back
+        under _EVICT_TO of its limit, and recounts its size.
+        """
+        if not self._evicting.acquire(blocking=False):
+            return  # Another thread is already at it
+        try:
+            entries = []
+            for directory, _, names in os.walk(self.folder):
+                for name in names:
+                    if '.tmp.' in name:
+                        continue  # Still being written
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes * _EVICT_TO:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass  # Discarded with its blob meanwhile
+                    total -= size
+                    try:
+                        os.rmdir(os.path.dirname(path))  # Only once the blob has no derivatives left
+                    except OSError:
+                        pass
+            with self._lock:
+                self._usage = total
+        finally:
+            self._evicting.release()
@@ -0,0 +1,72 @@
+import io
+import csv
+import json
+from datetime import datetime
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+# Rows are gathered into chunks of about this size before being yielded,
+# so the WSGI server isn't handed one tiny write per row
+_CHUNK_SIZE = 64 * 1024
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _chunked(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= _CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(columns, rows):
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render(columns)
+    for row in rows:
+        yield render(['' if value is None else _plain(value) for value in row])
+
+
+def _ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({c: _plain(v) for c, v in zip(columns, row)}) + '\n'
+
+
+def _json_lines(columns, rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps({c: _plain(v) for c, v in zip(columns, row)})
+        separator = ',\n'
+    yield '[]\n' if separator == '[' else ']\n'
+
+
+def stream_rows(fmt, columns, rows):
+    """
+    Generates an export of `rows` (tuples ordered like `columns`) as text
+    chunks in the given format: csv (with a header row), ndjson or a JSON
+    array. `rows` is consumed lazily.
+    """
+    lines = {'csv': _csv_lines, 'ndjson': _ndjson_lines, 'json': _json_lines}[fmt]
+    return _chunked(lines(columns, rows))
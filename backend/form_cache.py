@@ -0,0 +1,104 @@
+import time
+from cache import LRUCache
+from models import db, Form
+
+# Form snapshots keyed by ('id', form_id) and ('code', code). Entries expire
+# after FORM_CACHE_TTL seconds and are dropped by invalidate() when the form
+# changes in this process. Other processes bump Form.version when they edit a
+# form. A hit is checked against it at most every FORM_CACHE_REVALIDATE_SECONDS,
+# so most hits cost no query and an edit elsewhere is seen within that time.
+_memory = LRUCache(maxsize=1024, ttl=60)
+_revalidate_after = 5
+_stale = 0
+
+
+class CachedForm:
+    """
+    Read-only snapshot of a Form that can be shared between requests and
+    threads. Has the attributes the submit path needs, plus to_dict().
+    """
+    __slots__ = ('id', 'code', 'version', 'constraints', 'constraints_version', 'allow_multiple_submissions',
+                 'max_submissions', 'opens_at', 'closes_at', 'created_by', '_data', 'checked_at')
+
+    def __init__(self, form):
+        # When the version was last known to match the database
+        self.checked_at = time.monotonic()
+        self.id = form.id
+        self.code = form.code
+        self.version = form.version
+        self.constraints = form.constraints
+        self.constraints_version = form.constraints_version
+        self.allow_multiple_submissions = form.allow_multiple_submissions
+        self.max_submissions = form.max_submissions
+        self.opens_at = form.opens_at
+        self.closes_at = form.closes_at
+        self.created_by = form.created_by
+        self._data = form.to_dict()
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def init_app(app):
+    """
+    Sizes the cache from FORM_CACHE_SIZE, FORM_CACHE_TTL and
+    FORM_CACHE_REVALIDATE_SECONDS. Called once by create_app().
+    """
+    global _revalidate_after
+    _memory.maxsize = app.config['FORM_CACHE_SIZE']
+    _memory.ttl = app.config['FORM_CACHE_TTL']
+    _revalidate_after = app.config['FORM_CACHE_REVALIDATE_SECONDS']
+
+
+def _lookup(key, load):
+    global _stale
+    cached = _memory.get(key)
+    if cached is not None:
+        now = time.monotonic()
+        if now - cached.checked_at < _revalidate_after:
+            return cached
+        version = db.session.query(Form.version).filter(Form.id == cached.id).scalar()
+        if version == cached.version:
+            cached.checked_at = now
+            return cached
+        _stale += 1
+        invalidate(cached)
+
+    form = load()
+    if form is None:
+        return None
+    snapshot = CachedForm(form)
+    _memory.set(('id', snapshot.id), snapshot)
+    _memory.set(('code', snapshot.code), snapshot)
+    return snapshot
+
+
+def get_form(form_id):
+    """
+    Returns a CachedForm for the id, or None.
+    """
+    return _lookup(('id', form_id), lambda: db.session.get(Form, form_id))
+
+
+def get_form_by_code(code):
+    """
+    Returns a CachedForm for the share code, or None.
+    """
+    return _lookup(('code', code), lambda: Form.query.filter_by(code=code).first())
+
+
+def invalidate(form):
+    """
+    Drops a form's entries. Pass the form as it was before the change, so
+    the entry under its old code goes too.
+    """
+    _memory.pop(('id', form.id))
+    _memory.pop(('code', form.code))
+
+
+def clear():
+    _memory.clear()
+
+
+def stats():
+    return dict(_memory.stats(), stale=_stale)
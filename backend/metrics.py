@@ -0,0 +1,265 @@
+"""
+In-process metrics, served in the Prometheus text format at GET /metrics.
+
+Recording a value is a dict lookup and a few additions under a lock; nothing
+is formatted until /metrics is scraped, so the cost when nobody scrapes is
+close to nil. Numbers are per process: with several worker processes, give
+each its own scrape target.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Response, current_app, g, request, has_request_context
+from sqlalchemy import event
+
+_registry = []
+_collectors = []
+
+# Seconds; from a cached form lookup to a large upload or a full ffprobe run
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, self.labelnames, key, value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (the last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        names = self.labelnames + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                yield f'{self.name}_bucket', names, key + (_number(bound),), cumulative
+            yield f'{self.name}_sum', self.labelnames, key, total
+            yield f'{self.name}_count', self.labelnames, key, cumulative
+
+
+def register_collector(collect):
+    """
+    Adds a function called at scrape time, for values that already live
+    elsewhere (cache and executor stats). It yields
+    (name, type, help, [(labels dict, value)]).
+    """
+    if collect not in _collectors:
+        _collectors.append(collect)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        samples = list(metric.samples())
+        if not samples:
+            continue
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labelnames, values, value in samples:
+            lines.append(f'{name}{_labels(labelnames, values)} {_number(value)}')
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- Requests ---
+
+HTTP_REQUESTS = Counter('portal_http_requests_total', 'HTTP requests by route and status.',
+                        ('method', 'route', 'status'))
+HTTP_DURATION = Histogram('portal_http_request_duration_seconds',
+                          'Time from receiving a request to its response being ready.', ('method', 'route'))
+HTTP_QUERIES = Histogram('portal_http_request_db_queries', 'Database statements executed per request.',
+                         ('route',), buckets=QUERY_COUNT_BUCKETS)
+
+# --- Submission pipeline ---
+
+STAGE_DURATION = Histogram('portal_submit_stage_duration_seconds',
+                           'Time spent in each stage of a submission: upload_body (receiving, parsing, hashing '
+                           'and writing a streamed upload), db_commit and validate.', ('stage',))
+HASHED_BYTES = Counter('portal_hash_bytes_total', 'Bytes hashed on the way into the blob store.')
+HASH_SECONDS = Counter('portal_hash_seconds_total', 'Time spent hashing those bytes.')
+UPLOADS = Counter('portal_uploads_total',
+                  'Files received, by whether the blob was new, already stored, or matched by preflight without upload.',
+                  ('result',))
+BYTES_STORED = Counter('portal_storage_bytes_stored_total', 'Bytes of new blobs written to the store.')
+BYTES_DELETED = Counter('portal_storage_bytes_deleted_total',
+                        'Bytes of blobs and stale staging files deleted from the upload folder.')
+PROBE_DURATION = Histogram('portal_probe_duration_seconds', 'Media probes that missed the probe cache.',
+                           ('family', 'tool'))
+PROBE_LOOKUPS = Counter('portal_probe_cache_lookups_total', 'Probe cache lookups.', ('result',))
+VALIDATIONS = Counter('portal_validations_total', 'Validation outcomes by MIME family.', ('family', 'result'))
+DERIVATIVES = Counter('portal_derivatives_total', 'Thumbnail and preview requests served from cache, generated or failed.',
+                      ('variant', 'result'))
+DERIVATIVE_DURATION = Histogram('portal_derivative_duration_seconds', 'Time to make a thumbnail or preview.',
+                                ('variant',))
+
+
+def mime_family(mime_type):
+    """'video/mp4' -> 'video'. Keeps label values to a handful."""
+    family = (mime_type or '').split('/', 1)[0]
+    return family if family in ('image', 'video', 'audio', 'text', 'application') else 'other'
+
+
+def record_blob(size, is_new):
+    UPLOADS.inc(result='new' if is_new else 'duplicate')
+    if is_new:
+        BYTES_STORED.inc(size)
+
+
+def record_hash(size, seconds):
+    HASHED_BYTES.inc(size)
+    HASH_SECONDS.inc(seconds)
+
+
+def record_request(method, route, status, seconds, queries=None):
+    HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+    HTTP_DURATION.observe(seconds, method=method, route=route)
+    if queries is not None:
+        HTTP_QUERIES.observe(queries, route=route)
+
+
+def _route():
+    # The rule, not the path, so IDs don't become label values
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _cache_stats():
+    import form_cache
+    import probe_cache
+    import user_cache
+    caches = {'forms': form_cache.stats(), 'users': user_cache.stats(), 'probes': probe_cache.stats()}
+    for stat, kind, help in (('hits', 'counter', 'In-process cache hits.'),
+                             ('misses', 'counter', 'In-process cache misses.'),
+                             ('evictions', 'counter', 'In-process cache evictions.'),
+                             ('size', 'gauge', 'Entries held by in-process caches.')):
+        suffix = '' if kind == 'gauge' else '_total'
+        yield (f'portal_cache_{stat}{suffix}', kind, help,
+               [({'cache': name}, stats[stat]) for name, stats in caches.items()])
+
+
+class Metrics:
+    """
+    Times every request, counts its database statements, and serves
+    GET /metrics. With METRICS_TOKEN set, scrapes must send it as a bearer token.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/metrics', 'metrics', self._serve, methods=['GET'])
+        register_collector(_cache_stats)
+        register_collector(self._executor_stats)
+
+        from models import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count_query)
+
+    @staticmethod
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_metrics_start' in g:
+            g._metrics_queries += 1
+
+    @staticmethod
+    def _start():
+        g._metrics_start = time.perf_counter()
+        g._metrics_queries = 0
+
+    @staticmethod
+    def _finish(response):
+        # Requests that skipped before_request (the ASGI upload path) record themselves
+        if '_metrics_start' in g:
+            record_request(request.method, _route(), response.status_code,
+                           time.perf_counter() - g.pop('_metrics_start'), g.pop('_metrics_queries'))
+        return response
+
+    @staticmethod
+    def _executor_stats():
+        stats = current_app.extensions['probe_executor'].stats()
+        yield ('portal_probe_processes', 'gauge', 'ffprobe processes running and waiting for a slot.',
+               [({'state': 'running'}, stats['running']), ({'state': 'queued'}, stats['queued'])])
+        yield ('portal_probe_timeouts_total', 'counter', 'ffprobe runs killed for taking too long.',
+               [({}, stats['timeouts'])])
+        yield ('portal_probe_coalesced_total', 'counter', 'Probes that joined an identical one already running.',
+               [({}, stats['coalesced'])])
+
+    @staticmethod
+    def _serve():
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
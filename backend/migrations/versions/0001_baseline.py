@@ -0,0 +1,85 @@
+"""Baseline schema, as created by db.create_all() before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('username', sa.String(length=64), nullable=True),
+        sa.Column('email', sa.String(length=120), nullable=True),
+        sa.Column('display_name', sa.String(length=128), nullable=True),
+        sa.Column('bio', sa.Text(), nullable=True),
+        sa.Column('is_deleted', sa.Boolean(), nullable=True),
+        sa.Column('password_hash', sa.String(length=128), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_user_username', 'user', ['username'], unique=True)
+    op.create_index('ix_user_email', 'user', ['email'], unique=True)
+
+    op.create_table('form',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('title', sa.String(length=128), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('code', sa.String(length=10), nullable=True),
+        sa.Column('constraints', sa.JSON(), nullable=True),
+        sa.Column('allow_multiple_submissions', sa.Boolean(), nullable=True),
+        sa.Column('max_submissions', sa.Integer(), nullable=True),
+        sa.Column('opens_at', sa.DateTime(), nullable=True),
+        sa.Column('closes_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.String(length=36), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_form_code', 'form', ['code'], unique=True)
+
+    op.create_table('submission',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('form_id', sa.String(length=36), nullable=True),
+        sa.Column('submitted_by', sa.String(length=36), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('filename', sa.String(length=256), nullable=True),
+        sa.Column('file_path', sa.String(length=512), nullable=True),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('mime_type', sa.String(length=128), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('metadata_json', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['form_id'], ['form.id']),
+        sa.ForeignKeyConstraint(['submitted_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    op.create_table('submission_validation_result',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('submission_id', sa.String(length=36), nullable=True),
+        sa.Column('passed', sa.Boolean(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['submission_id'], ['submission.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('submission_validation_result')
+    op.drop_table('submission')
+    op.drop_index('ix_form_code', table_name='form')
+    op.drop_table('form')
+    op.drop_index('ix_user_email', table_name='user')
+    op.drop_index('ix_user_username', table_name='user')
+    op.drop_table('user')
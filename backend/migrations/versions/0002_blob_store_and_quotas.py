@@ -0,0 +1,125 @@
+"""Blob store, resumable uploads, probe cache, submission quotas, form versions
+
+Databases that ran newer code before migrations existed may already have
+some of these tables (create_all() adds missing tables but never columns),
+so each step checks the live schema first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _has_table(name):
+    return name in _inspector().get_table_names()
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in _inspector().get_columns(table)}
+
+
+def _has_index(table, name):
+    return name in {i['name'] for i in _inspector().get_indexes(table)}
+
+
+def _has_foreign_key(table, column):
+    return any(fk['constrained_columns'] == [column] for fk in _inspector().get_foreign_keys(table))
+
+
+def upgrade():
+    if not _has_column('form', 'version'):
+        with op.batch_alter_table('form') as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    if not _has_table('blob'):
+        op.create_table('blob',
+            sa.Column('hash', sa.String(length=64), nullable=False),
+            sa.Column('size_bytes', sa.BigInteger(), nullable=True),
+            sa.Column('mime_type', sa.String(length=128), nullable=True),
+            sa.Column('refcount', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('hash')
+        )
+    # Every stored hash needs a row before the foreign key below can exist
+    op.execute(
+        "INSERT INTO blob (hash, size_bytes, mime_type, refcount, created_at) "
+        "SELECT file_path, MAX(size_bytes), MAX(mime_type), COUNT(*), CURRENT_TIMESTAMP FROM submission "
+        "WHERE file_path IS NOT NULL AND file_path NOT IN (SELECT hash FROM blob) GROUP BY file_path")
+
+    if not _has_table('upload_session'):
+        op.create_table('upload_session',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('form_id', sa.String(length=36), nullable=True),
+            sa.Column('submitted_by', sa.String(length=36), nullable=True),
+            sa.Column('filename', sa.String(length=256), nullable=True),
+            sa.Column('mime_type', sa.String(length=128), nullable=True),
+            sa.Column('size_bytes', sa.Integer(), nullable=True),
+            sa.Column('chunk_size', sa.Integer(), nullable=True),
+            sa.Column('received_bytes', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['form_id'], ['form.id']),
+            sa.ForeignKeyConstraint(['submitted_by'], ['user.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if not _has_table('probe_result'):
+        op.create_table('probe_result',
+            sa.Column('content_hash', sa.String(length=64), nullable=False),
+            sa.Column('tool', sa.String(length=16), nullable=False),
+            sa.Column('data', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('content_hash', 'tool')
+        )
+
+    if not _has_table('submission_quota'):
+        op.create_table('submission_quota',
+            sa.Column('form_id', sa.String(length=36), nullable=False),
+            sa.Column('user_id', sa.String(length=36), nullable=False),
+            sa.Column('used', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['form_id'], ['form.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('form_id', 'user_id')
+        )
+        op.execute(
+            "INSERT INTO submission_quota (form_id, user_id, used) "
+            "SELECT form_id, submitted_by, COUNT(*) FROM submission "
+            "WHERE submitted_by IS NOT NULL AND file_path IS NOT NULL AND status != 'rejected' "
+            "GROUP BY form_id, submitted_by")
+
+    if not _has_index('submission', 'ix_submission_form_created'):
+        op.create_index('ix_submission_form_created', 'submission', ['form_id', 'created_at', 'id'])
+    if not _has_index('submission', 'ix_submission_submitter_created'):
+        op.create_index('ix_submission_submitter_created', 'submission', ['submitted_by', 'created_at', 'id'])
+
+    if not _has_foreign_key('submission', 'file_path'):
+        # SQLite can't add a constraint in place; batch mode rebuilds the table
+        with op.batch_alter_table('submission') as batch_op:
+            batch_op.create_foreign_key('fk_submission_file_path_blob', 'blob', ['file_path'], ['hash'])
+
+
+def downgrade():
+    with op.batch_alter_table('submission') as batch_op:
+        batch_op.drop_constraint('fk_submission_file_path_blob', type_='foreignkey')
+    op.drop_index('ix_submission_submitter_created', table_name='submission')
+    op.drop_index('ix_submission_form_created', table_name='submission')
+    op.drop_table('submission_quota')
+    op.drop_table('probe_result')
+    op.drop_table('upload_session')
+    op.drop_table('blob')
+    with op.batch_alter_table('form') as batch_op:
+        batch_op.drop_column('version')
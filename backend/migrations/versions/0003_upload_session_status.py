@@ -0,0 +1,26 @@
+"""Upload session status, so only one /complete call finalizes an upload
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_session') as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=16), nullable=False, server_default='uploading'))
+
+
+def downgrade():
+    with op.batch_alter_table('upload_session') as batch_op:
+        batch_op.drop_column('status')
@@ -0,0 +1,26 @@
+"""Indexes for keyset pagination of a form's submissions by size and filename
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 15:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_submission_form_size', 'submission', ['form_id', 'size_bytes', 'id'])
+    op.create_index('ix_submission_form_filename', 'submission', ['form_id', 'filename', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_submission_form_filename', table_name='submission')
+    op.drop_index('ix_submission_form_size', table_name='submission')
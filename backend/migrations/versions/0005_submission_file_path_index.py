@@ -0,0 +1,24 @@
+"""Index submissions by blob, for the collector's reference scan and recheck
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 16:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_submission_file_path', 'submission', ['file_path'])
+
+
+def downgrade():
+    op.drop_index('ix_submission_file_path', table_name='submission')
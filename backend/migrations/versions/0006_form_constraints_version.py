@@ -0,0 +1,27 @@
+"""Form.constraints_version, so type lists are only enforced on forms saved since
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing forms keep version 1: only customExtensions is checked for them
+    with op.batch_alter_table('form') as batch_op:
+        batch_op.add_column(sa.Column('constraints_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('form') as batch_op:
+        batch_op.drop_column('constraints_version')
@@ -6,6 +6,42 @@ import json
 
 db = SQLAlchemy()
 
+def insert_or_ignore(model, **values):
+    """
+    Inserts a row unless one with the same primary key exists, without raising
+    IntegrityError when concurrent writers race on the same key.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        db.session.merge(model(**values))
+        return
+    db.session.execute(insert(model).values(**values).on_conflict_do_nothing())
+
+def upsert_increment(model, column, amount=1, **values):
+    """
+    Inserts a row, or adds `amount` to `column` if its primary key exists,
+    as a single atomic statement where the dialect supports it.
+    """
+    dialect = db.session.get_bind().dialect.name
+    pk = [c.name for c in model.__table__.primary_key]
+    target = getattr(model, column)
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model).values(**values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=pk, set_={column: target + amount}))
+        return
+    insert_or_ignore(model, **{**values, column: 0})
+    db.session.execute(
+        db.update(model).where(*[getattr(model, k) == values[k] for k in pk])
+        .values({column: target + amount}).execution_options(synchronize_session=False))
+
 class User(UserMixin, db.Model):
     id = db.Column(db.String(36), primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
@@ -32,6 +68,11 @@ class User(UserMixin, db.Model):
             'isDeleted': self.is_deleted
         }
 
+# Constraints schema that new and re-saved forms are stored with.
+#   1: only customExtensions limits file types
+#   2: allowedTypes / allowedExtensions are enforced too, unless allowAllTypes
+CONSTRAINTS_VERSION = 2
+
 class Form(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     title = db.Column(db.String(128))
@@ -44,6 +85,10 @@ class Form(db.Model):
     closes_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(36), db.ForeignKey('user.id'))
+    # Incremented on every edit; lets each process spot stale cached copies
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # See CONSTRAINTS_VERSION; forms from before it was introduced are version 1
+    constraints_version = db.Column(db.Integer, nullable=False, default=CONSTRAINTS_VERSION, server_default='1')
 
     def to_dict(self):
         return {
@@ -60,13 +105,33 @@ class Form(db.Model):
             'createdBy': self.created_by
         }
 
+class Blob(db.Model):
+    """
+    A stored file, named by its SHA-256. refcount is the number of submissions
+    pointing at it; the file is deleted when it drops to zero.
+    """
+    hash = db.Column(db.String(64), primary_key=True)
+    size_bytes = db.Column(db.BigInteger)
+    mime_type = db.Column(db.String(128))
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SubmissionQuota(db.Model):
+    """
+    Live (processing or accepted) submissions per user and form, kept in step
+    with Submission inserts so limits are checked without counting rows.
+    """
+    form_id = db.Column(db.String(36), db.ForeignKey('form.id'), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    used = db.Column(db.Integer, default=0, nullable=False)
+
 class Submission(db.Model):
     id = db.Column(db.String(36), primary_key=True)
     form_id = db.Column(db.String(36), db.ForeignKey('form.id'))
     submitted_by = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=True)
     status = db.Column(db.String(20), default='processing') # processing, accepted, rejected
     filename = db.Column(db.String(256))
-    file_path = db.Column(db.String(512))  # Relative path to the uploaded file
+    file_path = db.Column(db.String(512), db.ForeignKey('blob.hash'))  # Hash of the stored blob
     size_bytes = db.Column(db.Integer)
     mime_type = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -74,23 +139,91 @@ class Submission(db.Model):
     # Metadata extracted from file (stored as JSON for flexibility)
     metadata_json = db.Column(db.JSON, nullable=True)
 
+    __table_args__ = (
+        # Keyset pagination of a form's / a user's submissions by (created_at, id)
+        db.Index('ix_submission_form_created', 'form_id', 'created_at', 'id'),
+        db.Index('ix_submission_submitter_created', 'submitted_by', 'created_at', 'id'),
+        # ... and of a form's submissions by the other sortable columns
+        db.Index('ix_submission_form_size', 'form_id', 'size_bytes', 'id'),
+        db.Index('ix_submission_form_filename', 'form_id', 'filename', 'id'),
+        # References to a blob, for the collector (see blob_gc.py)
+        db.Index('ix_submission_file_path', 'file_path'),
+    )
+
+    # API field name -> column attribute, in to_dict() order
+    FIELDS = {
+        'id': 'id',
+        'formId': 'form_id',
+        'submittedBy': 'submitted_by',
+        'status': 'status',
+        'filename': 'filename',
+        'filePath': 'file_path',
+        'sizeBytes': 'size_bytes',
+        'mimeType': 'mime_type',
+        'createdAt': 'created_at',
+        'metadata': 'metadata_json'
+    }
+
+    def to_dict(self, fields=None):
+        """
+        Serializes the submission. `fields` limits the output to those API
+        field names; only their columns are touched, so rows loaded with
+        load_only() don't trigger extra queries.
+        """
+        data = {}
+        for field in fields or self.FIELDS:
+            value = getattr(self, self.FIELDS[field])
+            data[field] = value.isoformat() if field == 'createdAt' else value
+        return data
+
+class SubmissionValidationResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.String(36), db.ForeignKey('submission.id'))
+    passed = db.Column(db.Boolean)
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    """A resumable upload in progress. Chunks are appended in order to a staging file."""
+    id = db.Column(db.String(36), primary_key=True)
+    form_id = db.Column(db.String(36), db.ForeignKey('form.id'))
+    submitted_by = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=True)
+    filename = db.Column(db.String(256))
+    mime_type = db.Column(db.String(128))
+    size_bytes = db.Column(db.Integer)
+    chunk_size = db.Column(db.Integer)
+    received_bytes = db.Column(db.Integer, default=0)
+    # uploading, then completing once a /complete call has claimed it
+    status = db.Column(db.String(16), nullable=False, default='uploading', server_default='uploading')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size_bytes // self.chunk_size))
+
     def to_dict(self):
         return {
             'id': self.id,
             'formId': self.form_id,
-            'submittedBy': self.submitted_by,
-            'status': self.status,
             'filename': self.filename,
-            'filePath': self.file_path,
-            'sizeBytes': self.size_bytes,
             'mimeType': self.mime_type,
-            'createdAt': self.created_at.isoformat(),
-            'metadata': self.metadata_json
+            'sizeBytes': self.size_bytes,
+            'chunkSize': self.chunk_size,
+            'chunkCount': self.chunk_count,
+            'receivedBytes': self.received_bytes,
+            'status': self.status,
+            'nextChunk': self.received_bytes // self.chunk_size,
+            'complete': self.received_bytes >= self.size_bytes,
+            'createdAt': self.created_at.isoformat()
         }
 
-class SubmissionValidationResult(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    submission_id = db.Column(db.String(36), db.ForeignKey('submission.id'))
-    passed = db.Column(db.Boolean)
-    message = db.Column(db.Text)
+class ProbeResult(db.Model):
+    """
+    Media probe output cached per blob. Blobs are content-addressed, so the
+    result for a hash never changes and is shared by every submission of it.
+    """
+    content_hash = db.Column(db.String(64), primary_key=True)
+    tool = db.Column(db.String(16), primary_key=True)  # ffprobe, pillow
+    data = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
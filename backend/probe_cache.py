@@ -0,0 +1,55 @@
+from cache import LRUCache
+from sqlalchemy import delete
+from models import db, ProbeResult, insert_or_ignore
+
+# Probe results keyed by (content_hash, tool). The DB table is the persistent
+# copy shared by all processes; this LRU saves the query on hot blobs.
+_memory = LRUCache(maxsize=1024)
+
+
+def init_app(app):
+    """
+    Sizes the in-process cache from PROBE_CACHE_SIZE. Called once by
+    create_app().
+    """
+    _memory.maxsize = app.config['PROBE_CACHE_SIZE']
+
+
+def lookup(content_hash, tool):
+    """
+    Returns the cached probe data for a blob, or None.
+    """
+    key = (content_hash, tool)
+    data = _memory.get(key)
+    if data is not None:
+        return data
+
+    row = db.session.get(ProbeResult, key)
+    if row is None:
+        return None
+    _memory.set(key, row.data)
+    return row.data
+
+
+def store(content_hash, tool, data):
+    """
+    Records a successful probe. Failures aren't cached since they may be
+    transient (timeouts, missing ffprobe).
+    """
+    _memory.set((content_hash, tool), data)
+    insert_or_ignore(ProbeResult, content_hash=content_hash, tool=tool, data=data)
+    db.session.commit()
+
+
+def discard(content_hash):
+    """
+    Drops the probe results of a deleted blob. The caller commits, so the
+    rows go in the same transaction as the deletion.
+    """
+    for tool in ('ffprobe', 'pillow'):
+        _memory.pop((content_hash, tool))
+    db.session.execute(delete(ProbeResult).where(ProbeResult.content_hash == content_hash))
+
+
+def stats():
+    return _memory.stats()
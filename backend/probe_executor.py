@@ -0,0 +1,132 @@
+import os
+import signal
+import threading
+import subprocess
+from flask import current_app, has_app_context
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProbeExecutor:
+    """
+    Runs external probe commands (ffprobe) with at most PROBE_WORKERS
+    processes at a time; further probes wait for a free slot. Each process is
+    killed if it outlives its timeout. Identical commands already running or
+    queued (the same blob probed for several submissions at once) share one
+    process instead of forking again.
+
+    Keeps counters for monitoring, including the number of probes waiting.
+    """
+
+    def __init__(self, app=None, max_workers=4):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.coalesced = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('PROBE_WORKERS', self.max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        app.extensions['probe_executor'] = self
+
+    def run(self, cmd, timeout=None):
+        """
+        Runs `cmd` and returns (returncode, stdout, stderr) as text.
+        Raises subprocess.TimeoutExpired if it ran longer than `timeout` seconds.
+        """
+        key = tuple(cmd)
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._execute(cmd, timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _execute(self, cmd, timeout):
+        with self._lock:
+            self.queued += 1
+        self._slots.acquire()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            # Own process group, so a kill also reaches anything ffprobe spawned
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                       start_new_session=(os.name == 'posix'))
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._kill(process)
+                process.communicate()
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            return process.returncode, stdout, stderr
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    @staticmethod
+    def _kill(process):
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    def stats(self):
+        return {
+            'maxWorkers': self.max_workers,
+            'running': self.running,
+            'queued': self.queued,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'coalesced': self.coalesced
+        }
+
+
+# Used outside an app context (scripts, benchmarks)
+_default = ProbeExecutor()
+
+
+def get_executor():
+    """
+    Returns the current app's ProbeExecutor, or a process-wide default.
+    """
+    if has_app_context():
+        return current_app.extensions.get('probe_executor', _default)
+    return _default
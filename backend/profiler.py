@@ -0,0 +1,244 @@
+"""
+Opt-in profiling of individual requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, or at
+random with probability PROFILE_SAMPLE_RATE if its endpoint is listed in
+PROFILE_ENDPOINTS. Profiling captures a cProfile CPU profile of the view and
+a log of the SQL statements it ran. Each profile is written to PROFILE_DIR
+as <id>.prof (pstats format, for snakeviz or `python -m pstats`) and
+<id>.json (request, timings, queries and the top functions), and only the
+newest PROFILE_KEEP are kept.
+
+With no token and a zero sample rate no hooks are installed, so requests
+don't pay for it. At most one request per process is profiled at a time,
+since on Python 3.12+ cProfile hooks the process-wide sys.monitoring: while
+one runs, sampled requests go unprofiled and X-Profile requests get a 503
+"Profiler busy" without running. Streamed response bodies (downloads,
+archives, exports) are produced after the profile ends, and direct uploads
+served by asgi.py aren't profiled.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import random
+import cProfile
+import pstats
+import threading
+from datetime import datetime, timezone
+from flask import g, jsonify, request, send_file, abort, has_request_context
+from sqlalchemy import event
+
+# Functions listed in the JSON summary, by cumulative time
+_TOP_FUNCTIONS = 40
+
+# Statements kept in the SQL log of one request
+_MAX_QUERIES = 1000
+
+# Profile ids are <UTC timestamp>-<random>, so they sort oldest first
+_ID_CHARS = set('0123456789abcdefTZ-')
+
+# The /api/profiles endpoints
+_OWN_ENDPOINTS = {'list_profiles', 'get_profile', 'get_profile_pstats'}
+
+# Held while a request is profiled. Module-level rather than per profiler, as
+# cProfile can't run twice at once in one process (sys.monitoring on 3.12+)
+_busy = threading.Lock()
+
+
+class RequestProfiler:
+    """
+    Installs the profiling hooks and the /api/profiles endpoints. See the module docstring.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['profiler'] = self
+        self.token = app.config.get('PROFILE_TOKEN') or ''
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE') or 0.0
+        if not self.token and self.sample_rate <= 0:
+            return
+        self.endpoints = {e.strip() for e in (app.config.get('PROFILE_ENDPOINTS') or '').split(',') if e.strip()}
+        self.directory = app.config['PROFILE_DIR']
+        self.keep = app.config['PROFILE_KEEP']
+        os.makedirs(self.directory, exist_ok=True)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._stop)
+        if self.token:
+            # Reading profiles needs the token too; with sampling alone they stay on disk
+            app.add_url_rule('/api/profiles', 'list_profiles', self._list, methods=['GET'])
+            app.add_url_rule('/api/profiles/<profile_id>', 'get_profile', self._get, methods=['GET'])
+            app.add_url_rule('/api/profiles/<profile_id>/pstats', 'get_profile_pstats', self._get_pstats, methods=['GET'])
+
+        from models import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_query)
+            event.listen(db.engine, 'after_cursor_execute', self._after_query)
+
+    # --- Selection ---
+
+    def _selected(self):
+        if request.endpoint in _OWN_ENDPOINTS:
+            return None  # Reading profiles isn't profiled, or refused while one runs
+        if self.token and self._authorized():
+            return 'header'
+        if self.sample_rate > 0 and request.endpoint in self.endpoints and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def _start(self):
+        trigger = self._selected()
+        if trigger is None:
+            return
+        if not _busy.acquire(blocking=False):
+            return self._refuse(trigger)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, or another sys.monitoring tool) is active
+            _busy.release()
+            return self._refuse(trigger)
+        g._profile = {'profile': profile, 'trigger': trigger, 'queries': [], 'dropped': 0,
+                      'start': time.perf_counter(), 'started_at': datetime.now(timezone.utc)}
+
+    @staticmethod
+    def _refuse(trigger):
+        # Sampled requests just go unprofiled; an explicit request is told to retry
+        if trigger == 'header':
+            response = jsonify({'error': 'Profiler busy'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        return None
+
+    def _finish(self, response):
+        state = g.pop('_profile', None)
+        if state is None:
+            return response
+        try:
+            state['profile'].disable()
+            elapsed = time.perf_counter() - state['start']
+            self._write(state, response.status_code, elapsed)
+        finally:
+            _busy.release()
+        return response
+
+    def _stop(self, exc=None):
+        # after_request didn't run (the response failed to build); discard the profile
+        state = g.pop('_profile', None)
+        if state is not None:
+            state['profile'].disable()
+            _busy.release()
+
+    # --- SQL log ---
+
+    @staticmethod
+    def _before_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_profile' in g:
+            conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_query(conn, cursor, statement, parameters, context, executemany):
+        state = g.get('_profile') if has_request_context() else None
+        starts = conn.info.get('profile_query_start')
+        if state is None or not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if len(state['queries']) >= _MAX_QUERIES:
+            state['dropped'] += 1
+            return
+        # Parameters are left out: they can hold password hashes and personal data
+        state['queries'].append({'sql': statement, 'ms': round(elapsed * 1000, 3),
+                                 'executemany': executemany, 'rows': cursor.rowcount})
+
+    # --- Storage ---
+
+    def _write(self, state, status, elapsed):
+        profile_id = state['started_at'].strftime('%Y%m%dT%H%M%SZ') + '-' + uuid.uuid4().hex[:8]
+        stats = pstats.Stats(state['profile'])
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:_TOP_FUNCTIONS]
+        queries = state['queries']
+        summary = {
+            'id': profile_id,
+            'startedAt': state['started_at'].isoformat(),
+            'trigger': state['trigger'],
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'durationMs': round(elapsed * 1000, 3),
+            'cpuSeconds': round(stats.total_tt, 6),
+            'queryCount': len(queries) + state['dropped'],
+            'queryMs': round(sum(q['ms'] for q in queries), 3),
+            'topFunctions': [
+                {'function': f'{filename}:{line}({name})', 'calls': calls, 'primitiveCalls': primitive,
+                 'totalSeconds': round(total, 6), 'cumulativeSeconds': round(cumulative, 6)}
+                for (filename, line, name), (primitive, calls, total, cumulative, _) in top],
+            'queries': queries,
+        }
+        stats.dump_stats(os.path.join(self.directory, profile_id + '.prof'))
+        temp_path = os.path.join(self.directory, profile_id + '.json.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(summary, f, indent=1)
+        # Listed only once both files are complete
+        os.replace(temp_path, os.path.join(self.directory, profile_id + '.json'))
+        self._trim()
+
+    def _ids(self):
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def _trim(self):
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.keep)]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass  # Trimmed by another worker
+
+    def _path(self, profile_id, suffix):
+        if not set(profile_id) <= _ID_CHARS:
+            abort(404)
+        path = os.path.join(self.directory, profile_id + suffix)
+        if not os.path.exists(path):
+            abort(404)
+        return path
+
+    # --- Endpoints ---
+
+    def _authorized(self):
+        return hmac.compare_digest(request.headers.get('X-Profile', '').encode(), self.token.encode())
+
+    def _list(self):
+        """Newest first: id, request, status, duration and query count of each stored profile."""
+        if not self._authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, profile_id + '.json')) as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue  # Trimmed while listing
+            profiles.append({key: summary[key] for key in (
+                'id', 'startedAt', 'trigger', 'method', 'path', 'endpoint', 'status',
+                'durationMs', 'cpuSeconds', 'queryCount', 'queryMs')})
+        return jsonify({'profiles': profiles, 'keep': self.keep})
+
+    def _get(self, profile_id):
+        if not self._authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        return send_file(self._path(profile_id, '.json'), mimetype='application/json')
+
+    def _get_pstats(self, profile_id):
+        if not self._authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        return send_file(self._path(profile_id, '.prof'), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=profile_id + '.prof')
@@ -0,0 +1,112 @@
+from collections import Counter
+from sqlalchemy import update, delete, select, case, func, bindparam
+from models import db, SubmissionQuota, Submission, insert_or_ignore, upsert_increment
+
+
+def submission_limit(form):
+    """
+    The number of live submissions a user may have on a form, or None for
+    no limit. Rejected submissions don't count.
+    """
+    if not form.allow_multiple_submissions:
+        return 1
+    return form.max_submissions or None
+
+
+def _limit_error(limit):
+    if limit == 1:
+        return 'You have already submitted to this form'
+    return f'Submission limit reached ({limit} per user)'
+
+
+def check_quota(form, user_id):
+    """
+    Cheap pre-check before an upload is received: returns an error message if
+    the user has no submissions left on the form. Advisory only, since
+    concurrent submits can pass it together; claim_quota() decides.
+    """
+    limit = submission_limit(form)
+    if user_id is None or limit is None:
+        return None
+    used = db.session.query(SubmissionQuota.used).filter_by(form_id=form.id, user_id=user_id).scalar()
+    return _limit_error(limit) if (used or 0) >= limit else None
+
+
+def claim_quota(form, user_id):
+    """
+    Takes one of the user's submission slots on the form, in the caller's
+    transaction, so it commits or rolls back together with the Submission
+    insert. A conditional UPDATE on the counter row makes this atomic across
+    threads and processes: concurrent claims queue on the row lock and each
+    sees the previous one's count. Returns an error message if no slot is left.
+
+    Anonymous submissions aren't counted.
+    """
+    if user_id is None:
+        return None
+    limit = submission_limit(form)
+    if limit is None:
+        # Still counted, so adding a limit later starts from the right number
+        upsert_increment(SubmissionQuota, 'used', form_id=form.id, user_id=user_id, used=1)
+        return None
+
+    insert_or_ignore(SubmissionQuota, form_id=form.id, user_id=user_id, used=0)
+    claimed = db.session.execute(
+        update(SubmissionQuota)
+        .where(SubmissionQuota.form_id == form.id, SubmissionQuota.user_id == user_id,
+               SubmissionQuota.used < limit)
+        .values(used=SubmissionQuota.used + 1)
+        .execution_options(synchronize_session=False)).rowcount
+    return None if claimed else _limit_error(limit)
+
+
+def release_quotas(counts):
+    """
+    Gives back submission slots with one batched UPDATE. `counts` maps
+    (form_id, user_id) to the number of slots released.
+    """
+    counts = {k: n for k, n in counts.items() if k[1] and n}
+    if not counts:
+        return
+    quota = SubmissionQuota.__table__
+    db.session.execute(
+        update(quota).where(quota.c.form_id == bindparam('q_form'), quota.c.user_id == bindparam('q_user'))
+        .values(used=case((quota.c.used > bindparam('q_count'), quota.c.used - bindparam('q_count')), else_=0)),
+        [{'q_form': form_id, 'q_user': user_id, 'q_count': n} for (form_id, user_id), n in counts.items()])
+
+
+def count_slots(rows):
+    """
+    Counts the slots held by deleted submissions, from (file_path, form_id,
+    submitted_by, count) rows. Rejected submissions have no file_path and
+    already gave theirs back.
+    """
+    slots = Counter()
+    for file_path, form_id, user_id, n in rows:
+        if file_path and user_id:
+            slots[form_id, user_id] += n
+    return slots
+
+
+def delete_form_quotas(form_id):
+    db.session.execute(delete(SubmissionQuota).where(SubmissionQuota.form_id == form_id)
+                       .execution_options(synchronize_session=False))
+
+
+def rebuild_quotas():
+    """
+    Recomputes every counter from the submission table, e.g. for submissions
+    made before quotas were tracked. Returns the number of counters written.
+    """
+    db.session.execute(delete(SubmissionQuota).execution_options(synchronize_session=False))
+    rows = db.session.execute(
+        select(Submission.form_id, Submission.submitted_by, func.count())
+        .where(Submission.submitted_by.isnot(None), Submission.file_path.isnot(None))
+        .group_by(Submission.form_id, Submission.submitted_by)
+    ).yield_per(500)
+
+    written = 0
+    for form_id, user_id, used in rows:
+        db.session.add(SubmissionQuota(form_id=form_id, user_id=user_id, used=used))
+        written += 1
+    return written
@@ -1,15 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app, send_file, Response, stream_with_context, abort, make_response
 from flask_login import login_required, current_user
-from models import db, Form, Submission, SubmissionValidationResult, User
-from storage import save_file, delete_file
-from validation import validate_submission, get_file_info
+from models import db, Form, Submission, SubmissionValidationResult, User, UploadSession, CONSTRAINTS_VERSION
+from storage import save_file, delete_file, resolve_path, claim_blob, BLOB_NAME
+from blobs import acquire_blob, delete_submissions
+from quotas import check_quota, claim_quota, delete_form_quotas
+from database import reset_schema
+from archive import stream_zip, unique_name
+from export import FORMATS as EXPORT_FORMATS, stream_rows
+from uploads import append_chunk, finalize_upload, forget_chunk_state, discard_upload
+from upload_stream import save_streamed_file, MULTIPART_OVERHEAD
+from validation import get_file_info, probe_tool, check_file_type
+from derivatives import variant_for
+import probe_cache
+import form_cache
+import user_cache
+import metrics
 import uuid
 import os
+import json
+import base64
 import shutil
-from datetime import datetime
+from datetime import datetime, timezone
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_content_range_header
+from werkzeug.utils import secure_filename
 
 api = Blueprint('api', __name__)
 
+def _blob_path(file_path):
+    """On-disk location of a stored blob, given its Submission.file_path (the hash)."""
+    return resolve_path(current_app.config['UPLOAD_FOLDER'], file_path, current_app.config['STORAGE_SHARD_DEPTH'])
+
 @api.route('/api/debug', methods=['GET'])
 def debug():
     return jsonify({
@@ -17,7 +40,13 @@ def debug():
         'backend': 'flask',
         'database': current_app.config['SQLALCHEMY_DATABASE_URI'],
         'upload_folder': current_app.config['UPLOAD_FOLDER'],
-        'cwd': os.getcwd()
+        'cwd': os.getcwd(),
+        'caches': {
+            'forms': form_cache.stats(),
+            'users': user_cache.stats(),
+            'probes': probe_cache.stats()
+        },
+        'probeExecutor': current_app.extensions['probe_executor'].stats()
     })
 
 
@@ -36,8 +65,9 @@ def reset_system():
             shutil.rmtree(upload_folder)
         
         # 2. Drop all tables and recreate them
-        db.drop_all()
-        db.create_all()
+        reset_schema()
+        form_cache.clear()
+        user_cache.clear()
         
         # 3. Recreate upload folder
         if not os.path.exists(upload_folder):
@@ -104,6 +134,7 @@ def update_my_profile():
         current_user.email = data['email']
     
     db.session.commit()
+    user_cache.invalidate(current_user.id)
     return jsonify({
         'name': current_user.username, 
         'email': current_user.email,
@@ -133,6 +164,7 @@ def delete_my_account():
     current_user.is_deleted = True
     
     db.session.commit()
+    user_cache.invalidate(current_user.id)
     logout_user()
     return '', 204
 
@@ -169,7 +201,7 @@ def list_my_forms():
 
 @api.route('/forms/<form_id>', methods=['GET'])
 def get_form(form_id):
-    form = Form.query.get_or_404(form_id)
+    form = _cached_form_or_404(form_cache.get_form(form_id))
     return jsonify(form.to_dict())
 
 @api.route('/forms/<form_id>', methods=['PATCH'])
@@ -182,6 +214,7 @@ def update_form(form_id):
         return jsonify({'error': 'Forbidden'}), 403
     
     data = request.get_json()
+    form_cache.invalidate(form)
     
     # Update allowed fields
     if 'title' in data:
@@ -192,6 +225,8 @@ def update_form(form_id):
         form.code = data['code']
     if 'constraints' in data:
         form.constraints = data['constraints']
+        # Re-saved constraints follow the current schema, type lists included
+        form.constraints_version = CONSTRAINTS_VERSION
     if 'allowMultipleSubmissionsPerUser' in data:
         form.allow_multiple_submissions = data['allowMultipleSubmissionsPerUser']
     if 'maxSubmissionsPerUser' in data:
@@ -200,8 +235,11 @@ def update_form(form_id):
         form.opens_at = datetime.fromisoformat(data['opensAt'].replace('Z', '+00:00')) if data['opensAt'] else None
     if 'closesAt' in data:
         form.closes_at = datetime.fromisoformat(data['closesAt'].replace('Z', '+00:00')) if data['closesAt'] else None
-    
+
+    # Tells other processes their cached copy is stale
+    form.version = Form.version + 1
     db.session.commit()
+    form_cache.invalidate(form)
     return jsonify(form.to_dict())
 
 @api.route('/forms/<form_id>', methods=['DELETE'])
@@ -213,51 +251,32 @@ def delete_form(form_id):
     if form.created_by != current_user.id:
         return jsonify({'error': 'Forbidden'}), 403
     
-    # Delete all associated submissions and their files
-    submissions = Submission.query.filter_by(form_id=form_id).all()
-    
+    # Abandon any resumable uploads still in progress
+    upload_ids = [u.id for u in UploadSession.query.with_entities(UploadSession.id).filter_by(form_id=form_id)]
+    for upload_id in upload_ids:
+        discard_upload(current_app.config['UPLOAD_FOLDER'], upload_id)
+    UploadSession.query.filter_by(form_id=form_id).delete(synchronize_session=False)
+
+    # Bulk-delete submissions; blob refcounts drop in one batched update, and
+    # the collector deletes files no submission references any more
+    delete_submissions(Submission.form_id == form_id)
+    delete_form_quotas(form_id)
 
-    
-    for submission in submissions:
-        if submission.file_path:
-
-            
-            # Count how many submissions use this file
-            usage_count = Submission.query.filter_by(file_path=submission.file_path).count()
-            
-
-            
-            other_uses = Submission.query.filter(
-                Submission.file_path == submission.file_path,
-                Submission.form_id != form_id
-            ).count()
-            
-            if other_uses == 0:
-                pass
-
-    files_to_check = set(s.file_path for s in submissions if s.file_path)
-    
-    for submission in submissions:
-        db.session.delete(submission)
-    
     # Delete the form
     db.session.delete(form)
     db.session.commit()
-    
-    # Now check if files are still used
-    for relative_path in files_to_check:
-        if not relative_path: continue
-        
-        usage_count = Submission.query.filter_by(file_path=relative_path).count()
-        if usage_count == 0:
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
-            delete_file(file_path)
+    form_cache.invalidate(form)
     
     return '', 204
 
+def _cached_form_or_404(form):
+    if form is None:
+        abort(404)
+    return form
+
 @api.route('/forms/code/<code>', methods=['GET'])
 def get_form_by_code(code):
-    form = Form.query.filter_by(code=code).first_or_404()
+    form = _cached_form_or_404(form_cache.get_form_by_code(code))
     return jsonify(form.to_dict())
 
 @api.route('/forms/<form_id>/submissions', methods=['GET'])
@@ -267,19 +286,163 @@ def get_form_submissions(form_id):
     if form.created_by != current_user.id:
         return jsonify({'error': 'Forbidden'}), 403
     
-    submissions = Submission.query.filter_by(form_id=form_id).all()
-    return jsonify({
-        'items': [s.to_dict() for s in submissions],
-        'total': len(submissions),
-        'page': 1,
-        'pageSize': len(submissions)
-    })
+    return _submission_page(Submission.form_id == form_id)
+
+_SORT_COLUMNS = {
+    'createdAt': Submission.created_at,
+    'sizeBytes': Submission.size_bytes,
+    'filename': Submission.filename,
+}
+
+def _parse_datetime(value):
+    """Parse an ISO timestamp from the client into a naive UTC datetime."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _encode_cursor(sort, value, submission_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, submission_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+# JSON type of a cursor's position value, by sort field
+_CURSOR_VALUE_TYPES = {'createdAt': str, 'sizeBytes': int, 'filename': str}
+
+def _decode_cursor(cursor):
+    """
+    Returns the (sort, value, submission_id) a cursor was issued for, with
+    createdAt values parsed back into datetimes. Raises ValueError or
+    TypeError for anything that _encode_cursor couldn't have produced.
+    """
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    sort, value, submission_id = json.loads(raw)
+    value_type = _CURSOR_VALUE_TYPES.get(sort.lstrip('-')) if isinstance(sort, str) else None
+    if (value_type is None or not isinstance(value, value_type) or isinstance(value, bool)
+            or not isinstance(submission_id, str)):
+        raise ValueError('Invalid cursor')
+    if sort.lstrip('-') == 'createdAt':
+        value = datetime.fromisoformat(value)
+    return sort, value, submission_id
+
+def _requested_fields():
+    """
+    Parses the `fields` query parameter (comma-separated Submission.to_dict
+    field names). Returns None when absent; raises ValueError for unknown names.
+    """
+    if not request.args.get('fields'):
+        return None
+    fields = [f for f in request.args['fields'].split(',') if f]
+    unknown = [f for f in fields if f not in Submission.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def _project(query, fields, *required):
+    """Loads only the columns behind `fields` (plus `required` columns)."""
+    if fields is None:
+        return query
+    columns = {getattr(Submission, Submission.FIELDS[f]) for f in fields}
+    columns.update(required)
+    return query.options(load_only(*columns))
+
+def _filter_submissions(query):
+    """
+    Applies the status, mimeType, submittedBy, createdFrom and createdTo
+    query parameters. Raises ValueError for malformed dates.
+    """
+    args = request.args
+    if args.get('status'):
+        query = query.filter(Submission.status.in_(args['status'].split(',')))
+    mime_type = args.get('mimeType')
+    if mime_type:
+        if mime_type.endswith('/*') or mime_type.endswith('/'):
+            query = query.filter(Submission.mime_type.like(mime_type.rstrip('*') + '%'))
+        else:
+            query = query.filter(Submission.mime_type == mime_type)
+    if args.get('submittedBy'):
+        query = query.filter(Submission.submitted_by == args['submittedBy'])
+    if args.get('createdFrom'):
+        query = query.filter(Submission.created_at >= _parse_datetime(args['createdFrom']))
+    if args.get('createdTo'):
+        query = query.filter(Submission.created_at < _parse_datetime(args['createdTo']))
+    return query
+
+def _submission_page(*criteria):
+    """
+    Keyset-paginated listing of the submissions matching `criteria`.
+
+    Query parameters:
+      limit         page size (default 50, max 500)
+      cursor        `nextCursor` from the previous page
+      sort          createdAt, sizeBytes or filename; prefix '-' for descending (default -createdAt)
+      status        comma-separated statuses
+      mimeType      exact type, or a family such as 'video/*'
+      submittedBy   submitter user id
+      createdFrom, createdTo   ISO timestamps (inclusive / exclusive)
+      includeTotal  count all matches (default: first page only)
+      fields        comma-separated fields to return per item (default: all)
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    sort = args.get('sort', '-createdAt')
+    descending = sort.startswith('-')
+    sort_column = _SORT_COLUMNS.get(sort.lstrip('-'))
+    if sort_column is None:
+        return jsonify({'error': f"Cannot sort by {sort.lstrip('-')}"}), 400
+
+    try:
+        fields = _requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        query = _filter_submissions(Submission.query.filter(*criteria))
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+
+    cursor = args.get('cursor')
+    include_total = args.get('includeTotal', 'false' if cursor else 'true').lower() == 'true'
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        try:
+            cursor_sort, value, last_id = _decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if cursor_sort != sort:
+            return jsonify({'error': 'Cursor was issued for a different sort'}), 400
+        position = tuple_(sort_column, Submission.id)
+        query = query.filter(position < tuple_(value, last_id) if descending else position > tuple_(value, last_id))
+
+    order = (sort_column.desc(), Submission.id.desc()) if descending else (sort_column.asc(), Submission.id.asc())
+    rows = _project(query, fields, Submission.id, sort_column).order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, getattr(last, sort_column.key), last.id)
+
+    page = {
+        'items': [s.to_dict(fields) for s in rows],
+        'pageSize': limit,
+        'nextCursor': next_cursor
+    }
+    if total is not None:
+        page['total'] = total
+    return jsonify(page)
 
 # --- Submissions ---
 
 @api.route('/submit/<code>/validate', methods=['GET'])
 def validate_code(code):
-    form = Form.query.filter_by(code=code).first()
+    form = form_cache.get_form_by_code(code)
     if not form:
         return jsonify({'ok': False, 'reason': 'Code not found'})
     
@@ -288,62 +451,414 @@ def validate_code(code):
         return jsonify({'ok': False, 'reason': 'Submissions not open yet', 'form': form.to_dict()})
     if form.closes_at and now > form.closes_at:
         return jsonify({'ok': False, 'reason': 'Submissions closed', 'form': form.to_dict()})
+    quota_error = check_quota(form, _submitter_id())
+    if quota_error:
+        return jsonify({'ok': False, 'reason': quota_error, 'form': form.to_dict()})
         
     return jsonify({'ok': True, 'form': form.to_dict()})
 
 @api.route('/submit/<code>', methods=['POST'])
 def submit_file(code):
-    form = Form.query.filter_by(code=code).first_or_404()
-    
-    # Check if file is present
-    if 'file' not in request.files:
-        return jsonify({'ok': False, 'errors': ['No file part']}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'ok': False, 'errors': ['No selected file']}), 400
+    """
+    Direct upload (multipart/form-data with a `file` part).
 
-    # Save temporarily (or permanently if deduplicated)
+    The body is parsed as it arrives rather than spooled first, so uploads
+    that break the form's size or type constraints are refused with 413/415
+    from Content-Length or the part headers, or as soon as the file passes
+    maxSizeBytes, without receiving the rest. The ASGI server (asgi.py)
+    receives the body itself between begin_direct_upload() and
+    finish_direct_upload() instead of calling this view.
+    """
+    form, refusal = begin_direct_upload(code)
+    if refusal:
+        return refusal
+
+    # Stored as it streams in (or deduplicated against an existing blob). A rejected
+    # submission releases the blob during validation, so is_new isn't needed here.
     try:
-        # save_file now returns (relative_path_hash, original_filename, is_new)
-        saved_filename, original_filename, is_new = save_file(file, current_app.config['UPLOAD_FOLDER'])
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], saved_filename)
+        with metrics.STAGE_DURATION.time(stage='upload_body'):
+            result, error = save_streamed_file(
+                request.stream, request.mimetype_params['boundary'], current_app.config['UPLOAD_FOLDER'],
+                check=upload_check(form),
+                max_size=(form.constraints or {}).get('maxSizeBytes'),
+                buffer_size=current_app.config['UPLOAD_BUFFER_SIZE'],
+                shard_depth=current_app.config['STORAGE_SHARD_DEPTH'])
+    except RequestEntityTooLarge:
+        # The body passed MAX_CONTENT_LENGTH (forms without maxSizeBytes)
+        return _refuse_upload(413, 'Request body too large')
     except Exception as e:
         return jsonify({'ok': False, 'errors': [f'Upload failed: {str(e)}']}), 500
+    return finish_direct_upload(form, result, error)
 
-    # Validate
-    # We pass original_filename for extension validation
-    passed, message, metadata = validate_submission(file_path, file.mimetype, form.constraints or {}, original_filename=original_filename)
+def begin_direct_upload(code):
+    """
+    Checks a direct upload before any of its body is read.
+    Returns (form, None), or (None, response) to refuse it.
+    """
+    form = _cached_form_or_404(form_cache.get_form_by_code(code))
+    max_size = (form.constraints or {}).get('maxSizeBytes')
 
-    if not passed:
-        # Only delete if it was a NEW file. If it was existing (deduplicated), don't delete!
-        if is_new:
-            delete_file(file_path) 
-        return jsonify({'ok': False, 'errors': [message]})
+    quota_error = check_quota(form, _submitter_id())
+    if quota_error:
+        return None, _refuse_upload(409, quota_error)
+    if max_size and request.content_length and request.content_length > max_size + MULTIPART_OVERHEAD:
+        return None, _refuse_upload(413, f"File too large (max {max_size} bytes)")
+
+    if request.mimetype != 'multipart/form-data' or not request.mimetype_params.get('boundary'):
+        return None, (jsonify({'ok': False, 'errors': ['No file part']}), 400)
+    return form, None
+
+def upload_check(form):
+    """The part-header check for a direct upload to `form` (see save_streamed_file)."""
+    constraints = form.constraints or {}
+    return lambda filename, mime_type: check_file_type(constraints, filename, mime_type, form.constraints_version)
+
+def finish_direct_upload(form, result, error):
+    """
+    Records a streamed direct upload, given save_streamed_file's result.
+    """
+    if error:
+        return _refuse_upload(*error)
+    saved_filename, filename, mime_type, _ = result
+    return _create_submission(form, saved_filename, secure_filename(filename), mime_type)
+
+@api.route('/submit/<code>/preflight', methods=['POST'])
+def preflight_submission(code):
+    """
+    Hash-first submission. The client sends {sha256, sizeBytes, filename,
+    mimeType} before uploading anything. If the server already stores those
+    bytes, the submission is created by reference and validated as usual
+    (probe results for the blob are usually cached), with nothing uploaded.
+    Otherwise the response is {ok: true, exists: false} and the client
+    uploads normally.
+
+    A hash and size aren't proof of holding the bytes, so only blobs the
+    caller has already submitted themselves can be matched. Anyone else gets
+    exists: false and uploads the file, which is still deduplicated on arrival.
+    """
+    form = _cached_form_or_404(form_cache.get_form_by_code(code))
+    constraints = form.constraints or {}
+    data = request.get_json() or {}
+
+    file_hash = (data.get('sha256') or '').lower()
+    size_bytes = data.get('sizeBytes')
+    filename = secure_filename(data.get('filename') or '')
+    mime_type = data.get('mimeType') or 'application/octet-stream'
+    if not BLOB_NAME.match(file_hash):
+        return jsonify({'ok': False, 'errors': ['sha256 must be a hex SHA-256 digest']}), 400
+    if not isinstance(size_bytes, int) or size_bytes < 0:
+        return jsonify({'ok': False, 'errors': ['sizeBytes must be a non-negative integer']}), 400
+    if not filename:
+        return jsonify({'ok': False, 'errors': ['Filename is required']}), 400
+
+    max_size = constraints.get('maxSizeBytes')
+    if max_size and size_bytes > max_size:
+        return jsonify({'ok': False, 'errors': [f"File too large (max {max_size} bytes)"]}), 413
+    type_error = check_file_type(constraints, filename, mime_type, form.constraints_version)
+    if type_error:
+        return jsonify({'ok': False, 'errors': [type_error]}), 415
+    quota_error = check_quota(form, _submitter_id())
+    if quota_error:
+        return jsonify({'ok': False, 'errors': [quota_error]}), 409
+
+    if not _has_submitted_blob(file_hash) or not claim_blob(
+            current_app.config['UPLOAD_FOLDER'], file_hash, size_bytes, current_app.config['STORAGE_SHARD_DEPTH']):
+        return jsonify({'ok': True, 'exists': False})
+
+    metrics.UPLOADS.inc(result='preflight')
+    response = make_response(_create_submission(form, file_hash, filename, mime_type))
+    body = response.get_json()
+    body['exists'] = True
+    return jsonify(body), response.status_code
+
+def _has_submitted_blob(file_hash):
+    """Whether the current user has a submission of their own stored as `file_hash`."""
+    if not current_user.is_authenticated:
+        return False
+    return db.session.query(Submission.id).filter_by(
+        submitted_by=current_user.id, file_path=file_hash).first() is not None
+
+def _submitter_id():
+    return current_user.id if current_user.is_authenticated else None
+
+def _refuse_upload(status, message):
+    """
+    Error response for an upload refused before its body was fully read.
+    The connection is closed rather than reused, since unread body bytes
+    may still be in flight.
+    """
+    response = jsonify({'ok': False, 'errors': [message]})
+    response.status_code = status
+    response.headers['Connection'] = 'close'
+    return response
+
+def _create_submission(form, saved_filename, original_filename, mime_type):
+    """
+    Records a submission for a stored blob and hands it to the validation pool.
+    Shared by direct and resumable uploads.
+
+    The submitter's quota slot is taken in the same transaction as the insert,
+    so concurrent uploads can't exceed the form's limit. If none is left the
+    stored blob stays unreferenced and the collector removes it.
+
+    The collector deletes a file only while holding its blob's row lock,
+    which acquire_blob takes too. So once the reference is added, the file
+    is either still there and kept, or was deleted first and the submission
+    is refused rather than pointing at nothing.
+    """
+    file_path = _blob_path(saved_filename)
+    submitted_by = _submitter_id()
+    try:
+        size_bytes = os.path.getsize(file_path)
+    except FileNotFoundError:
+        size_bytes = None
+
+    quota_error = claim_quota(form, submitted_by)
+    if quota_error:
+        db.session.rollback()
+        return jsonify({'ok': False, 'errors': [quota_error]}), 409
 
     # Create Submission Record
     # Store the hash as file_path
     submission = Submission(
         id=str(uuid.uuid4()),
         form_id=form.id,
-        submitted_by=current_user.id if current_user.is_authenticated else None,
-        status='accepted',
+        submitted_by=submitted_by,
+        status='processing',
         filename=original_filename,
         file_path=saved_filename,
-        size_bytes=os.path.getsize(file_path),
-        mime_type=file.mimetype,
-        metadata_json=metadata
+        size_bytes=size_bytes,
+        mime_type=mime_type
     )
+    acquire_blob(saved_filename, submission.size_bytes, mime_type)
+    if size_bytes is None or not os.path.exists(file_path):
+        db.session.rollback()
+        return jsonify({'ok': False, 'errors': ['The stored file was removed while submitting; please upload it again']}), 409
     db.session.add(submission)
-    db.session.commit()
+    with metrics.STAGE_DURATION.time(stage='db_commit'):
+        db.session.commit()
 
+    current_app.extensions['validation_pool'].submit(submission.id)
+
+    if submission.status == 'processing':
+        # Clients poll /submissions/<id>/status for the outcome
+        return jsonify({'ok': True, 'submission': submission.to_dict()}), 202
+    if submission.status == 'rejected':
+        return jsonify({'ok': False, 'errors': _validation_errors(submission.id), 'submission': submission.to_dict()})
     return jsonify({'ok': True, 'submission': submission.to_dict()})
 
+def _validation_errors(submission_id):
+    result = SubmissionValidationResult.query.filter_by(submission_id=submission_id, passed=False) \
+        .order_by(SubmissionValidationResult.id.desc()).first()
+    return [result.message] if result else []
+
+# --- Resumable Uploads ---
+
+def _get_upload_session(upload_id):
+    """
+    Loads an upload session, checking it belongs to the current user.
+    Returns (upload, error_response).
+    """
+    upload = UploadSession.query.get_or_404(upload_id)
+    if upload.submitted_by and (not current_user.is_authenticated or current_user.id != upload.submitted_by):
+        return None, (jsonify({'error': 'Forbidden'}), 403)
+    return upload, None
+
+@api.route('/submit/<code>/uploads', methods=['POST'])
+def create_upload_session(code):
+    """
+    Start a resumable upload. The client then PUTs numbered chunks of
+    `chunkSize` bytes and calls /complete once all have arrived.
+    """
+    form = _cached_form_or_404(form_cache.get_form_by_code(code))
+    data = request.get_json() or {}
+
+    filename = secure_filename(data.get('filename') or '')
+    size_bytes = data.get('sizeBytes')
+    if not filename:
+        return jsonify({'ok': False, 'errors': ['Filename is required']}), 400
+    if not isinstance(size_bytes, int) or size_bytes <= 0:
+        return jsonify({'ok': False, 'errors': ['sizeBytes must be a positive integer']}), 400
+
+    max_size = (form.constraints or {}).get('maxSizeBytes')
+    if max_size and size_bytes > max_size:
+        return jsonify({'ok': False, 'errors': [f"File too large (max {max_size} bytes)"]}), 413
+    type_error = check_file_type(form.constraints or {}, filename, data.get('mimeType') or 'application/octet-stream',
+                                 form.constraints_version)
+    if type_error:
+        return jsonify({'ok': False, 'errors': [type_error]}), 415
+    quota_error = check_quota(form, _submitter_id())
+    if quota_error:
+        return jsonify({'ok': False, 'errors': [quota_error]}), 409
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        form_id=form.id,
+        submitted_by=_submitter_id(),
+        filename=filename,
+        mime_type=data.get('mimeType') or 'application/octet-stream',
+        size_bytes=size_bytes,
+        chunk_size=current_app.config['UPLOAD_CHUNK_SIZE']
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(upload.to_dict()), 201
+
+@api.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Report how much of an upload has arrived, so a client can resume."""
+    upload, error = _get_upload_session(upload_id)
+    if error:
+        return error
+    return jsonify(upload.to_dict())
+
+@api.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """
+    Receive chunk `index` as the raw request body. Chunks must be sent in
+    order; re-sending a chunk that already arrived is a no-op.
+    """
+    upload, error = _get_upload_session(upload_id)
+    if error:
+        return error
+    if upload.status != 'uploading':
+        return jsonify({'error': 'Upload is being completed', 'upload': upload.to_dict()}), 409
+
+    if index >= upload.chunk_count:
+        return jsonify({'error': f'Chunk index out of range (0-{upload.chunk_count - 1})'}), 400
+    offset = index * upload.chunk_size
+    expected_length = min(upload.chunk_size, upload.size_bytes - offset)
+
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range and (content_range.start != offset or content_range.stop != offset + expected_length):
+        return jsonify({'error': f'Content-Range does not match chunk {index}', 'upload': upload.to_dict()}), 400
+
+    if offset < upload.received_bytes:
+        # Retry of a chunk we already have (e.g. the response was lost)
+        return jsonify(upload.to_dict())
+    if offset > upload.received_bytes:
+        return jsonify({'error': 'Chunk out of order', 'upload': upload.to_dict()}), 409
+
+    data = _read_body(expected_length + 1)
+    if len(data) != expected_length:
+        return jsonify({'error': f'Chunk {index} must be {expected_length} bytes, got {len(data)}', 'upload': upload.to_dict()}), 400
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    received = append_chunk(upload_folder, upload.id, offset, data)
+
+    # Conditional update: another worker may have accepted this chunk meanwhile
+    updated = UploadSession.query.filter_by(id=upload.id, received_bytes=offset, status='uploading').update(
+        {'received_bytes': received, 'updated_at': datetime.utcnow()})
+    db.session.commit()
+    if not updated:
+        forget_chunk_state(upload.id)
+        db.session.refresh(upload)
+        return jsonify({'error': 'Chunk conflict', 'upload': upload.to_dict()}), 409
+
+    return jsonify(upload.to_dict())
+
+def _read_body(limit):
+    """Read up to `limit` bytes of the raw request body."""
+    parts = []
+    remaining = limit
+    while remaining > 0:
+        block = request.stream.read(min(remaining, current_app.config['UPLOAD_BUFFER_SIZE']))
+        if not block:
+            break
+        parts.append(block)
+        remaining -= len(block)
+    return b''.join(parts)
+
+@api.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """
+    Finalize a fully received upload: the hash is already computed, so the
+    staging file is renamed into the store and validated like a direct upload.
+
+    The session is claimed first (uploading -> completing) with a conditional
+    update, so when a client retries /complete while the first call is still
+    running, only one finalizes it and the other gets 409.
+    """
+    upload, error = _get_upload_session(upload_id)
+    if error:
+        return error
+    if upload.received_bytes < upload.size_bytes:
+        return jsonify({'ok': False, 'errors': ['Upload incomplete'], 'upload': upload.to_dict()}), 409
+
+    form = _cached_form_or_404(form_cache.get_form(upload.form_id))
+    claimed = UploadSession.query.filter_by(id=upload.id, status='uploading').update(
+        {'status': 'completing'}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return jsonify({'ok': False, 'errors': ['Upload is already being completed']}), 409
+
+    try:
+        saved_filename, _ = finalize_upload(current_app.config['UPLOAD_FOLDER'], upload.id, upload.size_bytes, current_app.config['STORAGE_SHARD_DEPTH'])
+    except Exception as e:
+        # Release the claim so the client can retry
+        UploadSession.query.filter_by(id=upload.id).update({'status': 'uploading'}, synchronize_session=False)
+        db.session.commit()
+        return jsonify({'ok': False, 'errors': [f'Upload failed: {str(e)}']}), 500
+
+    filename, mime_type = upload.filename, upload.mime_type
+    db.session.delete(upload)
+    db.session.commit()
+
+    return _create_submission(form, saved_filename, filename, mime_type)
+
+@api.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    upload, error = _get_upload_session(upload_id)
+    if error:
+        return error
+    # Not while /complete is moving the staging file into the store
+    deleted = UploadSession.query.filter_by(id=upload.id, status='uploading').delete(synchronize_session=False)
+    db.session.commit()
+    if not deleted:
+        return jsonify({'error': 'Upload is being completed'}), 409
+    discard_upload(current_app.config['UPLOAD_FOLDER'], upload_id)
+    return '', 204
+
+@api.route('/submissions/<submission_id>/status', methods=['GET'])
+def get_submission_status(submission_id):
+    """
+    Poll the validation outcome of a submission.
+    Like downloads, this is public by submission ID.
+    """
+    submission = Submission.query.get_or_404(submission_id)
+    return jsonify({
+        'id': submission.id,
+        'status': submission.status,
+        'errors': _validation_errors(submission.id) if submission.status == 'rejected' else [],
+        'submission': submission.to_dict()
+    })
+
+@api.route('/submissions/<submission_id>', methods=['GET'])
+def get_submission(submission_id):
+    """
+    Fetch one submission. Like downloads, this is public by submission ID.
+    `fields` limits the returned fields; `include=rawProbe` adds the full
+    ffprobe/Pillow output, which is kept out of the submission row.
+    """
+    try:
+        fields = _requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    include = request.args.get('include', '').split(',')
+    required = (Submission.file_path, Submission.mime_type) if 'rawProbe' in include else ()
+    submission = _project(Submission.query.filter_by(id=submission_id), fields, *required).first_or_404()
+
+    data = submission.to_dict(fields)
+    if 'rawProbe' in include:
+        tool = probe_tool(submission.mime_type)
+        data['rawProbe'] = probe_cache.lookup(submission.file_path, tool) if submission.file_path and tool else None
+    return jsonify(data)
+
 @api.route('/me/submissions', methods=['GET'])
 @login_required
 def list_my_submissions():
-    submissions = Submission.query.filter_by(submitted_by=current_user.id).all()
-    return jsonify([s.to_dict() for s in submissions])
+    return _submission_page(Submission.submitted_by == current_user.id)
 
 @api.route('/submissions/<submission_id>', methods=['DELETE'])
 @login_required
@@ -358,52 +873,218 @@ def delete_submission(submission_id):
     if not (is_submitter or is_form_owner):
         return jsonify({'error': 'Forbidden'}), 403
     
-    # Delete associated file ONLY if no other submission uses it
-    if submission.file_path:
-
-        file_path_to_check = submission.file_path
-        
-        db.session.delete(submission)
-        db.session.commit()
-        
-        # Check if any other submission uses this file
-        usage_count = Submission.query.filter_by(file_path=file_path_to_check).count()
-        if usage_count == 0:
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file_path_to_check)
-            delete_file(full_path)
-    else:
-        db.session.delete(submission)
-        db.session.commit()
+    # The file itself is left to the collector once no submission uses it
+    delete_submissions(Submission.id == submission.id)
+    db.session.commit()
     
     return '', 204
 
 # --- File Downloads ---
 
+_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def _immutable(response, file_hash):
+    response.set_etag(file_hash)
+    response.cache_control.public = True
+    response.cache_control.max_age = _IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
 @api.route('/submissions/<submission_id>/download', methods=['GET'])
 def download_submission(submission_id):
     """
     Download the file associated with a submission.
     No authentication required for downloads (public access by submission ID).
+
+    Blobs are content-addressed and never change, so the hash is a strong
+    ETag and responses may be cached indefinitely. Byte ranges are supported
+    so video players can seek.
     """
     submission = Submission.query.get_or_404(submission_id)
     
     if not submission.file_path:
         return jsonify({'error': 'File path not found'}), 404
+
+    file_hash = submission.file_path
+    if request.if_none_match.contains(file_hash):
+        response = Response(status=304)
+        return _immutable(response, file_hash)
     
     # Reconstruct full path
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], submission.file_path)
+    file_path = _blob_path(file_hash)
     
     if not os.path.exists(file_path):
         return jsonify({'error': 'File not found on server'}), 404
-    
-    # Send file with original filename and mime type
-    return send_file(
+
+    if current_app.config['DOWNLOAD_ACCEL_MODE'] == 'x-accel':
+        # nginx serves the bytes (and ranges) from an internal location
+        relative = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = Response(mimetype=submission.mime_type)
+        response.headers['X-Accel-Redirect'] = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+        response.headers.set('Content-Disposition', 'attachment', filename=submission.filename)
+        return _immutable(response, file_hash)
+
+    # Send file with original filename and mime type. With USE_X_SENDFILE
+    # (DOWNLOAD_ACCEL_MODE = 'x-sendfile') the front server sends the body.
+    response = send_file(
         file_path,
         as_attachment=True,
         download_name=submission.filename,
-        mimetype=submission.mime_type
+        mimetype=submission.mime_type,
+        etag=file_hash,
+        conditional=True,
+        max_age=_IMMUTABLE_MAX_AGE
+    )
+    return _immutable(response, file_hash)
+
+# Seconds a client should wait before asking again for a preview being transcoded
+_PREVIEW_RETRY_AFTER = 2
+
+@api.route('/submissions/<submission_id>/preview/<variant>', methods=['GET'])
+def get_submission_preview(submission_id, variant):
+    """
+    A small derivative of a submission's file, for reviewing it without
+    downloading the original: 'thumb' (images and videos, a small JPEG),
+    'poster' (a video frame) or 'preview' (a short low-bitrate clip of a
+    video or audio file). Public by submission ID, like download_submission.
+
+    Derivatives are cached by content hash, so the first request for one
+    pays for making it. Thumbnails and posters are made before responding;
+    while a preview clip is transcoded the response is 202 with Retry-After.
+    """
+    submission = Submission.query.get_or_404(submission_id)
+    if not submission.file_path:
+        return jsonify({'error': 'File path not found'}), 404
+    spec = variant_for(variant, submission.mime_type)
+    if spec is None:
+        return jsonify({'error': f'No {variant} for {submission.mime_type} files'}), 404
+
+    derivatives = current_app.extensions['derivatives']
+    etag = derivatives.etag(submission.file_path, variant)
+    if request.if_none_match.contains(etag):
+        return _immutable(Response(status=304), etag)
+
+    file_path = _blob_path(submission.file_path)
+    if not os.path.exists(file_path):
+        return jsonify({'error': 'File not found on server'}), 404
+
+    status, result = derivatives.get(submission.file_path, file_path, submission.mime_type, variant)
+    if status == 'pending':
+        response = jsonify({'status': 'pending'})
+        response.status_code = 202
+        response.headers['Retry-After'] = str(_PREVIEW_RETRY_AFTER)
+        return response
+    if status == 'failed':
+        return jsonify({'error': f'Preview unavailable: {result}'}), 422
+
+    response = send_file(result, mimetype=spec.mime_type, etag=etag, conditional=True, max_age=_IMMUTABLE_MAX_AGE)
+    return _immutable(response, etag)
+
+def _archive_response(query, zip_name):
+    """
+    Streams the files of the submissions in `query` as a ZIP download.
+    An optional `ids` list (JSON body or comma-separated query parameter)
+    narrows it to a selection.
+    """
+    if request.method == 'POST':
+        ids = (request.get_json(silent=True) or {}).get('ids')
+    else:
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+    if ids:
+        query = query.filter(Submission.id.in_(ids))
+    query = query.filter(Submission.file_path.isnot(None)).order_by(Submission.created_at, Submission.id)
+
+    def entries():
+        used_names = set()
+        for submission in query.yield_per(500):
+            yield (unique_name(submission.filename, used_names), _blob_path(submission.file_path),
+                   submission.mime_type, submission.created_at)
+
+    return Response(
+        stream_with_context(stream_zip(entries(), current_app.config['UPLOAD_BUFFER_SIZE'])),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{secure_filename(zip_name)}"'}
     )
 
+@api.route('/forms/<form_id>/submissions/archive', methods=['GET', 'POST'])
+@login_required
+def download_form_archive(form_id):
+    """Download a form's submissions (or the selected `ids`) as one ZIP."""
+    form = Form.query.get_or_404(form_id)
+    if form.created_by != current_user.id:
+        return jsonify({'error': 'Forbidden'}), 403
+    return _archive_response(Submission.query.filter_by(form_id=form_id), f'form-{form.code}-submissions.zip')
+
+@api.route('/me/submissions/archive', methods=['GET', 'POST'])
+@login_required
+def download_my_archive():
+    """Download the current user's submissions (or the selected `ids`) as one ZIP."""
+    return _archive_response(Submission.query.filter_by(submitted_by=current_user.id), 'my-submissions.zip')
+
+_EXPORT_COLUMNS = {
+    'id': Submission.id,
+    'formId': Submission.form_id,
+    'submittedBy': Submission.submitted_by,
+    'status': Submission.status,
+    'filename': Submission.filename,
+    'sizeBytes': Submission.size_bytes,
+    'mimeType': Submission.mime_type,
+    'createdAt': Submission.created_at,
+}
+# Extracted by the database, so metadata_json is never loaded whole
+_EXPORT_METADATA_FIELDS = ('width', 'height', 'duration', 'codec', 'format', 'sampleRate', 'channels', 'bitRate')
+for _field in _EXPORT_METADATA_FIELDS:
+    _EXPORT_COLUMNS[_field] = Submission.metadata_json[_field]
+_DEFAULT_EXPORT_COLUMNS = 'id,filename,status,mimeType,sizeBytes,createdAt,submittedBy'
+
+def _export_response(query, export_name):
+    """
+    Streams the submissions in `query` as CSV, NDJSON or JSON.
+
+    Query parameters:
+      format    csv (default), ndjson or json
+      columns   comma-separated column names (see _EXPORT_COLUMNS)
+    plus the filters accepted by the submission listings.
+    """
+    args = request.args
+    fmt = args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+
+    columns = [c for c in args.get('columns', _DEFAULT_EXPORT_COLUMNS).split(',') if c]
+    unknown = [c for c in columns if c not in _EXPORT_COLUMNS]
+    if unknown or not columns:
+        return jsonify({'error': f"Unknown columns: {', '.join(unknown)}" if unknown else 'No columns selected'}), 400
+
+    try:
+        query = _filter_submissions(query)
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    rows = query.with_entities(*[_EXPORT_COLUMNS[c] for c in columns]) \
+        .order_by(Submission.created_at, Submission.id).yield_per(1000)
+
+    return Response(
+        stream_with_context(stream_rows(fmt, columns, rows)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{secure_filename(export_name)}.{fmt}"'}
+    )
+
+@api.route('/forms/<form_id>/submissions/export', methods=['GET'])
+@login_required
+def export_form_submissions(form_id):
+    """Export a form's submission metadata as CSV, NDJSON or JSON."""
+    form = Form.query.get_or_404(form_id)
+    if form.created_by != current_user.id:
+        return jsonify({'error': 'Forbidden'}), 403
+    return _export_response(Submission.query.filter_by(form_id=form_id), f'form-{form.code}-submissions')
+
+@api.route('/me/submissions/export', methods=['GET'])
+@login_required
+def export_my_submissions():
+    """Export the current user's submission metadata as CSV, NDJSON or JSON."""
+    return _export_response(Submission.query.filter_by(submitted_by=current_user.id), 'my-submissions')
+
 # --- Debug Endpoints ---
 
 @api.route('/debug/file-info', methods=['POST'])
@@ -421,14 +1102,14 @@ def debug_file_info():
     
     # Save temporarily
     try:
-        saved_filename, original_filename, is_new = save_file(file, current_app.config['UPLOAD_FOLDER'])
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], saved_filename)
+        saved_filename, original_filename, is_new = save_file(file, current_app.config['UPLOAD_FOLDER'], current_app.config['UPLOAD_BUFFER_SIZE'], current_app.config['STORAGE_SHARD_DEPTH'])
+        file_path = _blob_path(saved_filename)
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
     
     try:
         # Extract file info
-        info = get_file_info(file_path, file.mimetype)
+        info = get_file_info(file_path, file.mimetype, content_hash=saved_filename)
         info['originalFilename'] = original_filename
         
         return jsonify(info)
@@ -1,48 +1,252 @@
 import os
 import uuid
 import hashlib
+import re
+import time
+import tempfile
 from werkzeug.utils import secure_filename
+import metrics
 
-def save_file(file, upload_folder):
+# Uploads are read and written in large blocks; 4KB reads made hashing a
+# 500MB video cost ~128k read() calls.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Partially written blobs live here until their hash is known. It sits inside
+# the upload folder so the final rename never crosses a filesystem boundary.
+STAGING_DIRNAME = '.incoming'
+
+# Blobs are fanned out by hash prefix: depth 2 stores <hash> as ab/cd/<hash>.
+DEFAULT_SHARD_DEPTH = 2
+
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def staging_dir(upload_folder):
+    """
+    Returns the staging directory for in-flight uploads, creating it if needed.
+    """
+    path = os.path.join(upload_folder, STAGING_DIRNAME)
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def shard_path(upload_folder, file_hash, depth=DEFAULT_SHARD_DEPTH):
+    """
+    Returns the sharded location of a blob, e.g. <upload_folder>/ab/cd/<hash>.
+    """
+    prefixes = [file_hash[i * 2:i * 2 + 2] for i in range(depth)]
+    return os.path.join(upload_folder, *prefixes, file_hash)
+
+
+def resolve_path(upload_folder, file_path, depth=DEFAULT_SHARD_DEPTH):
+    """
+    Returns the on-disk path of a stored blob given its Submission.file_path
+    (the hash). Blobs written before sharding live flat in the upload folder
+    until migrate_layout() moves them. The returned path may not exist.
+    """
+    sharded = shard_path(upload_folder, file_path, depth)
+    if os.path.exists(sharded):
+        return sharded
+    flat = os.path.join(upload_folder, file_path)
+    if os.path.exists(flat):
+        return flat
+    # Not found in either place, or moved by a concurrent migration between checks
+    return sharded
+
+
+def commit_blob(temp_path, upload_folder, file_hash, depth=DEFAULT_SHARD_DEPTH):
+    """
+    Moves a fully written temp file to its content-addressed name, or removes
+    it if that blob is already stored. Returns is_new.
+    """
+    file_path = shard_path(upload_folder, file_hash, depth)
+    flat_path = os.path.join(upload_folder, file_hash)
+    if os.path.exists(flat_path) and _touch(flat_path):
+        # Already stored in the legacy flat layout
+        os.remove(temp_path)
+        return False
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        # link() refuses to overwrite, so two concurrent uploads of the
+        # same bytes can't both report is_new
+        os.link(temp_path, file_path)
+        is_new = True
+    except FileExistsError:
+        is_new = False
+    except OSError:
+        # Filesystems without hard links
+        is_new = not os.path.exists(file_path)
+        if is_new:
+            os.replace(temp_path, file_path)
+            return is_new
+
+    if not is_new and not _touch(file_path):
+        # The collector deleted it since link() found it; store this copy instead
+        os.replace(temp_path, file_path)
+        return True
+    os.remove(temp_path)
+    return is_new
+
+
+def claim_blob(upload_folder, file_hash, size, depth=DEFAULT_SHARD_DEPTH):
+    """
+    Checks that a blob is stored with the expected size, for submissions made
+    by reference to existing bytes. Refreshes its mtime like a dedup hit does.
+    Returns True if the blob can be used.
+    """
+    path = resolve_path(upload_folder, file_hash, depth)
+    try:
+        if os.path.getsize(path) != size:
+            return False
+    except OSError:
+        return False
+    return _touch(path)
+
+
+def _touch(path):
+    """
+    Refreshes a reused blob's mtime so the garbage collector's grace period
+    protects it until the new submission referencing it is committed.
+    Returns False if the blob is gone.
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+class BlobWriter:
+    """
+    Hashes and writes an upload to the content-addressed store in one pass.
+
+    Chunks passed to write() are hashed and appended to a temporary file in the
+    staging directory. commit() moves the temporary file to its SHA-256 name,
+    or discards it if that blob is already stored.
+    """
+
+    def __init__(self, upload_folder, shard_depth=DEFAULT_SHARD_DEPTH):
+        self.upload_folder = upload_folder
+        self.shard_depth = shard_depth
+        self.size = 0
+        self.hash_seconds = 0.0
+        self._hash = hashlib.sha256()
+        fd, self.temp_path = tempfile.mkstemp(prefix='upload-', dir=staging_dir(upload_folder))
+        self._fp = os.fdopen(fd, 'wb', buffering=0)
+
+    def write(self, chunk):
+        start = time.perf_counter()
+        self._hash.update(chunk)
+        self.hash_seconds += time.perf_counter() - start
+        self._fp.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """
+        Finalizes the blob. Returns (file_hash, is_new).
+        """
+        self._fp.close()
+        file_hash = self._hash.hexdigest()
+        is_new = commit_blob(self.temp_path, self.upload_folder, file_hash, self.shard_depth)
+        metrics.record_hash(self.size, self.hash_seconds)
+        metrics.record_blob(self.size, is_new)
+        return file_hash, is_new
+
+    def abort(self):
+        """
+        Discards the partially written blob.
+        """
+        if not self._fp.closed:
+            self._fp.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def save_file(file, upload_folder, buffer_size=DEFAULT_BUFFER_SIZE, shard_depth=DEFAULT_SHARD_DEPTH):
     """
     Saves a file to the upload folder using its SHA-256 hash as the filename.
+    The upload is hashed while it is written, so it is only read once.
     Returns (relative_path, original_filename, is_new).
     """
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
-    
-    # Calculate SHA-256 hash
-    sha256_hash = hashlib.sha256()
-    
-    # Read file in chunks to avoid memory issues
-    chunk_size = 4096
-    while True:
-        chunk = file.read(chunk_size)
-        if not chunk:
-            break
-        sha256_hash.update(chunk)
-    
-    # Reset file pointer
-    file.seek(0)
-    
-    file_hash = sha256_hash.hexdigest()
+
+    writer = BlobWriter(upload_folder, shard_depth)
+    try:
+        while True:
+            chunk = file.read(buffer_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+        file_hash, is_new = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
     original_filename = secure_filename(file.filename)
-    
+
     # The saved filename is the hash
     saved_filename = file_hash
-    file_path = os.path.join(upload_folder, saved_filename)
-    
-    is_new = False
-    # Check if file already exists
-    if not os.path.exists(file_path):
-        file.save(file_path)
-        is_new = True
-        
+
     return saved_filename, original_filename, is_new
 
 def delete_file(file_path):
     """
     Deletes a file from the filesystem.
     """
-    if os.path.exists(file_path):
+    try:
+        size = os.path.getsize(file_path)
         os.remove(file_path)
+    except FileNotFoundError:
+        return
+    metrics.BYTES_DELETED.inc(size)
+
+
+def iter_blob_paths(upload_folder):
+    """
+    Yields the paths of all stored blobs, whatever layout they are in.
+    Directories are scanned lazily, so the full listing is never held in memory.
+    """
+    pending = [upload_folder]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip staging and other hidden directories
+                    if not entry.name.startswith('.'):
+                        pending.append(entry.path)
+                elif BLOB_NAME.match(entry.name):
+                    yield entry.path
+
+
+def migrate_layout(upload_folder, depth=DEFAULT_SHARD_DEPTH, batch_size=500, pause=0.0, log=None):
+    """
+    Moves blobs that aren't at their sharded location (flat legacy files, or a
+    different depth) into place. Safe to run while the server is up: each move
+    is an atomic rename and resolve_path() checks both layouts. Sleeps `pause`
+    seconds after every `batch_size` moves to limit I/O pressure.
+    Returns the number of blobs moved.
+    """
+    moved = 0
+    for path in iter_blob_paths(upload_folder):
+        name = os.path.basename(path)
+        target = shard_path(upload_folder, name, depth)
+        if path == target:
+            continue
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            # Same hash already at the target, so this copy is redundant
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        moved += 1
+
+        if moved % batch_size == 0:
+            if log:
+                log(f'Moved {moved} blobs')
+            if pause:
+                time.sleep(pause)
+    return moved
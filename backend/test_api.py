@@ -1,5 +1,6 @@
 import requests
 import uuid
+import io
 
 BASE_URL = 'http://localhost:5000'
 SESSION = requests.Session()
@@ -51,9 +52,34 @@ def test_submit(code):
     else:
         print(f"[FAIL] Submit: {res.text}")
 
+def test_oversized_submit():
+    # Declares a body past the server's MAX_CONTENT_LENGTH (500MB) but only sends
+    # its first bytes: the form has no maxSizeBytes, so the upload should still be
+    # refused with 413 from the declared length
+    res = SESSION.post(f'{BASE_URL}/forms', json={'title': 'Oversized Test Form'})
+    if res.status_code != 200:
+        print(f"[FAIL] Create Form: {res.text}")
+        return
+    code = res.json()['code']
+
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n').encode()
+    body = io.BytesIO(head + b'\0' * 1024)
+    body.len = 501 * 1024 * 1024  # requests sends this as the Content-Length
+    res = SESSION.post(f'{BASE_URL}/submit/{code}', data=body, headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}'
+    })
+    if res.status_code == 413:
+        print(f"[SUCCESS] Oversized Submit: {res.json()}")
+    else:
+        print(f"[FAIL] Oversized Submit: {res.status_code} {res.text}")
+
 if __name__ == '__main__':
     print("Testing API...")
     if test_signup():
         code = test_create_form()
         if code:
             test_submit(code)
+            test_oversized_submit()
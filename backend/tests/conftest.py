@@ -0,0 +1,81 @@
+import io
+import os
+
+import pytest
+
+import form_cache
+import user_cache
+from app import create_app
+from config import Config
+from models import db
+from storage import iter_blob_paths
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Builds an app on its own SQLite file and upload folder under tmp_path.
+    Validation runs inline and the collector thread is off, so each request
+    has finished its work by the time it returns.
+    """
+    apps = []
+
+    def make(**overrides):
+        attributes = dict(SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'app.db'),
+                          UPLOAD_FOLDER=str(tmp_path / 'uploads'), TESTING=True,
+                          VALIDATION_WORKERS=0, GC_INTERVAL_SECONDS=0, **overrides)
+        app = create_app(type('TestConfig', (Config,), attributes))
+        apps.append(app)
+        return app
+
+    yield make
+    # The caches are per process, so nothing should outlive the test's database
+    form_cache.clear()
+    user_cache.clear()
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    """A client signed up as 'alice'."""
+    client = app.test_client()
+    signup(client, 'alice')
+    return client
+
+
+def signup(client, username):
+    response = client.post('/auth/signup', json={'username': username, 'password': 'pw',
+                                                 'email': f'{username}@example.com'})
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def signin(client, username):
+    response = client.post('/auth/signin', json={'username': username, 'password': 'pw'})
+    assert response.status_code == 200, response.data
+
+
+def create_form(client, constraints=None, **fields):
+    response = client.post('/forms', json={'title': 'Test form', 'constraints': constraints or {}, **fields})
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def upload(client, code, data=b'Hello World', filename='test.txt', mime_type='text/plain'):
+    return client.post(f'/submit/{code}', data={'file': (io.BytesIO(data), filename, mime_type)},
+                       content_type='multipart/form-data')
+
+
+def stored_blobs(app):
+    """Names of the files in the upload folder, staging area excluded."""
+    if not os.path.isdir(app.config['UPLOAD_FOLDER']):
+        return []
+    return sorted(os.path.basename(path) for path in iter_blob_paths(app.config['UPLOAD_FOLDER']))
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+import time
+
+import blob_gc
+from blobs import acquire_blob
+from conftest import create_form, stored_blobs, upload
+from models import db, Blob
+from storage import shard_path
+
+
+def write_orphan(app, data):
+    """Stores `data` as an unreferenced blob from long ago. Returns (hash, path)."""
+    file_hash = hashlib.sha256(data).hexdigest()
+    path = shard_path(app.config['UPLOAD_FOLDER'], file_hash, app.config['STORAGE_SHARD_DEPTH'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, (1, 1))
+    return file_hash, path
+
+
+def in_thread(app, target):
+    """Runs target() in an app context on another thread. Returns (thread, result dict)."""
+    result = {}
+
+    def run():
+        with app.app_context():
+            try:
+                result['value'] = target()
+            finally:
+                db.session.remove()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def acquire_and_check(file_hash, path):
+    """What _create_submission does: add the reference, then check the file is still there."""
+    acquire_blob(file_hash, 6, 'text/plain')
+    exists = os.path.exists(path)
+    db.session.commit()
+    return exists
+
+
+def test_acquire_waits_for_a_running_delete(app, monkeypatch):
+    file_hash, path = write_orphan(app, b'orphan')
+    deleting = threading.Event()
+    release = threading.Event()
+    delete_file = blob_gc.delete_file
+
+    def paused_delete(path):
+        deleting.set()
+        assert release.wait(10)
+        delete_file(path)
+
+    monkeypatch.setattr(blob_gc, 'delete_file', paused_delete)
+    collector, deleted = in_thread(app, lambda: blob_gc._delete_orphan(file_hash, path, time.time()))
+    assert deleting.wait(10)
+    submitter, found = in_thread(app, lambda: acquire_and_check(file_hash, path))
+    # The submitter is now queued on the blob's row lock
+    time.sleep(0.2)
+    release.set()
+    collector.join()
+    submitter.join()
+
+    assert deleted['value'] == 6
+    assert found['value'] is False
+    assert not os.path.exists(path)
+
+
+def test_delete_waits_for_an_uncommitted_reference(app):
+    file_hash, path = write_orphan(app, b'orphan')
+    acquired = threading.Event()
+    commit = threading.Event()
+
+    def acquire():
+        acquire_blob(file_hash, 6, 'text/plain')
+        acquired.set()
+        assert commit.wait(10)
+        db.session.commit()
+
+    submitter, _ = in_thread(app, acquire)
+    assert acquired.wait(10)
+    collector, deleted = in_thread(app, lambda: blob_gc._delete_orphan(file_hash, path, time.time()))
+    time.sleep(0.2)
+    commit.set()
+    submitter.join()
+    collector.join()
+
+    assert deleted['value'] is None
+    assert os.path.exists(path)
+    with app.app_context():
+        assert db.session.get(Blob, file_hash).refcount == 1
+
+
+def test_delete_keeps_referenced_and_recent_blobs(app):
+    file_hash, path = write_orphan(app, b'orphan')
+    with app.app_context():
+        acquire_blob(file_hash, 6, 'text/plain')
+        db.session.commit()
+        assert blob_gc._delete_orphan(file_hash, path, time.time()) is None
+    assert os.path.exists(path)
+
+    file_hash, path = write_orphan(app, b'recent')
+    os.utime(path)
+    with app.app_context():
+        assert blob_gc._delete_orphan(file_hash, path, time.time() - 60) is None
+    assert os.path.exists(path)
+
+
+def test_collect_garbage_in_batches(app, client, monkeypatch):
+    monkeypatch.setattr(blob_gc, '_REFERENCE_PAGE', 3)
+    monkeypatch.setattr(blob_gc, '_ORPHAN_BATCH', 2)
+    form = create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=0)
+    kept = [upload(client, form['code'], data=b'kept %d' % i).get_json()['submission']['filePath'] for i in range(7)]
+    orphans = [write_orphan(app, b'orphan %d' % i) for i in range(5)]
+
+    # One orphan disappears between the listing and its stat
+    vanishing = [orphans[0][1]]
+    stat = os.stat
+
+    def racing_stat(path, *args, **kwargs):
+        if path in vanishing:
+            vanishing.remove(path)
+            os.remove(path)
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(blob_gc.os, 'stat', racing_stat)
+    with app.app_context():
+        report = blob_gc.collect_garbage(app.config['UPLOAD_FOLDER'], app.config['STORAGE_SHARD_DEPTH'],
+                                         grace_seconds=10)
+    monkeypatch.undo()
+
+    assert report['orphans'] == 4
+    assert report['orphansDeleted'] == 4
+    assert report['dangling'] == 0
+    assert stored_blobs(app) == sorted(kept)
@@ -0,0 +1,71 @@
+import hashlib
+
+from blobs import acquire_blob, release_blobs, rebuild_refcounts
+from conftest import create_form, stored_blobs, upload
+from models import db, Blob
+
+HASH = hashlib.sha256(b'blob').hexdigest()
+
+
+def refcount(file_hash):
+    return db.session.query(Blob.refcount).filter_by(hash=file_hash).scalar()
+
+
+def test_acquire_and_release(app):
+    with app.app_context():
+        acquire_blob(HASH, 4, 'text/plain')
+        db.session.commit()
+        assert refcount(HASH) == 1
+        acquire_blob(HASH, 4, 'text/plain')
+        acquire_blob(HASH, 4, 'text/plain')
+        db.session.commit()
+        assert refcount(HASH) == 3
+
+        release_blobs({HASH: 2, None: 1, 'unused': 0})
+        db.session.commit()
+        assert refcount(HASH) == 1
+        release_blobs({HASH: 1})
+        db.session.commit()
+        assert refcount(HASH) == 0
+
+
+def test_acquire_rolls_back_with_the_transaction(app):
+    with app.app_context():
+        acquire_blob(HASH, 4, 'text/plain')
+        db.session.commit()
+        acquire_blob(HASH, 4, 'text/plain')
+        db.session.rollback()
+        assert refcount(HASH) == 1
+
+
+def test_submissions_hold_references(app, client):
+    first = create_form(client)
+    second = create_form(client)
+    assert upload(client, first['code']).status_code == 200
+    response = upload(client, second['code'])
+    assert response.status_code == 200
+    file_hash = response.get_json()['submission']['filePath']
+    assert stored_blobs(app) == [file_hash]
+    with app.app_context():
+        assert refcount(file_hash) == 2
+
+    assert client.delete(f"/submissions/{response.get_json()['submission']['id']}").status_code == 204
+    with app.app_context():
+        assert refcount(file_hash) == 1
+    assert client.delete(f"/forms/{first['id']}").status_code == 204
+    with app.app_context():
+        assert refcount(file_hash) == 0
+    # The file itself is left for the collector
+    assert stored_blobs(app) == [file_hash]
+
+
+def test_rebuild_refcounts(app, client):
+    form = create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=0)
+    upload(client, form['code'])
+    file_hash = upload(client, form['code']).get_json()['submission']['filePath']
+    with app.app_context():
+        db.session.query(Blob).update({'refcount': 7})
+        db.session.commit()
+        assert rebuild_refcounts() == 1
+        db.session.commit()
+        assert refcount(file_hash) == 2
@@ -0,0 +1,80 @@
+import pytest
+
+import form_cache
+from conftest import create_form, signup, stored_blobs, upload
+from models import db, Form, Submission
+
+
+def assert_refused(app, response, status):
+    assert response.status_code == status, response.data
+    assert response.headers['Connection'] == 'close'
+    assert response.get_json()['ok'] is False
+    assert stored_blobs(app) == []
+    with app.app_context():
+        assert Submission.query.count() == 0
+
+
+def test_declared_length_over_max_size(app, client):
+    form = create_form(client, {'maxSizeBytes': 1000})
+    response = upload(client, form['code'], data=b'x' * 100 * 1024)
+    assert_refused(app, response, 413)
+    assert response.get_json()['errors'] == ['File too large (max 1000 bytes)']
+
+
+def test_file_over_max_size_while_streaming(app, client):
+    # Within the multipart allowance, so only the streamed byte count catches it
+    form = create_form(client, {'maxSizeBytes': 1000})
+    assert_refused(app, upload(client, form['code'], data=b'x' * 1500), 413)
+
+
+def test_body_over_max_content_length(make_app):
+    app = make_app(MAX_CONTENT_LENGTH=64 * 1024)
+    client = app.test_client()
+    signup(client, 'alice')
+    form = create_form(client)
+    response = upload(client, form['code'], data=b'x' * 100 * 1024)
+    assert_refused(app, response, 413)
+
+
+@pytest.mark.parametrize('constraints', [
+    {'allowedTypes': ['image/*']},
+    {'allowedExtensions': ['.pdf']},
+    {'allowedTypes': ['image/*'], 'allowedExtensions': ['.md']},
+    {'customExtensions': ['.md']},
+])
+def test_disallowed_type(app, client, constraints):
+    form = create_form(client, constraints)
+    assert_refused(app, upload(client, form['code']), 415)
+
+
+@pytest.mark.parametrize('constraints', [
+    {},
+    {'maxSizeBytes': 1000},
+    {'allowedTypes': [], 'allowedExtensions': []},
+    {'allowedTypes': ['image/*'], 'allowAllTypes': True},
+    {'allowedTypes': ['image/*'], 'allowedExtensions': ['.txt']},
+    {'allowedTypes': ['text/*']},
+])
+def test_allowed_upload(client, constraints):
+    form = create_form(client, constraints)
+    response = upload(client, form['code'])
+    assert response.status_code == 200, response.data
+    assert response.get_json()['submission']['status'] == 'accepted'
+
+
+def test_type_lists_on_forms_saved_before_they_were_enforced(app, client):
+    form = create_form(client, {'allowedTypes': ['image/*'], 'allowedExtensions': ['.jpg']},
+                       allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=0)
+    with app.app_context():
+        Form.query.filter_by(id=form['id']).update({'constraints_version': 1})
+        db.session.commit()
+    form_cache.clear()
+
+    response = upload(client, form['code'])
+    assert response.status_code == 200, response.data
+    assert response.get_json()['submission']['status'] == 'accepted'
+
+    # Saving the constraints again opts the form in
+    response = client.patch(f"/forms/{form['id']}", json={'constraints': {'allowedTypes': ['image/*']}})
+    assert response.status_code == 200, response.data
+    assert upload(client, form['code'], data=b'other bytes').status_code == 415
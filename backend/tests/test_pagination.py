@@ -0,0 +1,80 @@
+import base64
+import json
+
+import pytest
+
+from conftest import create_form, upload
+
+SORTS = ('createdAt', '-createdAt', 'sizeBytes', '-sizeBytes', 'filename', '-filename')
+
+
+@pytest.fixture
+def form(client):
+    form = create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=0)
+    # Repeated sizes and filenames, so pages break inside runs of equal values
+    for i in range(13):
+        response = upload(client, form['code'], data=b'x' * (100 + i % 4) + b'%d' % i, filename=f'file{i % 3}.txt')
+        assert response.status_code == 200, response.data
+    return form
+
+
+def cursor_for(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def walk(client, form, sort, limit):
+    url = f"/forms/{form['id']}/submissions?sort={sort}&limit={limit}"
+    items, cursor = [], None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200, response.data
+        page = response.get_json()
+        assert len(page['items']) <= limit
+        assert ('total' in page) == (cursor is None)
+        items.extend(page['items'])
+        cursor = page['nextCursor']
+        if not cursor:
+            return items
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_cursor_walk_visits_every_submission_once_in_order(client, form, sort):
+    items = walk(client, form, sort, limit=4)
+    field = sort.lstrip('-')
+    expected = sorted(items, key=lambda s: (s[field], s['id']), reverse=sort.startswith('-'))
+    assert [s['id'] for s in items] == [s['id'] for s in expected]
+    assert len({s['id'] for s in items}) == 13
+
+
+def test_last_page_has_no_cursor(client, form):
+    page = client.get(f"/forms/{form['id']}/submissions?limit=13").get_json()
+    assert len(page['items']) == 13
+    assert page['total'] == 13
+    assert page['nextCursor'] is None
+
+
+def test_cursor_from_another_sort(client, form):
+    cursor = client.get(f"/forms/{form['id']}/submissions?sort=filename&limit=2").get_json()['nextCursor']
+    response = client.get(f"/forms/{form['id']}/submissions?sort=sizeBytes&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Cursor was issued for a different sort'
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    cursor_for({'sort': 'sizeBytes'}),
+    cursor_for(['sizeBytes', 1]),
+    cursor_for(['sizeBytes', '100', 'id']),
+    cursor_for(['sizeBytes', True, 'id']),
+    cursor_for(['sizeBytes', 100, 5]),
+    cursor_for(['createdAt', 100, 'id']),
+    cursor_for(['createdAt', 'yesterday', 'id']),
+    cursor_for(['filename', None, 'id']),
+    cursor_for(['status', 'accepted', 'id']),
+    cursor_for([['sizeBytes'], 100, 'id']),
+])
+def test_invalid_cursor(client, form, cursor):
+    response = client.get(f"/forms/{form['id']}/submissions?sort=sizeBytes&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from conftest import create_form, signin, upload
+from models import db, Form, Submission, SubmissionQuota, User
+from quotas import claim_quota
+
+
+def quota_used(app, form_id):
+    with app.app_context():
+        return db.session.query(SubmissionQuota.used).filter_by(form_id=form_id).scalar()
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_claims_stop_at_the_limit(app, client):
+    form = create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=5)
+    with app.app_context():
+        user_id = User.query.filter_by(username='alice').one().id
+    results = []
+    start = threading.Barrier(16)
+
+    def claim(_):
+        with app.app_context():
+            start.wait()
+            error = claim_quota(db.session.get(Form, form['id']), user_id)
+            db.session.commit()
+            db.session.remove()
+            results.append(error)
+
+    run_threads(claim, 16)
+    assert results.count(None) == 5
+    assert quota_used(app, form['id']) == 5
+
+
+def test_concurrent_uploads_stop_at_the_limit(app, client):
+    form = create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=4)
+    statuses = []
+
+    def submit(index):
+        own = app.test_client()
+        signin(own, 'alice')
+        for attempt in range(3):
+            statuses.append(upload(own, form['code'], data=b'upload %d-%d' % (index, attempt)).status_code)
+
+    run_threads(submit, 8)
+    assert sorted(statuses) == [200] * 4 + [409] * 20
+    assert quota_used(app, form['id']) == 4
+    with app.app_context():
+        assert Submission.query.filter_by(form_id=form['id']).count() == 4
+
+
+@pytest.mark.parametrize('fields', [
+    {},
+    {'allowMultipleSubmissionsPerUser': True, 'maxSubmissionsPerUser': 2},
+])
+def test_deleting_a_submission_frees_its_slot(app, client, fields):
+    form = create_form(client, **fields)
+    limit = fields.get('maxSubmissionsPerUser', 1)
+    submissions = [upload(client, form['code'], data=b'%d' % i).get_json()['submission'] for i in range(limit)]
+    response = upload(client, form['code'], data=b'one too many')
+    assert response.status_code == 409
+
+    assert client.delete(f"/submissions/{submissions[0]['id']}").status_code == 204
+    assert quota_used(app, form['id']) == limit - 1
+    assert upload(client, form['code'], data=b'one too many').status_code == 200
+
+
+def test_rejected_submission_frees_its_slot(app, client):
+    form = create_form(client, {'minSizeBytes': 1000})
+    response = upload(client, form['code'])
+    assert response.status_code == 200
+    assert response.get_json()['ok'] is False
+    assert quota_used(app, form['id']) == 0
+    response = upload(client, form['code'], data=b'x' * 1000)
+    assert response.get_json()['ok'] is True
+
+
+def test_anonymous_submissions_are_not_counted(app, client):
+    form = create_form(client)
+    anonymous = app.test_client()
+    assert [upload(anonymous, form['code'], data=b'%d' % i).status_code for i in range(3)] == [200] * 3
+    assert quota_used(app, form['id']) is None
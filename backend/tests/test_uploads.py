@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+import routes
+from conftest import create_form, signin, stored_blobs
+
+DATA = b'resumable upload ' * 100
+
+
+def start_upload(client, code):
+    """Creates a session for DATA and sends all of its chunks."""
+    response = client.post(f'/submit/{code}/uploads', json={'filename': 'notes.txt', 'sizeBytes': len(DATA),
+                                                           'mimeType': 'text/plain'})
+    assert response.status_code == 201, response.data
+    upload = response.get_json()
+    size = upload['chunkSize']
+    for index in range(upload['chunkCount']):
+        response = client.put(f"/uploads/{upload['id']}/chunks/{index}", data=DATA[index * size:(index + 1) * size])
+        assert response.status_code == 200, response.data
+    return upload['id']
+
+
+@pytest.fixture
+def form(client):
+    return create_form(client, allowMultipleSubmissionsPerUser=True, maxSubmissionsPerUser=0)
+
+
+def test_second_complete_while_finalizing_is_refused(app, client, form, monkeypatch):
+    upload_id = start_upload(client, form['code'])
+    finalizing = threading.Event()
+    release = threading.Event()
+    finalize_upload = routes.finalize_upload
+
+    def blocking_finalize(*args, **kwargs):
+        finalizing.set()
+        assert release.wait(10)
+        return finalize_upload(*args, **kwargs)
+
+    monkeypatch.setattr(routes, 'finalize_upload', blocking_finalize)
+    first = {}
+    thread = threading.Thread(target=lambda: first.update(response=client.post(f'/uploads/{upload_id}/complete')))
+    thread.start()
+    try:
+        assert finalizing.wait(10)
+        retry = app.test_client()
+        signin(retry, 'alice')
+        response = retry.post(f'/uploads/{upload_id}/complete')
+        assert response.status_code == 409
+        assert response.get_json()['errors'] == ['Upload is already being completed']
+        # Nor can the upload be aborted under the running /complete
+        assert retry.delete(f'/uploads/{upload_id}').status_code == 409
+    finally:
+        release.set()
+        thread.join()
+
+    assert first['response'].status_code == 200, first['response'].data
+    submissions = client.get(f"/forms/{form['id']}/submissions").get_json()['items']
+    assert len(submissions) == 1
+    assert len(stored_blobs(app)) == 1
+
+
+def test_failed_finalize_releases_the_claim(client, form, monkeypatch):
+    upload_id = start_upload(client, form['code'])
+    finalize_upload = routes.finalize_upload
+
+    def failing_finalize(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(routes, 'finalize_upload', failing_finalize)
+    assert client.post(f'/uploads/{upload_id}/complete').status_code == 500
+    assert client.get(f'/uploads/{upload_id}').get_json()['status'] == 'uploading'
+
+    monkeypatch.setattr(routes, 'finalize_upload', finalize_upload)
+    response = client.post(f'/uploads/{upload_id}/complete')
+    assert response.status_code == 200, response.data
+    assert response.get_json()['ok']
+
+
+def test_complete_before_all_chunks_arrive(client, form):
+    response = client.post(f"/submit/{form['code']}/uploads", json={'filename': 'notes.txt', 'sizeBytes': len(DATA)})
+    upload_id = response.get_json()['id']
+    response = client.post(f'/uploads/{upload_id}/complete')
+    assert response.status_code == 409
+    assert response.get_json()['errors'] == ['Upload incomplete']
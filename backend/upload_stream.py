@@ -0,0 +1,127 @@
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Field, File, Data, Epilogue
+from storage import BlobWriter, DEFAULT_BUFFER_SIZE, DEFAULT_SHARD_DEPTH
+
+# Request bytes that aren't file content: boundaries, part headers and small
+# fields. A Content-Length above maxSizeBytes plus this cannot hold a valid file.
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Other form fields are skipped, but their size is still capped
+_MAX_FIELD_SIZE = 64 * 1024
+
+
+class UploadRefused(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class MultipartUpload:
+    """
+    Incremental multipart/form-data parser that writes the `field` file part
+    to the blob store as body data is fed in, for callers that receive the
+    body themselves (see save_streamed_file and asgi.py).
+
+    `check(filename, mime_type)` sees the part headers before any file data is
+    stored and returns an error message to refuse the file. feed() raises
+    UploadRefused as soon as the upload breaks a limit; the caller must then
+    call abort().
+    """
+
+    def __init__(self, boundary, upload_folder, check=None, max_size=None,
+                 shard_depth=DEFAULT_SHARD_DEPTH, field='file'):
+        self.upload_folder = upload_folder
+        self.check = check
+        self.max_size = max_size
+        self.shard_depth = shard_depth
+        self.field = field
+        self.filename = None
+        self.mime_type = None
+        self.complete = False
+        self._decoder = MultipartDecoder(boundary.encode('latin-1'))
+        self._writer = None
+        self._receiving = False
+        self._other_bytes = 0
+
+    def feed(self, data):
+        """
+        Parses the next piece of the body; empty `data` marks its end.
+        """
+        self._decoder.receive_data(data or None)
+        try:
+            while not self.complete:
+                event = self._decoder.next_event()
+                if isinstance(event, NeedData):
+                    if not data:
+                        raise UploadRefused(400, 'Incomplete upload')
+                    return
+                self._handle(event)
+        except ValueError:
+            # The decoder raises on malformed boundaries and part headers
+            raise UploadRefused(400, 'Malformed multipart body')
+
+    def _handle(self, event):
+        if isinstance(event, File) and event.name == self.field and self._writer is None:
+            self.filename = event.filename
+            self.mime_type = parse_options_header(event.headers.get('Content-Type', 'application/octet-stream'))[0]
+            if not self.filename:
+                raise UploadRefused(400, 'No selected file')
+            error = self.check(self.filename, self.mime_type) if self.check else None
+            if error:
+                raise UploadRefused(415, error)
+            self._writer = BlobWriter(self.upload_folder, self.shard_depth)
+            self._receiving = True
+        elif isinstance(event, (File, Field)):
+            self._receiving = False
+        elif isinstance(event, Data):
+            if self._receiving:
+                self._writer.write(event.data)
+                if self.max_size and self._writer.size > self.max_size:
+                    raise UploadRefused(413, f'File too large (max {self.max_size} bytes)')
+                self._receiving = event.more_data
+            else:
+                self._other_bytes += len(event.data)
+                if self._other_bytes > _MAX_FIELD_SIZE:
+                    raise UploadRefused(413, 'Form fields too large')
+        elif isinstance(event, Epilogue):
+            self.complete = True
+
+    def commit(self):
+        """
+        Stores the file once the whole body has been fed.
+        Returns (file_hash, filename, mime_type, is_new).
+        """
+        if not self.complete:
+            raise UploadRefused(400, 'Incomplete upload')
+        if self._writer is None:
+            raise UploadRefused(400, 'No file part')
+        file_hash, is_new = self._writer.commit()
+        self._writer = None
+        return file_hash, self.filename, self.mime_type, is_new
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+
+def save_streamed_file(stream, boundary, upload_folder, check=None, max_size=None,
+                       buffer_size=DEFAULT_BUFFER_SIZE, shard_depth=DEFAULT_SHARD_DEPTH, field='file'):
+    """
+    Parses a multipart/form-data body straight from `stream` and writes the
+    `field` file part to the blob store, without spooling the request first.
+    Reading stops as soon as the upload is refused (see MultipartUpload).
+
+    Returns ((file_hash, filename, mime_type, is_new), None) on success, or
+    (None, (http_status, message)) if the upload was refused.
+    """
+    upload = MultipartUpload(boundary, upload_folder, check, max_size, shard_depth, field)
+    try:
+        while not upload.complete:
+            upload.feed(stream.read(buffer_size))
+        return upload.commit(), None
+    except UploadRefused as e:
+        return None, (e.status, e.message)
+    finally:
+        upload.abort()
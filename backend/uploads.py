@@ -0,0 +1,97 @@
+import os
+import time
+import hashlib
+import threading
+from storage import staging_dir, commit_blob, DEFAULT_BUFFER_SIZE, DEFAULT_SHARD_DEPTH
+import metrics
+
+# Running SHA-256 of each upload session, keyed by session id and stored with
+# the offset it has hashed up to. Finalizing an upload only needs hexdigest().
+# hashlib state can't be persisted, so if this process didn't see the earlier
+# chunks (restart, another worker) it is rebuilt from the staging file.
+_hashers = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def partial_path(upload_folder, upload_id):
+    return os.path.join(staging_dir(upload_folder), f'{upload_id}.part')
+
+
+def _session_lock(upload_id):
+    with _registry_lock:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+
+def _hasher_at(upload_folder, upload_id, offset):
+    """
+    Returns a hash object covering the first `offset` bytes of the upload.
+    """
+    state = _hashers.get(upload_id)
+    if state and state[0] == offset:
+        return state[1]
+
+    hasher = hashlib.sha256()
+    remaining = offset
+    path = partial_path(upload_folder, upload_id)
+    if remaining:
+        with open(path, 'rb') as f:
+            while remaining:
+                block = f.read(min(DEFAULT_BUFFER_SIZE, remaining))
+                if not block:
+                    raise IOError(f'Staged upload is shorter than {offset} bytes')
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def append_chunk(upload_folder, upload_id, offset, data):
+    """
+    Writes a chunk at `offset` of the staging file and folds it into the running hash.
+    Chunks must arrive in order. Returns the new received byte count.
+    """
+    with _session_lock(upload_id):
+        hasher = _hasher_at(upload_folder, upload_id, offset)
+        path = partial_path(upload_folder, upload_id)
+        mode = 'r+b' if os.path.exists(path) else 'wb'
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+        start = time.perf_counter()
+        hasher.update(data)
+        metrics.record_hash(len(data), time.perf_counter() - start)
+        _hashers[upload_id] = (offset + len(data), hasher)
+        return offset + len(data)
+
+
+def forget_chunk_state(upload_id):
+    """
+    Drops the in-memory hash state, forcing a rebuild from disk on the next chunk.
+    """
+    with _registry_lock:
+        _hashers.pop(upload_id, None)
+        _locks.pop(upload_id, None)
+
+
+def finalize_upload(upload_folder, upload_id, size, shard_depth=DEFAULT_SHARD_DEPTH):
+    """
+    Moves a fully received upload into the content-addressed store.
+    Returns (file_hash, is_new).
+    """
+    with _session_lock(upload_id):
+        file_hash = _hasher_at(upload_folder, upload_id, size).hexdigest()
+        is_new = commit_blob(partial_path(upload_folder, upload_id), upload_folder, file_hash, shard_depth)
+    forget_chunk_state(upload_id)
+    metrics.record_blob(size, is_new)
+    return file_hash, is_new
+
+
+def discard_upload(upload_folder, upload_id):
+    """
+    Deletes the staging file of an abandoned upload.
+    """
+    forget_chunk_state(upload_id)
+    path = partial_path(upload_folder, upload_id)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,56 @@
+from sqlalchemy.orm import make_transient_to_detached
+from cache import LRUCache
+from models import db, User
+
+# Detached User rows keyed by id, for Flask-Login's user_loader. Each request
+# gets its own session-bound copy via merge(load=False), which copies the
+# cached state without a query. Entries live for USER_CACHE_TTL seconds; this
+# process drops them as soon as the account changes, other processes within
+# the TTL, so keep it short: a deleted account stays signed in elsewhere
+# until then.
+_memory = LRUCache(maxsize=4096, ttl=5)
+
+# Never held in the cache; loaded from the database if a request needs it
+_UNCACHED = {'password_hash'}
+
+
+def init_app(app):
+    """
+    Sizes the cache from USER_CACHE_SIZE and USER_CACHE_TTL. Called once by
+    create_app().
+    """
+    _memory.maxsize = app.config['USER_CACHE_SIZE']
+    _memory.ttl = app.config['USER_CACHE_TTL']
+
+
+def load(user_id):
+    """
+    Returns the User for a session's id, attached to the current session,
+    or None if it doesn't exist.
+    """
+    cached = _memory.get(user_id)
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    # A separate copy, so the cached state isn't expired or modified along
+    # with this request's instance. Columns left out are marked expired and
+    # load on first access.
+    snapshot = User(**{c.key: getattr(user, c.key) for c in User.__table__.columns if c.key not in _UNCACHED})
+    make_transient_to_detached(snapshot)
+    _memory.set(user_id, snapshot)
+    return user
+
+
+def invalidate(user_id):
+    _memory.pop(user_id)
+
+
+def clear():
+    _memory.clear()
+
+
+def stats():
+    return _memory.stats()
@@ -1,36 +1,207 @@
+import io
 import os
 import json
 import subprocess
+from flask import current_app, has_app_context
 from PIL import Image
+from models import CONSTRAINTS_VERSION
+import probe_cache
+import metrics
+from probe_executor import get_executor
 
-def get_video_metadata(file_path):
+# Bounded-probe defaults, overridden by the PROBE_* config settings
+DEFAULT_PROBE_LIMITS = {
+    'PROBE_MODE': 'bounded',
+    'PROBE_MAX_BYTES': 1024 * 1024,
+    'PROBE_MAX_ANALYZE_MS': 1000,
+    'PROBE_IMAGE_HEADER_BYTES': 256 * 1024,
+    'PROBE_TIMEOUT_SECONDS': 30,
+}
+
+def _probe_limits():
+    config = current_app.config if has_app_context() else {}
+    return {key: config.get(key, default) for key, default in DEFAULT_PROBE_LIMITS.items()}
+
+def _run_ffprobe(file_path, max_bytes=None, max_analyze_ms=None, timeout=None):
     """
-    Uses ffprobe to extract metadata from a video file.
+    Runs ffprobe once through the probe executor, which caps how many run at
+    a time. Raises subprocess.TimeoutExpired if it runs longer than `timeout`
+    seconds (the process is killed).
+    """
+    cmd = ['ffprobe', '-v', 'error']
+    if max_bytes:
+        cmd += ['-probesize', str(max_bytes)]
+    if max_analyze_ms:
+        cmd += ['-analyzeduration', str(max_analyze_ms * 1000)]
+    cmd += ['-print_format', 'json', '-show_format', '-show_streams', file_path]
+    returncode, stdout, stderr = get_executor().run(cmd, timeout)
+    if returncode != 0:
+        return None, f"FFprobe error: {stderr}"
+    return json.loads(stdout), None
+
+def _ffprobe_conclusive(data):
+    """
+    Whether a bounded probe found everything validation needs: a duration,
+    and codec plus dimensions (video) or sample rate (audio).
+    """
+    duration = data.get('format', {}).get('duration')
+    if not duration or duration == 'N/A':
+        return False
+    media = [s for s in data.get('streams', []) if s.get('codec_type') in ('video', 'audio')]
+    for stream in media:
+        if not stream.get('codec_name'):
+            return False
+        if stream['codec_type'] == 'video' and not (stream.get('width') and stream.get('height')):
+            return False
+        if stream['codec_type'] == 'audio' and not stream.get('sample_rate'):
+            return False
+    return bool(media)
+
+def get_video_metadata(file_path, limits=None):
     """
+    Uses ffprobe to extract metadata from a video (or audio) file.
+
+    In bounded mode ffprobe examines at most PROBE_MAX_BYTES and
+    PROBE_MAX_ANALYZE_MS of the stream, which is enough for the container
+    headers of most files. The file is probed again without those caps only
+    if the result is missing a duration, codec or dimensions. Each run is
+    killed after PROBE_TIMEOUT_SECONDS.
+    """
+    limits = limits or _probe_limits()
+    timeout = limits['PROBE_TIMEOUT_SECONDS'] or None
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            file_path
-        ]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            return None, f"FFprobe error: {result.stderr}"
-        
-        data = json.loads(result.stdout)
-        return data, None
+        if limits['PROBE_MODE'] == 'bounded':
+            data, error = _run_ffprobe(file_path, limits['PROBE_MAX_BYTES'], limits['PROBE_MAX_ANALYZE_MS'], timeout)
+            if data is not None and _ffprobe_conclusive(data):
+                return data, None
+        return _run_ffprobe(file_path, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, f"FFprobe timed out after {timeout}s"
     except Exception as e:
         return None, str(e)
 
-def validate_submission(file_path, mime_type, constraints, original_filename=None):
+def _image_info(img):
+    # Only parse EXIF the header already holds: without it, _getexif() can
+    # decode the whole image (e.g. PNG) looking for it
+    has_exif = bool(hasattr(img, '_getexif') and 'exif' in img.info and img._getexif())
+    return {
+        'width': img.size[0],
+        'height': img.size[1],
+        'format': img.format,
+        'mode': img.mode,
+        'hasExif': has_exif
+    }
+
+def get_image_metadata(file_path, limits=None):
+    """
+    Uses Pillow to read image dimensions and format. Only the header is decoded.
+    In bounded mode Pillow is given just the first PROBE_IMAGE_HEADER_BYTES;
+    the file is opened in full only if the header doesn't fit in that.
+    """
+    limits = limits or _probe_limits()
+    if limits['PROBE_MODE'] == 'bounded':
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(limits['PROBE_IMAGE_HEADER_BYTES'])
+            with Image.open(io.BytesIO(header)) as img:
+                return _image_info(img), None
+        except Exception:
+            pass  # Inconclusive; fall back to the full file
+    try:
+        with Image.open(file_path) as img:
+            return _image_info(img), None
+    except Exception as e:
+        return None, str(e)
+
+def probe_tool(mime_type):
+    """
+    Returns the tool used to probe a MIME type ('ffprobe', 'pillow'), or None.
+    """
+    if mime_type.startswith('video/') or mime_type.startswith('audio/'):
+        return 'ffprobe'
+    if mime_type.startswith('image/'):
+        return 'pillow'
+    return None
+
+def get_media_probe(file_path, mime_type, content_hash=None):
+    """
+    Probes a file with ffprobe or Pillow depending on its MIME type.
+    When content_hash is given, results are served from and saved to the
+    probe cache, so identical bytes are only ever probed once.
+    Returns (data, error).
+    """
+    tool = probe_tool(mime_type)
+    if tool is None:
+        return None, None
+
+    if content_hash:
+        cached = probe_cache.lookup(content_hash, tool)
+        metrics.PROBE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        if cached is not None:
+            return cached, None
+
+    with metrics.PROBE_DURATION.time(family=metrics.mime_family(mime_type), tool=tool):
+        if tool == 'ffprobe':
+            data, error = get_video_metadata(file_path)
+        else:
+            data, error = get_image_metadata(file_path)
+
+    if content_hash and data is not None:
+        probe_cache.store(content_hash, tool, data)
+    return data, error
+
+def _extension_list(extensions):
+    return [ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in extensions]
+
+def check_file_type(constraints, filename, mime_type, constraints_version=CONSTRAINTS_VERSION):
+    """
+    Checks an upload's filename and declared MIME type against the form's
+    constraints. Needs no file data, so uploads can be turned away early.
+      customExtensions     the extension must be one of these
+      allowedTypes, allowedExtensions
+                           unless allowAllTypes is set, the MIME type (exact, or
+                           a family such as 'video/*') or the extension must match.
+                           Only for forms saved with constraints_version 2 or
+                           later; older forms never had these lists enforced.
+    Returns an error message, or None if the file is acceptable.
+    """
+    _, file_ext = os.path.splitext(filename or '')
+    file_ext = file_ext.lower()
+
+    custom_extensions = constraints.get('customExtensions', [])
+    if custom_extensions:
+        if not filename:
+            return "Original filename required for extension validation"
+        allowed_exts = _extension_list(custom_extensions)
+        if file_ext not in allowed_exts:
+            return f"Extension {file_ext} not allowed. Allowed: {', '.join(allowed_exts)}"
+
+    if constraints.get('allowAllTypes') or constraints_version < 2:
+        return None
+    allowed_types = [t.lower() for t in constraints.get('allowedTypes') or []]
+    allowed_exts = _extension_list(constraints.get('allowedExtensions') or [])
+    if not allowed_types and not allowed_exts:
+        return None
+    mime_type = (mime_type or '').lower()
+    for allowed in allowed_types:
+        if mime_type == allowed or (allowed.endswith('/*') and mime_type.startswith(allowed[:-1])):
+            return None
+    if file_ext and file_ext in allowed_exts:
+        return None
+    return f"File type {mime_type or 'unknown'} not allowed"
+
+def validate_submission(file_path, mime_type, constraints, original_filename=None, content_hash=None, file_size=None,
+                        constraints_version=CONSTRAINTS_VERSION):
     """
     Validates a file against the given constraints.
+    With content_hash (and file_size) set, a previously probed blob is checked
+    from the probe cache without opening the file.
+    `metadata` holds only the extracted fields; the full probe output stays in
+    the probe cache (ProbeResult).
     Returns (passed: bool, message: str, metadata: dict).
     """
-    file_size = os.path.getsize(file_path)
+    if file_size is None:
+        file_size = os.path.getsize(file_path)
     
     # 1. Size Check
     if constraints.get('minSizeBytes') and file_size < constraints['minSizeBytes']:
@@ -42,21 +213,14 @@ def validate_submission(file_path, mime_type, constraints, original_filename=Non
     metadata = {}
 
 
-    custom_extensions = constraints.get('customExtensions', [])
-    if custom_extensions:
-        if not original_filename:
-             return False, "Original filename required for extension validation", {}
-
-        allowed_exts = [ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in custom_extensions]
-        _, file_ext = os.path.splitext(original_filename)
-        
-        if file_ext.lower() not in allowed_exts:
-
-             return False, f"Extension {file_ext} not allowed. Allowed: {', '.join(allowed_exts)}", {}
+    # 2. Extension / type check
+    type_error = check_file_type(constraints, original_filename, mime_type, constraints_version)
+    if type_error:
+        return False, type_error, {}
 
     # 3. Media Validation
     if mime_type.startswith('video/'):
-        raw_meta, error = get_video_metadata(file_path)
+        raw_meta, error = get_media_probe(file_path, mime_type, content_hash)
         if error:
             return False, f"Invalid video file: {error}", {}
         
@@ -73,8 +237,7 @@ def validate_submission(file_path, mime_type, constraints, original_filename=Non
             'width': width,
             'height': height,
             'duration': duration,
-            'codec': video_stream.get('codec_name'),
-            'raw': raw_meta
+            'codec': video_stream.get('codec_name')
         }
 
         video_constraints = constraints.get('video', {})
@@ -87,25 +250,25 @@ def validate_submission(file_path, mime_type, constraints, original_filename=Non
             return False, f"Duration {duration}s > max {video_constraints['maxDurationSec']}s", metadata
 
     elif mime_type.startswith('image/'):
-        try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-                metadata = {'width': width, 'height': height, 'format': img.format}
-                
-                image_constraints = constraints.get('image', {})
-                if image_constraints.get('minWidth') and width < image_constraints['minWidth']:
-                    return False, f"Width {width} < min {image_constraints['minWidth']}", metadata
-                if image_constraints.get('maxWidth') and width > image_constraints['maxWidth']:
-                    return False, f"Width {width} > max {image_constraints['maxWidth']}", metadata
-                if image_constraints.get('minHeight') and height < image_constraints['minHeight']:
-                    return False, f"Height {height} < min {image_constraints['minHeight']}", metadata
-                if image_constraints.get('maxHeight') and height > image_constraints['maxHeight']:
-                    return False, f"Height {height} > max {image_constraints['maxHeight']}", metadata
-        except Exception as e:
-            return False, f"Invalid image: {str(e)}", {}
+        image_meta, error = get_media_probe(file_path, mime_type, content_hash)
+        if error:
+            return False, f"Invalid image: {error}", {}
+
+        width, height = image_meta['width'], image_meta['height']
+        metadata = {'width': width, 'height': height, 'format': image_meta['format']}
+
+        image_constraints = constraints.get('image', {})
+        if image_constraints.get('minWidth') and width < image_constraints['minWidth']:
+            return False, f"Width {width} < min {image_constraints['minWidth']}", metadata
+        if image_constraints.get('maxWidth') and width > image_constraints['maxWidth']:
+            return False, f"Width {width} > max {image_constraints['maxWidth']}", metadata
+        if image_constraints.get('minHeight') and height < image_constraints['minHeight']:
+            return False, f"Height {height} < min {image_constraints['minHeight']}", metadata
+        if image_constraints.get('maxHeight') and height > image_constraints['maxHeight']:
+            return False, f"Height {height} > max {image_constraints['maxHeight']}", metadata
 
     elif mime_type.startswith('audio/'):
-        raw_meta, error = get_video_metadata(file_path)  # ffprobe works for audio too
+        raw_meta, error = get_media_probe(file_path, mime_type, content_hash)  # ffprobe works for audio too
         if error:
             return False, f"Invalid audio file: {error}", {}
         
@@ -125,8 +288,7 @@ def validate_submission(file_path, mime_type, constraints, original_filename=Non
             'sampleRate': sample_rate,
             'channels': channels,
             'duration': duration,
-            'bitRate': bit_rate,
-            'raw': raw_meta
+            'bitRate': bit_rate
         }
         
         audio_constraints = constraints.get('audio', {})
@@ -146,7 +308,7 @@ def validate_submission(file_path, mime_type, constraints, original_filename=Non
 
     return True, "Valid", metadata
 
-def get_file_info(file_path, mime_type):
+def get_file_info(file_path, mime_type, content_hash=None):
     """
     Extracts comprehensive information from a file for debugging purposes.
     Returns dict with file info and the tool used to extract it.
@@ -159,7 +321,7 @@ def get_file_info(file_path, mime_type):
     
     # Try video metadata with ffprobe
     if mime_type.startswith('video/'):
-        raw_meta, error = get_video_metadata(file_path)
+        raw_meta, error = get_media_probe(file_path, mime_type, content_hash)
         if not error and raw_meta:
             info['tools'].append('ffprobe')
             
@@ -185,24 +347,24 @@ def get_file_info(file_path, mime_type):
     
     # Try image metadata with Pillow
     elif mime_type.startswith('image/'):
-        try:
-            with Image.open(file_path) as img:
-                info['tools'].append('Pillow')
-                info['image'] = {
-                    'width': img.size[0],
-                    'height': img.size[1],
-                    'format': img.format,
-                    'mode': img.mode
-                }
-                # Get additional EXIF data if available
-                if hasattr(img, '_getexif') and img._getexif():
-                    info['hasExif'] = True
-        except Exception as e:
-            info['error'] = str(e)
+        image_meta, error = get_media_probe(file_path, mime_type, content_hash)
+        if not error and image_meta:
+            info['tools'].append('Pillow')
+            info['image'] = {
+                'width': image_meta['width'],
+                'height': image_meta['height'],
+                'format': image_meta['format'],
+                'mode': image_meta['mode']
+            }
+            # Get additional EXIF data if available
+            if image_meta.get('hasExif'):
+                info['hasExif'] = True
+        else:
+            info['error'] = error
     
     # Try audio metadata with ffprobe
     elif mime_type.startswith('audio/'):
-        raw_meta, error = get_video_metadata(file_path)  # ffprobe works for audio too
+        raw_meta, error = get_media_probe(file_path, mime_type, content_hash)  # ffprobe works for audio too
         if not error and raw_meta:
             info['tools'].append('ffprobe')
             
@@ -0,0 +1,137 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from models import db, Submission, SubmissionValidationResult
+from storage import resolve_path
+from blobs import release_blobs
+from quotas import release_quotas
+from validation import validate_submission
+import form_cache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def process_submission(submission_id):
+    """
+    Validates a submission in the 'processing' state and records the outcome:
+    status becomes 'accepted' or 'rejected' and a SubmissionValidationResult row is written.
+    Rejected submissions release their blob and give the submitter's quota slot back;
+    the file is deleted if nothing else uses it.
+    Must run inside an app context.
+    """
+    submission = Submission.query.get(submission_id)
+    if not submission or submission.status != 'processing':
+        return
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    shard_depth = current_app.config['STORAGE_SHARD_DEPTH']
+    form = form_cache.get_form(submission.form_id)
+    file_path = resolve_path(upload_folder, submission.file_path, shard_depth) if submission.file_path else None
+
+    family = metrics.mime_family(submission.mime_type)
+    try:
+        if not form:
+            passed, message, metadata = False, 'Form no longer exists', {}
+        elif not file_path or not os.path.exists(file_path):
+            passed, message, metadata = False, 'File not found on server', {}
+        else:
+            with metrics.STAGE_DURATION.time(stage='validate'):
+                passed, message, metadata = validate_submission(
+                    file_path, submission.mime_type, form.constraints or {},
+                    original_filename=submission.filename,
+                    content_hash=submission.file_path, file_size=submission.size_bytes,
+                    constraints_version=form.constraints_version)
+        metrics.VALIDATIONS.inc(family=family, result='passed' if passed else 'failed')
+    except Exception as e:
+        logger.exception('Validation of submission %s failed', submission_id)
+        metrics.VALIDATIONS.inc(family=family, result='error')
+        passed, message, metadata = False, f'Validation error: {str(e)}', {}
+
+    changes = {
+        'status': 'accepted' if passed else 'rejected',
+        'metadata_json': metadata
+    }
+    released_path = None
+    if not passed:
+        released_path = submission.file_path
+        changes['file_path'] = None
+
+    # Conditional on still being 'processing': after a restart another
+    # process may have picked up the same row.
+    updated = Submission.query.filter_by(id=submission_id, status='processing').update(changes)
+    if not updated:
+        db.session.rollback()
+        return
+    db.session.add(SubmissionValidationResult(submission_id=submission_id, passed=passed, message=message))
+    if not passed:
+        release_blobs({released_path: 1})
+        release_quotas({(submission.form_id, submission.submitted_by): 1})
+    db.session.commit()
+
+
+class ValidationPool:
+    """
+    Bounded thread pool that validates submissions off the request thread.
+
+    VALIDATION_WORKERS threads run validation; up to VALIDATION_QUEUE_SIZE more
+    submissions may wait. When the queue is full, validation runs inline in the
+    caller, which slows producers down instead of dropping work. With
+    VALIDATION_WORKERS = 0 everything runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        workers = app.config.get('VALIDATION_WORKERS', 0)
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='validation')
+            self._slots = threading.BoundedSemaphore(workers + app.config.get('VALIDATION_QUEUE_SIZE', 0))
+        app.extensions['validation_pool'] = self
+
+    def submit(self, submission_id, block=False):
+        """
+        Queues a submission for validation. Returns True if it was queued and
+        False if it was validated inline.
+        """
+        if self._executor is None or not self._slots.acquire(blocking=block):
+            process_submission(submission_id)
+            return False
+        future = self._executor.submit(self._run, submission_id)
+        future.add_done_callback(lambda _: self._slots.release())
+        return True
+
+    def _run(self, submission_id):
+        with self.app.app_context():
+            process_submission(submission_id)
+
+    def recover(self):
+        """
+        Re-queues submissions left in 'processing' by a previous run.
+        """
+        with self.app.app_context():
+            pending = [s.id for s in Submission.query.with_entities(Submission.id).filter_by(status='processing')]
+        if not pending:
+            return
+        logger.info('Re-queueing %d submissions left in processing', len(pending))
+
+        if self._executor is None:
+            with self.app.app_context():
+                for submission_id in pending:
+                    process_submission(submission_id)
+            return
+
+        # Feed the pool from a background thread so startup isn't blocked
+        def feed():
+            for submission_id in pending:
+                self.submit(submission_id, block=True)
+        threading.Thread(target=feed, name='validation-recovery', daemon=True).start()
+
@@ -2,24 +2,65 @@
 
 import { useEffect, useState } from "react"
 import { useParams } from "next/navigation"
-import { getForm, getFormSubmissions, getUser, getUserProfile, deleteSubmission, deleteForm } from "@/lib/api"
+import { getForm, getFormSubmissions, getUsers, getUser, getUserProfile, deleteSubmission, deleteForm, getSubmissionPreviewUrl } from "@/lib/api"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { DataTable } from "@/components/data-table"
 import type { ColumnDef } from "@tanstack/react-table"
 import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
-import { exportToJSON, downloadFile, downloadZipPlaceholder } from "@/lib/export"
+import { exportSubmissions, downloadFile, downloadZip } from "@/lib/export"
 import { DropdownMenu, DropdownMenuContent, DropdownMenuItem, DropdownMenuTrigger } from "@/components/ui/dropdown-menu"
 import { MoreHorizontal } from "lucide-react"
 import AuthGuard from "@/components/auth-guard"
 import Link from "next/link"
 
+type SubmissionRow = {
+  id: string
+  filename: string
+  mimeType: string
+  status: string
+  when: string
+  whenIso: string
+  submitterId?: string
+  submitterName?: string
+}
+
+const PAGE_SIZE = 100
+
+// One page of the form's submissions, newest first, with each distinct submitter looked up once.
+async function fetchSubmissionPage(formId: string, cursor?: string) {
+  const page = await getFormSubmissions(formId, {
+    limit: PAGE_SIZE,
+    cursor,
+    fields: ["id", "filename", "mimeType", "status", "createdAt", "submittedBy"],
+  })
+  const users = await getUsers(page.items.map((x) => x.submittedBy ?? ""))
+  const rows: SubmissionRow[] = page.items.map((x) => {
+    const submitter = x.submittedBy ? users[x.submittedBy] : undefined
+    return {
+      id: x.id,
+      filename: x.filename,
+      mimeType: x.mimeType,
+      status: x.status,
+      when: new Date(x.createdAt).toLocaleString(),
+      whenIso: x.createdAt,
+      submitterId: x.submittedBy ? (submitter?.id ?? x.submittedBy) : undefined,
+      submitterName: x.submittedBy ? (submitter?.name ?? x.submittedBy) : undefined,
+    }
+  })
+  return { rows, nextCursor: page.nextCursor ?? null, total: page.total }
+}
+
 export default function FormDetailPage() {
   const params = useParams<{ id: string }>()
   const id = params?.id as string
   const [title, setTitle] = useState<string>("")
   const [code, setCode] = useState<string>("")
-  const [subs, setSubs] = useState<Array<{ id: string; filename: string; status: string; when: string; whenIso: string; submitterId?: string; submitterName?: string }>>([])
+  const [subs, setSubs] = useState<SubmissionRow[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [total, setTotal] = useState<number | undefined>(undefined)
+  const [loadingMore, setLoadingMore] = useState(false)
+  const [selected, setSelected] = useState<SubmissionRow[]>([])
   const [owner, setOwner] = useState<{ id: string; name: string } | null>(null)
 
   useEffect(() => {
@@ -33,30 +74,46 @@ export default function FormDetailPage() {
           const name = (p?.name && p.name.trim()) ? p!.name! : (u?.username ?? f.createdBy)
           setOwner({ id: u?.id ?? f.createdBy, name })
         }
-        const s = await getFormSubmissions(id)
-        const rows = await Promise.all(s.items.map(async (x) => {
-          let submitterName: string | undefined
-          let submitterId: string | undefined
-          if (x.submittedBy) {
-            const [su, sp] = await Promise.all([getUser(x.submittedBy), getUserProfile(x.submittedBy)])
-            submitterName = (sp?.name && sp.name.trim()) ? sp!.name! : (su?.username ?? x.submittedBy)
-            submitterId = su?.id ?? x.submittedBy
-          }
-          return {
-            id: x.id,
-            filename: x.filename,
-            status: x.status,
-            when: new Date(x.createdAt).toLocaleString(),
-            whenIso: x.createdAt,
-            submitterId,
-            submitterName,
-          }
-        }))
-        setSubs(rows.sort((a, b) => b.whenIso.localeCompare(a.whenIso)))
+        const page = await fetchSubmissionPage(id)
+        setSubs(page.rows)
+        setNextCursor(page.nextCursor)
+        setTotal(page.total)
       })()
   }, [id])
 
+  async function loadMore() {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const page = await fetchSubmissionPage(id, nextCursor)
+      setSubs((prev) => [...prev, ...page.rows])
+      setNextCursor(page.nextCursor)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  async function removeSelected() {
+    if (selected.length === 0) return
+    if (!window.confirm(`Remove ${selected.length} submission(s)?`)) return
+    await Promise.all(selected.map((s) => deleteSubmission(s.id)))
+    setSubs((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
+    setTotal((t) => (t === undefined ? t : t - selected.length))
+    setSelected([])
+  }
+
   const columns: ColumnDef<(typeof subs)[number]>[] = [
+    {
+      id: "preview", header: "", cell: ({ row }) => {
+        const { id: submissionId, mimeType } = row.original
+        const src = /^(image|video)\//.test(mimeType ?? "") ? getSubmissionPreviewUrl(submissionId, "thumb") : null
+        return src ? (
+          // eslint-disable-next-line @next/next/no-img-element
+          <img src={src} alt="" loading="lazy" className="h-10 w-10 rounded object-cover"
+            onError={(e) => { e.currentTarget.style.display = "none" }} />
+        ) : null
+      }
+    },
     { accessorKey: "filename", header: "File" },
     { accessorKey: "status", header: "Status", cell: ({ getValue }) => <span className="capitalize">{String(getValue())}</span> },
     { id: "when", accessorFn: (r) => r.whenIso, header: "When", cell: ({ row }) => row.original.when },
@@ -82,24 +139,17 @@ export default function FormDetailPage() {
     },
   ]
 
-  const [selected, setSelected] = useState<(typeof subs)[number][]>([])
-
   const toolbar = (
     <div className="ml-auto flex items-center gap-2">
       {/* Desktop actions */}
       <div className="hidden md:flex items-center gap-2">
-        <Button size="sm" variant="ghost" onClick={() => exportToJSON(`form-${code || ""}-submissions.json`, subs)}>Download JSON</Button>
+        <Button size="sm" variant="ghost" onClick={() => exportSubmissions(`form-${code || ""}-submissions.csv`, "csv", id)}>Download CSV</Button>
+        <Button size="sm" variant="ghost" onClick={() => exportSubmissions(`form-${code || ""}-submissions.json`, "json", id)}>Download JSON</Button>
         <Button
           size="sm"
           variant="destructive"
           disabled={selected.length === 0}
-          onClick={async () => {
-            if (selected.length === 0) return
-            if (!window.confirm(`Remove ${selected.length} submission(s)?`)) return
-            await Promise.all(selected.map((s) => deleteSubmission(s.id)))
-            setSubs((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
-            setSelected([])
-          }}
+          onClick={removeSelected}
         >
           Delete selected
         </Button>
@@ -108,13 +158,14 @@ export default function FormDetailPage() {
           variant="ghost"
           disabled={selected.length === 0}
           onClick={() =>
-            downloadZipPlaceholder(
+            downloadZip(
               `form-${code || ""}-selected`,
-              selected.map((s) => ({ filename: s.filename, id: s.id }))
+              selected.map((s) => ({ filename: s.filename, id: s.id })),
+              id
             )
           }
         >
-          ZIP selected (placeholder)
+          ZIP selected
         </Button>
       </div>
       {/* Mobile compact menu */}
@@ -127,31 +178,29 @@ export default function FormDetailPage() {
             </Button>
           </DropdownMenuTrigger>
           <DropdownMenuContent align="end">
-            <DropdownMenuItem onClick={() => exportToJSON(`form-${code || ""}-submissions.json`, subs)}>
+            <DropdownMenuItem onClick={() => exportSubmissions(`form-${code || ""}-submissions.csv`, "csv", id)}>
+              Download CSV
+            </DropdownMenuItem>
+            <DropdownMenuItem onClick={() => exportSubmissions(`form-${code || ""}-submissions.json`, "json", id)}>
               Download JSON
             </DropdownMenuItem>
             <DropdownMenuItem
               disabled={selected.length === 0}
-              onClick={async () => {
-                if (selected.length === 0) return
-                if (!window.confirm(`Remove ${selected.length} submission(s)?`)) return
-                await Promise.all(selected.map((s) => deleteSubmission(s.id)))
-                setSubs((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
-                setSelected([])
-              }}
+              onClick={removeSelected}
             >
               Delete selected
             </DropdownMenuItem>
             <DropdownMenuItem
               disabled={selected.length === 0}
               onClick={() =>
-                downloadZipPlaceholder(
+                downloadZip(
                   `form-${code || ""}-selected`,
-                  selected.map((s) => ({ filename: s.filename, id: s.id }))
+                  selected.map((s) => ({ filename: s.filename, id: s.id })),
+                  id
                 )
               }
             >
-              ZIP selected (placeholder)
+              ZIP selected
             </DropdownMenuItem>
           </DropdownMenuContent>
         </DropdownMenu>
@@ -192,6 +241,14 @@ export default function FormDetailPage() {
               searchKeys={["filename", "status", "when"]}
               enableColumnVisibility
             />
+            {nextCursor ? (
+              <div className="flex items-center justify-between pt-4 text-sm text-muted-foreground">
+                <span>Showing {subs.length}{total !== undefined ? ` of ${total}` : ""}</span>
+                <Button size="sm" variant="outline" disabled={loadingMore} onClick={loadMore}>
+                  {loadingMore ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            ) : null}
           </CardContent>
         </Card>
         <div className="flex justify-end">
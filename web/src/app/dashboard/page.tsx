@@ -24,7 +24,7 @@ export default function DashboardPage() {
           title: f.title,
           code: f.code,
           createdAt: f.createdAt,
-          submissions: (await getFormSubmissions(f.id)).total,
+          submissions: (await getFormSubmissions(f.id, { limit: 1, fields: ["id"] })).total ?? 0,
         }))
       )
       setForms(rows)
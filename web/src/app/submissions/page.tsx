@@ -1,12 +1,13 @@
 "use client"
 
-import { useEffect, useState } from "react"
-import { listMySubmissions, getForm, getUser, getUserProfile, deleteSubmission } from "@/lib/api"
+import { useEffect, useRef, useState } from "react"
+import { getMySubmissions, getForm, getUsers, deleteSubmission } from "@/lib/api"
+import type { Form } from "@/lib/types"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { DataTable } from "@/components/data-table"
 import type { ColumnDef } from "@tanstack/react-table"
 import { Button } from "@/components/ui/button"
-import { exportToJSON, downloadFile, downloadZipPlaceholder } from "@/lib/export"
+import { exportSubmissions, downloadFile, downloadZip } from "@/lib/export"
 import { DropdownMenu, DropdownMenuContent, DropdownMenuItem, DropdownMenuTrigger } from "@/components/ui/dropdown-menu"
 import { MoreHorizontal } from "lucide-react"
 import AuthGuard from "@/components/auth-guard"
@@ -22,40 +23,70 @@ type SubmissionRow = {
   ownerName?: string
 }
 
+const PAGE_SIZE = 100
+
+// One page of the user's submissions, newest first. Each distinct form is
+// fetched once (`forms` carries them across pages), and so is each owner.
+async function fetchSubmissionPage(forms: Map<string, Form | null>, cursor?: string) {
+  const page = await getMySubmissions({ limit: PAGE_SIZE, cursor, fields: ["id", "formId", "filename", "status", "createdAt"] })
+  const missing = Array.from(new Set(page.items.map((s) => s.formId))).filter((formId) => !forms.has(formId))
+  const fetched = await Promise.all(missing.map((formId) => getForm(formId)))
+  missing.forEach((formId, i) => forms.set(formId, fetched[i]))
+  const owners = await getUsers(page.items.map((s) => forms.get(s.formId)?.createdBy ?? ""))
+  const rows: SubmissionRow[] = page.items.map((s) => {
+    const f = forms.get(s.formId)
+    const owner = f ? owners[f.createdBy] : undefined
+    return {
+      id: s.id,
+      formTitle: f?.title ?? s.formId,
+      filename: s.filename,
+      status: s.status,
+      when: new Date(s.createdAt).toLocaleString(),
+      whenIso: s.createdAt,
+      ownerId: f ? (owner?.id ?? f.createdBy) : undefined,
+      ownerName: f ? (owner?.name ?? f.createdBy) : undefined,
+    }
+  })
+  return { rows, nextCursor: page.nextCursor ?? null, total: page.total }
+}
+
 export default function MySubmissionsPage() {
   const [rows, setRows] = useState<SubmissionRow[]>([])
   const [selected, setSelected] = useState<SubmissionRow[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [total, setTotal] = useState<number | undefined>(undefined)
+  const [loadingMore, setLoadingMore] = useState(false)
+  const forms = useRef(new Map<string, Form | null>())
 
   useEffect(() => {
     ; (async () => {
-      const subs = await listMySubmissions()
-      const withForm = await Promise.all(
-        subs.map(async (s) => {
-          const f = await getForm(s.formId)
-          let ownerId: string | undefined
-          let ownerName: string | undefined
-          if (f) {
-            const [u, p] = await Promise.all([getUser(f.createdBy), getUserProfile(f.createdBy)])
-            ownerId = u?.id ?? f.createdBy
-            ownerName = (p?.name && p.name.trim()) ? p!.name! : (u?.username ?? f.createdBy)
-          }
-          const createdAt = s.createdAt
-          return {
-            id: s.id,
-            formTitle: f?.title ?? s.formId,
-            filename: s.filename,
-            status: s.status,
-            when: new Date(createdAt).toLocaleString(),
-            whenIso: createdAt,
-            ownerId,
-            ownerName,
-          }
-        })
-      )
-      setRows(withForm.sort((a, b) => b.whenIso.localeCompare(a.whenIso)))
+      const page = await fetchSubmissionPage(forms.current)
+      setRows(page.rows)
+      setNextCursor(page.nextCursor)
+      setTotal(page.total)
     })()
   }, [])
 
+  async function loadMore() {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const page = await fetchSubmissionPage(forms.current, nextCursor)
+      setRows((prev) => [...prev, ...page.rows])
+      setNextCursor(page.nextCursor)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  async function removeSelected() {
+    if (selected.length === 0) return
+    if (!window.confirm(`Delete ${selected.length} submission(s)?`)) return
+    await Promise.all(selected.map((s) => deleteSubmission(s.id)))
+    setRows((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
+    setTotal((t) => (t === undefined ? t : t - selected.length))
+  }
+
   const columns: ColumnDef<(typeof rows)[number]>[] = [
     { accessorKey: "formTitle", header: "Form" },
     { accessorKey: "filename", header: "File" },
@@ -79,17 +110,13 @@ export default function MySubmissionsPage() {
     <div className="ml-auto flex items-center gap-2">
       {/* Desktop actions */}
       <div className="hidden md:flex items-center gap-2">
-        <Button size="sm" variant="ghost" onClick={() => exportToJSON("my-submissions.json", rows)}>Download JSON</Button>
+        <Button size="sm" variant="ghost" onClick={() => exportSubmissions("my-submissions.csv", "csv")}>Download CSV</Button>
+        <Button size="sm" variant="ghost" onClick={() => exportSubmissions("my-submissions.json", "json")}>Download JSON</Button>
         <Button
           size="sm"
           variant="destructive"
           disabled={selected.length === 0}
-          onClick={async () => {
-            if (selected.length === 0) return
-            if (!window.confirm(`Delete ${selected.length} submission(s)?`)) return
-            await Promise.all(selected.map((s) => deleteSubmission(s.id)))
-            setRows((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
-          }}
+          onClick={removeSelected}
         >
           Delete selected
         </Button>
@@ -98,13 +125,13 @@ export default function MySubmissionsPage() {
           variant="ghost"
           disabled={selected.length === 0}
           onClick={() =>
-            downloadZipPlaceholder(
+            downloadZip(
               "my-submissions-selected",
               selected.map((s) => ({ filename: s.filename, id: s.id }))
             )
           }
         >
-          ZIP selected (placeholder)
+          ZIP selected
         </Button>
       </div>
       {/* Mobile compact menu */}
@@ -117,30 +144,28 @@ export default function MySubmissionsPage() {
             </Button>
           </DropdownMenuTrigger>
           <DropdownMenuContent align="end">
-            <DropdownMenuItem onClick={() => exportToJSON("my-submissions.json", rows)}>
+            <DropdownMenuItem onClick={() => exportSubmissions("my-submissions.csv", "csv")}>
+              Download CSV
+            </DropdownMenuItem>
+            <DropdownMenuItem onClick={() => exportSubmissions("my-submissions.json", "json")}>
               Download JSON
             </DropdownMenuItem>
             <DropdownMenuItem
               disabled={selected.length === 0}
-              onClick={async () => {
-                if (selected.length === 0) return
-                if (!window.confirm(`Delete ${selected.length} submission(s)?`)) return
-                await Promise.all(selected.map((s) => deleteSubmission(s.id)))
-                setRows((prev) => prev.filter((r) => !selected.some((s) => s.id === r.id)))
-              }}
+              onClick={removeSelected}
             >
               Delete selected
             </DropdownMenuItem>
             <DropdownMenuItem
               disabled={selected.length === 0}
               onClick={() =>
-                downloadZipPlaceholder(
+                downloadZip(
                   "my-submissions-selected",
                   selected.map((s) => ({ filename: s.filename, id: s.id }))
                 )
               }
             >
-              ZIP selected (placeholder)
+              ZIP selected
             </DropdownMenuItem>
           </DropdownMenuContent>
         </DropdownMenu>
@@ -167,6 +192,14 @@ export default function MySubmissionsPage() {
               searchKeys={["formTitle", "filename", "status", "when"]}
               enableColumnVisibility
             />
+            {nextCursor ? (
+              <div className="flex items-center justify-between pt-4 text-sm text-muted-foreground">
+                <span>Showing {rows.length}{total !== undefined ? ` of ${total}` : ""}</span>
+                <Button size="sm" variant="outline" disabled={loadingMore} onClick={loadMore}>
+                  {loadingMore ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            ) : null}
           </CardContent>
         </Card>
       </div>
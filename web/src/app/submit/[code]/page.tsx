@@ -27,6 +27,8 @@ export default function SubmitByCodePage() {
   const [form, setForm] = useState<Awaited<ReturnType<typeof getFormByCode>>>(null)
   const [ownerName, setOwnerName] = useState<string>("")
   const [ownerId, setOwnerId] = useState<string>("")
+  // Uploaded, but validation hadn't finished when the upload stopped waiting
+  const [stillProcessing, setStillProcessing] = useState(false)
 
   useEffect(() => {
     let mounted = true
@@ -75,8 +77,12 @@ export default function SubmitByCodePage() {
       toast.error(message)
       return { ok: false, errors: [message] }
     }
+    setStillProcessing(false)
     const res = await uploadSubmission({ code, file, onProgress })
-    if (res.ok) toast.success("Upload accepted")
+    if (res.pending) {
+      setStillProcessing(true)
+      toast("Upload received, still processing")
+    } else if (res.ok) toast.success("Upload accepted")
     else toast.error(res.errors?.[0] || "Upload failed")
     return { ok: !!res.ok, errors: res.errors }
   }
@@ -177,6 +183,15 @@ export default function SubmitByCodePage() {
               disabledReason={disabledReason}
               onUpload={handleUpload}
             />
+            {stillProcessing ? (
+              <Alert>
+                <AlertTitle>Still processing</AlertTitle>
+                <AlertDescription>
+                  Your file was uploaded, but checking it is taking longer than usual. The result will appear
+                  under <Link href="/submissions" className="underline underline-offset-4">My Submissions</Link>.
+                </AlertDescription>
+              </Alert>
+            ) : null}
             <div className="text-xs text-muted-foreground">Note: Maximum file size is capped at 100 MB.</div>
           </CardContent>
         </Card>
@@ -5,9 +5,10 @@
  * Later, swap to a real Python backend by setting NEXT_PUBLIC_API_BASE_URL and
  * implementing the fetch calls below.
  */
-import { Form, FormId, FormSpec, Paginated, Profile, Submission, User, UserId } from "./types"
+import { Form, FormId, FormSpec, Paginated, Profile, Submission, SubmissionQuery, User, UserId } from "./types"
 import * as mock from "./mockApi"
 import { fireAuthChanged } from "./auth-events"
+import { sha256File } from "./sha256"
 
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE_URL
 const AUTH_MODE = (process.env.NEXT_PUBLIC_AUTH_MODE || "token").toLowerCase() as "token" | "cookie"
@@ -165,6 +166,21 @@ export async function getUserProfile(userId: UserId): Promise<Profile> {
   return request<Profile>(`/users/${userId}/profile`, { method: "GET" })
 }
 
+export type UserSummary = { id: UserId; username: string; name: string }
+
+// Looks up each distinct user once, keyed by id. `name` is what their profile
+// shows. Unknown ids are left out.
+export async function getUsers(userIds: UserId[]): Promise<Record<UserId, UserSummary>> {
+  const ids = Array.from(new Set(userIds.filter(Boolean)))
+  const found = await Promise.all(ids.map(async (id) => {
+    const u = await getUser(id)
+    if (!u) return null
+    const p = await getUserProfile(id).catch(() => null)
+    return { id: u.id, username: u.username, name: (p?.name && p.name.trim()) ? p.name : u.username }
+  }))
+  return Object.fromEntries(found.filter((u): u is UserSummary => u !== null).map((u) => [u.id, u]))
+}
+
 // Forms (Creator)
 export async function createForm(input: Omit<FormSpec, "code" | "createdAt" | "createdBy"> & { code?: string }): Promise<Form> {
   if (shouldUseMock()) return mock.createForm(input)
@@ -199,9 +215,20 @@ export async function updateForm(id: FormId, patch: Partial<FormSpec>): Promise<
   return request<Form>(`/forms/${id}`, { method: "PATCH", body: JSON.stringify(patch) })
 }
 
-export async function getFormSubmissions(id: FormId): Promise<Paginated<Submission>> {
+function submissionQueryString(query?: SubmissionQuery): string {
+  const params = new URLSearchParams()
+  for (const [key, value] of Object.entries(query || {})) {
+    if (value === undefined || value === null) continue
+    params.set(key, Array.isArray(value) ? value.join(",") : String(value))
+  }
+  const qs = params.toString()
+  return qs ? `?${qs}` : ""
+}
+
+// One page of a form's submissions; follow `nextCursor` for more.
+export async function getFormSubmissions(id: FormId, query?: SubmissionQuery): Promise<Paginated<Submission>> {
   if (shouldUseMock()) return mock.getFormSubmissions(id)
-  return request<Paginated<Submission>>(`/forms/${id}/submissions`, { method: "GET" })
+  return request<Paginated<Submission>>(`/forms/${id}/submissions${submissionQueryString(query)}`, { method: "GET" })
 }
 
 // Submissions (Submitter)
@@ -213,13 +240,46 @@ export async function validateFormCode(code: string): Promise<{ ok: boolean; for
   )
 }
 
+// Below this size, uploading is cheaper than hashing plus an extra round trip
+const PREFLIGHT_MIN_BYTES = 256 * 1024
+
 export async function uploadSubmission(params: {
   code: string
   file: File
   onProgress?: (percent: number) => void
-}): Promise<{ ok: boolean; submission?: Submission; errors?: string[] }> {
+}): Promise<{ ok: boolean; pending?: boolean; submission?: Submission; errors?: string[] }> {
   if (shouldUseMock()) return mock.uploadSubmission(params)
 
+  // Ask whether the server already has these bytes; if so the submission is
+  // made by reference and nothing is uploaded. Only matches files this user
+  // has submitted before.
+  if (params.file.size >= PREFLIGHT_MIN_BYTES) {
+    try {
+      const sha256 = await sha256File(params.file)
+      const pre = await request<{ ok: boolean; exists?: boolean; submission?: Submission; errors?: string[] }>(
+        `/submit/${encodeURIComponent(params.code)}/preflight`,
+        {
+          method: "POST",
+          body: JSON.stringify({
+            sha256,
+            sizeBytes: params.file.size,
+            filename: params.file.name,
+            mimeType: params.file.type || "application/octet-stream",
+          }),
+        }
+      )
+      if (pre.exists) {
+        if (params.onProgress) params.onProgress(100)
+        if (pre.ok && pre.submission?.status === "processing") {
+          return await waitForSubmissionValidation(pre.submission.id)
+        }
+        return pre
+      }
+    } catch {
+      // Fall back to a plain upload, which reports any error itself
+    }
+  }
+
   const formData = new FormData()
   formData.append("file", params.file)
 
@@ -235,15 +295,51 @@ export async function uploadSubmission(params: {
       }
     )
     if (params.onProgress) params.onProgress(100)
+    if (res.ok && res.submission?.status === "processing") {
+      return await waitForSubmissionValidation(res.submission.id)
+    }
     return res
   } catch (err) {
     return { ok: false, errors: [String(err)] }
   }
 }
 
-export async function listMySubmissions(): Promise<Submission[]> {
-  if (shouldUseMock()) return mock.listMySubmissions()
-  return request<Submission[]>(`/me/submissions`, { method: "GET" })
+export async function getSubmissionStatus(
+  id: string
+): Promise<{ id: string; status: Submission["status"]; errors: string[]; submission: Submission }> {
+  if (shouldUseMock()) return mock.getSubmissionStatus(id)
+  return request(`/submissions/${id}/status`, { method: "GET" })
+}
+
+// How long an upload waits for its validation result before reporting it as
+// still processing
+const VALIDATION_WAIT_MS = 2 * 60 * 1000
+
+// Validation runs in the background on the server; poll until it settles or
+// timeoutMs passes. A submission still processing by then (say its worker died
+// and it waits for a server restart) comes back with `pending: true`.
+async function waitForSubmissionValidation(
+  id: string,
+  intervalMs = 1000,
+  timeoutMs = VALIDATION_WAIT_MS
+): Promise<{ ok: boolean; pending?: boolean; submission?: Submission; errors?: string[] }> {
+  const deadline = Date.now() + timeoutMs
+  for (;;) {
+    const s = await getSubmissionStatus(id)
+    if (s.status === "accepted") return { ok: true, submission: s.submission }
+    if (s.status === "rejected") return { ok: false, submission: s.submission, errors: s.errors }
+    if (Date.now() + intervalMs > deadline) return { ok: true, pending: true, submission: s.submission }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
+
+// One page of the current user's submissions; follow `nextCursor` for more.
+export async function getMySubmissions(query?: SubmissionQuery): Promise<Paginated<Submission>> {
+  if (shouldUseMock()) {
+    const items = await mock.listMySubmissions()
+    return { items, total: items.length, pageSize: items.length || 1, nextCursor: null }
+  }
+  return request<Paginated<Submission>>(`/me/submissions${submissionQueryString(query)}`, { method: "GET" })
 }
 
 export async function deleteSubmission(id: string): Promise<void> {
@@ -272,19 +368,38 @@ export async function downloadSubmissionFile(submissionId: string, filename: str
   }
 
   // Real mode: download from backend
+  return saveDownload(`/submissions/${submissionId}/download`, filename)
+}
+
+// Direct URL of a submission's file, for <video>/<img>/<audio> previews.
+// The backend answers range requests (so players can seek) and marks the
+// response immutable, so the browser cache is reused across views.
+export function getSubmissionFileUrl(submissionId: string): string {
+  return `${API_BASE}/submissions/${submissionId}/download`
+}
+
+// URL of a small derivative of a submission's file: "thumb" (images and
+// videos), "poster" (a video frame) or "preview" (a short clip of a video or
+// audio file). Previews answer 202 while they're being made; retry after the
+// Retry-After header. Null in mock mode, where there is nothing to render from.
+export function getSubmissionPreviewUrl(submissionId: string, variant: "thumb" | "poster" | "preview"): string | null {
+  if (shouldUseMock()) return null
+  return `${API_BASE}/submissions/${submissionId}/preview/${variant}`
+}
+
+// Fetches an authenticated download and hands it to the browser as a file.
+async function saveDownload(path: string, filename: string, init: RequestInit = {}): Promise<void> {
   if (!API_BASE) throw new Error("API base URL not configured")
-  const url = `${API_BASE}/submissions/${submissionId}/download`
 
-  const headers = new Headers()
+  const headers = new Headers(init.headers)
   const token = getToken()
   if (AUTH_MODE === "token" && token) headers.set("Authorization", `Bearer ${token}`)
 
-  const res = await fetch(url, {
-    method: "GET",
+  const res = await fetch(`${API_BASE}${path}`, {
+    ...init,
     headers,
-    credentials: AUTH_MODE === "cookie" ? "include" : "omit"
+    credentials: AUTH_MODE === "cookie" ? "include" : "omit",
   })
-
   if (!res.ok) {
     throw new Error(`Download failed: ${res.status}`)
   }
@@ -298,6 +413,35 @@ export async function downloadSubmissionFile(submissionId: string, filename: str
   URL.revokeObjectURL(downloadUrl)
 }
 
+// Bulk download: the backend streams a ZIP of the selected submissions.
+// Without formId, the archive is built from the current user's own submissions.
+export async function downloadSubmissionsArchive(params: { ids: string[]; filename: string; formId?: FormId }): Promise<void> {
+  const path = params.formId ? `/forms/${params.formId}/submissions/archive` : `/me/submissions/archive`
+  return saveDownload(path, params.filename, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ids: params.ids }),
+  })
+}
+
+export type ExportFormat = "csv" | "ndjson" | "json"
+
+// Metadata export, streamed by the backend. Columns may include flattened
+// metadata fields (width, height, duration, codec, ...); filters follow SubmissionQuery.
+export async function downloadSubmissionsExport(params: {
+  format: ExportFormat
+  filename: string
+  formId?: FormId
+  columns?: string[]
+  query?: SubmissionQuery
+}): Promise<void> {
+  const base = params.formId ? `/forms/${params.formId}/submissions/export` : `/me/submissions/export`
+  const qs = new URLSearchParams(submissionQueryString(params.query).slice(1))
+  qs.set("format", params.format)
+  if (params.columns?.length) qs.set("columns", params.columns.join(","))
+  return saveDownload(`${base}?${qs.toString()}`, params.filename)
+}
+
 // Debug Endpoints
 export async function uploadFileForDebugInfo(file: File): Promise<any> {
   if (shouldUseMock()) {
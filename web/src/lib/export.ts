@@ -36,20 +36,23 @@ export function exportToJSON<T>(filename: string, rows: T[]) {
   downloadBlob(filename, "application/json", json)
 }
 
-// Placeholders for bulk downloads until backend endpoints are ready.
 export async function downloadFile(submissionId: string, filename: string) {
   // Import dynamically to avoid circular dependency
   const { downloadSubmissionFile } = await import("./api")
   return downloadSubmissionFile(submissionId, filename)
 }
 
-export async function downloadZipPlaceholder(zipName: string, items: Array<{ filename: string; id?: string }>) {
-  const name = zipName.endsWith(".zip") ? zipName : `${zipName}.zip`
-  const manifest = {
-    info: "Placeholder ZIP manifest. Backend will generate real ZIP.",
-    count: items.length,
-    files: items.map((x) => x.filename),
-  }
-  const content = `ZIP placeholder: ${JSON.stringify(manifest, null, 2)}`
-  downloadBlob(name.replace(/\s+/g, "-").toLowerCase(), "text/plain", content)
+export async function downloadZip(zipName: string, items: Array<{ filename: string; id: string }>, formId?: string) {
+  const name = (zipName.endsWith(".zip") ? zipName : `${zipName}.zip`).replace(/\s+/g, "-").toLowerCase()
+  const { downloadSubmissionsArchive } = await import("./api")
+  return downloadSubmissionsArchive({ ids: items.map((x) => x.id), filename: name, formId })
+}
+
+// Server-side export of submission metadata; streamed by the backend instead
+// of being assembled here from the full submissions list.
+export const DEFAULT_EXPORT_COLUMNS = ["id", "filename", "status", "mimeType", "sizeBytes", "createdAt", "submittedBy", "width", "height", "duration", "codec"]
+
+export async function exportSubmissions(filename: string, format: "csv" | "ndjson" | "json", formId?: string, columns: string[] = DEFAULT_EXPORT_COLUMNS) {
+  const { downloadSubmissionsExport } = await import("./api")
+  return downloadSubmissionsExport({ format, filename, formId, columns })
 }
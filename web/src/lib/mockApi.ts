@@ -221,6 +221,15 @@ export async function uploadSubmission(params: {
   return { ok: true, submission }
 }
 
+export async function getSubmissionStatus(
+  id: SubmissionId
+): Promise<{ id: string; status: Submission["status"]; errors: string[]; submission: Submission }> {
+  const all = load<Record<SubmissionId, Submission>>(LS_KEY.submissions, {})
+  const submission = all[id]
+  if (!submission) throw new Error("Submission not found")
+  return { id, status: submission.status, errors: [], submission }
+}
+
 export async function listMySubmissions(): Promise<Submission[]> {
   const user = await getCurrentUser()
   const all = load<Record<SubmissionId, Submission>>(LS_KEY.submissions, {})
@@ -120,9 +120,23 @@ export interface Submission {
 
 export interface Paginated<T> {
   items: T[]
-  total: number
-  page: number
+  total?: number // included on the first page only
+  page?: number
   pageSize: number
+  nextCursor?: string | null // pass back as `cursor` for the next page; null on the last page
+}
+
+export interface SubmissionQuery {
+  limit?: number
+  cursor?: string
+  sort?: "createdAt" | "-createdAt" | "sizeBytes" | "-sizeBytes" | "filename" | "-filename"
+  status?: SubmissionStatus[]
+  mimeType?: string // exact type or a family like "video/*"
+  submittedBy?: UserId
+  createdFrom?: string // ISO
+  createdTo?: string // ISO
+  includeTotal?: boolean
+  fields?: Array<keyof Submission> // return only these fields per item
 }
 
 export interface ApiError {